@@ -1,2 +1,8 @@
 # 逐位点导出GT（双等位SNP过滤建议事先完成）
 bcftools query -f '%CHROM\t%POS\t%REF\t%ALT[\t%GT]\n' /home/ZhangWP/water_pine/snp_vcf/Gpen147.DBN20.recode.vcf > all147.gt.tsv
+
+
+# （可选）一次性转换为二进制基因型库，02/03 用 --gt-store all147.gtstore 代替 --gt-tsv
+python 01_gt_store.py --gt-tsv all147.gt.tsv --samples-order samples.order.txt --out all147.gtstore --chunksize 200000
+
+# （可选）也可跳过上面的文本导出：02/03 用 --vcf Gpen147.DBN20.recode.vcf.gz --threads 8 直接读取 VCF（只取 GT 子字段）
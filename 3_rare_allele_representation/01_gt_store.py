@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+01_gt_store.py
+
+把 bcftools query 导出的 all147.gt.tsv 一次性转换为二进制基因型库（目录），
+之后 02_allele_count.py / 03_ac_wac_irr.py 可用 --gt-store 代替 --gt-tsv，
+按任意行区间 / 样本子集直接 memmap 读取，不再重复解析文本。
+
+库内容（详见 gt_io.py）：
+  - gt.i8：int8 基因型矩阵（site-major，列=样本；0/1/2=ALT计数，-1=缺失）
+  - 位点索引：CHR / POS / REF / ALT 以及每条染色体的行区间
+  - samples.order.txt：样本顺序
+
+用法示例：
+  python 01_gt_store.py \
+    --gt-tsv all147.gt.tsv \
+    --samples-order samples.order.txt \
+    --out all147.gtstore \
+    --chunksize 200000
+"""
+
+import argparse
+import sys
+
+from gt_io import GTStoreWriter, TextGTSource, read_samples_order
+
+def parse_args():
+    p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--gt-tsv', required=True, help="由 bcftools query 导出的全体GT表（%%CHROM %%POS %%REF %%ALT [GT×N]）")
+    p.add_argument('--samples-order', required=True, help="VCF中的样本顺序（bcftools query -l 导出）")
+    p.add_argument('--out', default='all147.gtstore', help="输出的基因型库目录")
+    p.add_argument('--chunksize', type=int, default=200000, help="分块大小（行）")
+    p.add_argument('--sep', default='\t', help="输入文件分隔符")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+
+    samples_order = read_samples_order(args.samples_order)
+    sys.stderr.write(f"[INFO] Loaded {len(samples_order)} samples from {args.samples_order}\n")
+
+    src = TextGTSource(args.gt_tsv, samples_order, sep=args.sep)
+    writer = GTStoreWriter(args.out, samples_order)
+
+    chunk_idx = 0
+    for info, G in src.iter_chunks(args.chunksize):
+        chunk_idx += 1
+        sys.stderr.write(f"[INFO] Converting chunk #{chunk_idx}, rows={len(info)}\n")
+        writer.append(info, G)
+    writer.close(source=args.gt_tsv)
+
+    sys.stderr.write(f"[DONE] Wrote {writer.n_sites} sites x {len(samples_order)} samples to: {args.out}\n")
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ anc_admix4 / anc_Min43 / anc_Zhu17）计算每个 ALT 的：
   - AC_* / AN_*（ALT 等位总数 / 分母 = 2 * 非缺失基因型数）
   - fa_* = AC_* / AN_*（等位基因频率）
 并输出“等位元素表”（每行一个 ALT）。
+也可用 --gt-store 读取 01_gt_store.py 预先转换好的二进制基因型库（免去文本解析）。
+或用 --vcf 直接读取 Gpen147.DBN20.recode.vcf(.gz)（只取 GT 子字段；bgzip 压缩时多线程并行解压）。
 
 用法示例：
   python 02_allele_count.py \
@@ -27,23 +29,67 @@ anc_admix4 / anc_Min43 / anc_Zhu17）计算每个 ALT 的：
     --anc-zhu anc_Zhu17.list \
     --out allele_table.with_flags.tsv \
     --chunksize 200000
+
+新增谱系 / 来源群体时不必再加命令行参数：用 --groups groups.tsv（样本ID<TAB>标签[,标签...]，
+群体可重叠）。所有群体的 AC/AN/carriers 由解码后的chunk与 样本×群体 成员矩阵一次相乘得到。
+
+多核节点上可加 --workers 16：主进程读取原始chunk，子进程并行统计，按输入顺序写出。
+--out allele_table.with_flags.parquet（或 --out-format parquet）写出列式 Parquet：每个chunk一个 row group，
+计数为整数、频率为 float32；03_ac_wac_irr.py 只读取它需要的列。TSV 仍为默认 / 导出格式。
+
+断点续跑：TSV 输出时每隔 --checkpoint-interval 秒（默认 60）在chunk边界原子更新 <out>.ckpt.json（输入位置、行数、输出字节数），
+运行被杀后加 --resume 重跑同一命令即可：校验输入指纹与参数，截断残缺输出，从下一个chunk继续。
+
+区段与按染色体并行：--region chr1:1000000-2000000（可重复）只统计这些区段内的位点；
+--chrom-workers 8 每条染色体（或每个区段）一个任务并行扫描，各自写分段文件后按文件顺序合并，
+结果与顺序扫描逐字节一致。GT 表 / VCF 首次使用时自动建立旁挂索引 <输入>.gtidx.json
+（每条染色体的字节偏移 + 1 Mb 位置分箱，见 gt_index.py）；基因型库直接用自带的染色体行区间。
+
+性能记录：--metrics metrics.jsonl 逐chunk记录各阶段耗时（read / parse / decode / group_stats / assemble /
+encode / write / checkpoint）、rows/s、读入与写出字节数、常驻内存，结束时打印汇总表（见 perf_metrics.py）；
+--profile run.prof 用 cProfile 剖析主进程并保存结果。
+
+位点频率谱：--sfs-out sfs/Gpen147 在同一次扫描中累加 --sfs-groups（默认 anc cult wild，最多 3 个；
+也可以是 --groups 清单中的群体）的 1D / 2D / 3D 联合 SFS（unfolded 与 folded），--sfs-proj 给出各群体的
+投影拷贝数（超几何下采样，容纳缺失），写出 fastsimcoal2 的 *_DAFpop0.obs / *_jointMAFpop1_0.obs / *_DSFS.obs 等；
+加 --estsfs-outgroups 时另写 Est-SFS 输入（*.est_sfs.input.txt + *.est_sfs.sites.tsv），见 sfs.py。
+
+压缩输入 / 输出：--gt-tsv 可为 gzip / bgzip / zstd 压缩的 GT 表（按文件头识别）；--out 以 .tsv.gz（BGZF）
+或 .tsv.zst 结尾时压缩写出。解压与压缩都在后台线程中进行（--threads 个），与chunk统计重叠；
+压缩的 TSV 同样支持 --resume（见 compressed_io.py）。
+
+逐群体缓存：--group-cache acount_cache 把每个群体的 AC/AN/carriers 按（输入指纹、成员名单 hash）存盘；
+修改 anc_Min43.list 等名单或在 --groups 中新增群体后重跑同一命令，只用一次扫描（只解码这些群体的样本列）
+统计成员有变化的群体，其余群体直接取缓存，组装出的表与全部重算逐字节一致（见 group_cache.py）。
 """
 
 import argparse
-import sys
 import os
-import pandas as pd
-import numpy as np
+import sys
+
+from allele_stats import allele_table_chunk, build_group_cols, table_groups
+from checkpoint import CHECKPOINT_INTERVAL, ChunkCheckpoint, report_resume
+from chunk_pool import imap_chunks, map_tasks
+from group_cache import GroupCache
+from gt_index import DEFAULT_BIN_SIZE, RegionSource, tasks_from_args
+from gt_io import iter_positioned, open_gt_source
+from perf_metrics import instrumented, mark_chunk, timed
+from sfs import EstSfsInput, EstSfsWriter, SfsSpec, add_part, write_sfs
+from table_io import (TABLE_FORMATS, AlleleTableWriter, concat_allele_tables, encode_chunk, part_path,
+                      table_format)
 
 def parse_args():
     p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    p.add_argument('--gt-tsv', required=True, help="由 bcftools query 导出的全体GT表（%CHROM %POS %REF %ALT [GT×N]）")
-    p.add_argument('--samples-order', required=True, help="VCF中的样本顺序（bcftools query -l 导出）")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument('--gt-tsv', help="由 bcftools query 导出的全体GT表（%%CHROM %%POS %%REF %%ALT [GT×N]）")
+    src.add_argument('--gt-store', help="01_gt_store.py 生成的二进制基因型库（代替 --gt-tsv）")
+    src.add_argument('--vcf', help="可选：直接读取 VCF（.vcf / .vcf.gz），只取 GT 子字段；省去 bcftools query 导出")
+    p.add_argument('--samples-order', default=None, help="VCF中的样本顺序（bcftools query -l 导出；使用 --gt-store / --vcf 时可省略）")
 
-    # 必需主群
-    p.add_argument('--ancients',   required=True, help="ancients64.list")
-    p.add_argument('--cultivated', required=True, help="cult50.list")
-    p.add_argument('--wild',       required=True, help="wild33.list")
+    # 主群（必需；也可在 --groups 清单中用 anc / cult / wild 标签给出）
+    p.add_argument('--ancients',   default=None, help="ancients64.list")
+    p.add_argument('--cultivated', default=None, help="cult50.list")
+    p.add_argument('--wild',       default=None, help="wild33.list")
 
     # 可选子群：历史与自然
     p.add_argument('--anc-nat',  default=None, help="可选：自然孑遗26名单（anc_nat26.list）")
@@ -54,251 +100,279 @@ def parse_args():
     p.add_argument('--anc-min',   default=None, help="可选：古树-Minjiang（anc_Min43.list）")
     p.add_argument('--anc-zhu',   default=None, help="可选：古树-Zhujiang（anc_Zhu17.list）")
 
-    p.add_argument('--out', default='allele_table.with_flags.tsv', help="输出文件（TSV）")
+    # 任意（可重叠的）群体清单：样本 -> 一个或多个群体标签
+    p.add_argument('--groups', default=None,
+                   help="可选：群体清单 TSV（样本ID<TAB>标签[,标签...]）；每个标签输出 *_count/in_*/AC_*/AN_*/fa_* 列")
+
+    p.add_argument('--out', default='allele_table.with_flags.tsv', help="输出文件（TSV；.parquet 结尾时写列式 Parquet）")
+    p.add_argument('--out-format', choices=TABLE_FORMATS, default='auto',
+                   help="输出格式：tsv / parquet（每个chunk一个 row group，计数为整数、频率为 float32；需 pyarrow）；auto 按扩展名判断")
     p.add_argument('--chunksize', type=int, default=200000, help="分块大小（行）")
+    p.add_argument('--workers', type=int, default=1, help="并行进程数（>1 时启用进程池；输出与串行逐字节一致）")
     p.add_argument('--sep', default='\t', help="输入文件分隔符")
+    p.add_argument('--threads', type=int, default=4, help="压缩输入（bgzip 的 VCF / GT 表）并行解压与压缩输出（.tsv.gz / .tsv.zst）并行压缩的线程数")
+    p.add_argument('--resume', action='store_true',
+                   help="从断点清单（<out>.ckpt.json，仅 TSV 输出）继续上次被中断的运行：跳过已完成的chunk，截断残缺输出")
+    p.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                   help="两次保存断点之间的最短间隔（秒）；0 表示每个chunk都保存")
+    p.add_argument('--region', action='append', default=None,
+                   help="只统计该区段：chr 或 chr:start-end（1-based，闭区间）；可重复给出，按给定顺序输出")
+    p.add_argument('--chrom-workers', type=int, default=1,
+                   help="按染色体（或 --region 区段）并行的进程数；>1 时各任务写分段文件后按顺序合并（与 --workers 二选一）")
+    p.add_argument('--gt-index', default=None, help="GT 表 / VCF 的旁挂索引路径（默认 <输入>.gtidx.json，缺失或过期时自动建立）")
+    p.add_argument('--index-bin-size', type=int, default=DEFAULT_BIN_SIZE, help="建立旁挂索引时的位置分箱大小（bp）")
+    p.add_argument('--group-cache', default=None,
+                   help="可选：逐群体结果缓存目录；按输入指纹与成员名单命中缓存，只统计成员有变化 / 新增的群体（见 group_cache.py）")
+
+    # 位点频率谱（同一次扫描）
+    p.add_argument('--sfs-out', default=None,
+                   help="可选：SFS 输出前缀；写出 fastsimcoal2 .obs（1D / 2D / 3D，unfolded 与 folded）")
+    p.add_argument('--sfs-groups', nargs='+', default=['anc', 'cult', 'wild'],
+                   help="SFS 的群体（1–3 个标签；pop0、pop1、pop2 依次对应）")
+    p.add_argument('--sfs-proj', type=int, nargs='+', default=None,
+                   help="各群体投影到的拷贝数（默认 2×样本数，即只用无缺失位点）")
+    p.add_argument('--estsfs-outgroups', nargs='+', default=None,
+                   help="可选：Est-SFS 的外类群（1–3 个群体标签，如 --groups 清单中的外类群样本）；写出 Est-SFS 输入")
+    p.add_argument('--estsfs-focal', nargs='+', default=['anc', 'cult', 'wild'],
+                   help="Est-SFS 的焦点群体（多个时合并计数）")
+    p.add_argument('--estsfs-size', type=int, default=None,
+                   help="Est-SFS 焦点计数缩放到的拷贝数（默认 2×焦点样本数）")
+
+    # 性能记录 / 剖析
+    p.add_argument('--metrics', default=None,
+                   help="可选：逐chunk的分阶段耗时、rows/s、字节数与内存写入该 JSON lines 文件，结束时打印汇总表")
+    p.add_argument('--profile', default=None, help="可选：用 cProfile 剖析主进程，结果（pstats）保存到该文件")
     return p.parse_args()
 
-def read_list(path):
-    s = set()
-    if path is None:
-        return s
-    with open(path) as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                s.add(line)
-    return s
-
-def alt_count(gt: str):
+def sfs_setup(args, groups):
+    """--sfs-out 给出时返回 SfsSpec（校验群体标签与投影参数），否则 None。"""
+    if not args.sfs_out:
+        if args.estsfs_outgroups:
+            raise SystemExit("[ERROR] --estsfs-outgroups needs --sfs-out (output prefix)")
+        return None
+    known = table_groups(groups)
+    labels = args.sfs_groups + (args.estsfs_outgroups or []) + (args.estsfs_focal if args.estsfs_outgroups else [])
+    for g in labels:
+        if g not in known:
+            raise SystemExit(f"[ERROR] SFS group '{g}' has no members (known: {', '.join(known)})")
+    sizes = [2 * len(groups.cols[g]) for g in args.sfs_groups]
+    est = None
+    if args.estsfs_outgroups:
+        size = args.estsfs_size or 2 * sum(len(groups.cols[g]) for g in args.estsfs_focal)
+        est = EstSfsInput(args.estsfs_focal, args.estsfs_outgroups, size)
+    return SfsSpec(args.sfs_groups, sizes, args.sfs_proj, est)
+
+def finish_sfs(args, spec, acc, est_writer):
+    files = write_sfs(args.sfs_out, acc)
+    sys.stderr.write(f"[OK] SFS ({', '.join(f'pop{i}={g}/{m}' for i, (g, m) in enumerate(zip(acc.labels, acc.proj)))}) "
+                     f"-> {len(files)} .obs files, {args.sfs_out}.sfs_pops.tsv\n")
+    if est_writer is not None:
+        est_writer.close()
+        sys.stderr.write(f"[OK] Est-SFS input ({spec.est.size} focal copies) -> {est_writer.paths[0]} "
+                         f"(+ {est_writer.paths[1]}; {est_writer.skipped} non-SNV / uncalled sites skipped)\n")
+
+def format_chunk(chunk_idx, info, gtm, groups, fmt, sfs=None):
     """
-    将GT转换为ALT=1的等位计数：
-      0/0, 0|0 -> 0
-      0/1, 1/0, 0|1, 1|0 -> 1
-      1/1, 1|1 -> 2
-    含缺失等位（任一为 '.'）或完全缺失（'.', './.', '.|.'） -> np.nan（整个位点当缺失，不计入AN）
-    兼容单等位字符串：'0' -> 0, '1' -> 1
+    --workers 模式下在子进程中执行：计算并编码一个chunk（TSV 首块带表头），
+    返回 (行数, 编码结果, SFS 部分结果或 None)。
     """
-    if gt is None:
-        return np.nan
-    gt = str(gt).strip()
-    if gt == '' or gt == '.' or gt == './.' or gt == '.|.':
-        return np.nan
-
-    gt = gt.replace('|', '/')
-    parts = gt.split('/')
-
-    # 单等位（少见；当作haploid或异常编码）
-    if len(parts) == 1:
-        a = parts[0]
-        if a == '.':
-            return np.nan
-        return 1.0 if a == '1' else 0.0
-
-    a, b = parts[0], parts[1]
-    # 任一等位缺失 -> 整个基因型视作缺失
-    if a == '.' or b == '.':
-        return np.nan
-
-    c = 0
-    if a == '1':
-        c += 1
-    if b == '1':
-        c += 1
-    return float(c)
-
-def build_col_index(samples_order, group_set):
+    df = allele_table_chunk(info, gtm, groups)
+    return len(df), encode_chunk(df, fmt, header=(chunk_idx == 1)), (sfs.part(df) if sfs else None)
+
+def write_chunks(source, writer, groups, chunksize, ckpt=None, start=None, chunk_idx=0, tag='', sfs=None):
     """
-    给定 VCF 样本顺序（list[str]）和一个组（set[str]），
-    返回该组样本在 all147.gt.tsv 中的列索引列表（注意：前4列是 CHR POS REF ALT，从第5列开始是GT）。
+    串行：逐chunk统计并写出（可记录断点），返回累计的chunk序号。
+    sfs 为 (SfsSpec, 累加器, Est-SFS 写出器或 None)，None 表示不计算 SFS。
     """
-    sample_to_col = {s: i+4 for i, s in enumerate(samples_order)}
-    cols = []
-    missing = []
-    for s in group_set:
-        if s in sample_to_col:
-            cols.append(sample_to_col[s])
-        else:
-            missing.append(s)
-    if missing:
-        sys.stderr.write(f"[WARN] {len(missing)} IDs not found in samples.order: {missing[:5]}{' ...' if len(missing)>5 else ''}\n")
-    cols.sort()
-    return cols
-
-def group_stats(gtm_float: np.ndarray, col_idx: list[int]):
+    # 分块读取：info 为 CHR/POS/REF/ALT，gtm 为全部样本的 ALT 等位计数（int8；MISSING表示缺失）
+    for in_start, in_end, info, gtm in iter_positioned(source, chunksize, start=start):
+        chunk_idx += 1
+        sys.stderr.write(f"[INFO] {tag}Processing chunk #{chunk_idx}, rows={len(info)}\n")
+
+        if len(info):
+            df = allele_table_chunk(info, gtm, groups)
+            writer.write(df)
+            if sfs:
+                add_part(sfs[1], sfs[2], sfs[0].part(df))
+        if ckpt:
+            ckpt.commit(in_end, len(info), writer.flush, lambda: sfs_state(sfs))
+        mark_chunk(chunk_idx, len(info), 'allele_table', tag.rstrip(': '))
+    return chunk_idx
+
+def sfs_state(sfs):
+    """断点状态：SFS 累加器与 Est-SFS 输出的字节数（不计算 SFS 时为 None）。"""
+    if not sfs:
+        return None
+    est = sfs[2]
+    return {'sfs': sfs[1], 'estsfs_end': est.flush() if est else None, 'estsfs_skipped': est.skipped if est else 0}
+
+def table_task(task, ctx):
     """
-    对一个群体（列索引集合）在当前chunk计算：
-      AC = ALT等位总数
-      AN = 2 * 非缺失基因型数
-      carriers = 携带ALT的“人数”（ALT计数>0）
-    其中 gtm_float 是当前chunk的 GT 矩阵（numpy浮点数组；NaN 表示缺失），行是位点，列是样本。
-    col_idx 使用 all147.gt.tsv 的列号，从 4 起（第5列是样本1）。
+    --chrom-workers 模式下在子进程中执行：把一个染色体 / 区段写成分段文件
+    （Est-SFS 输入同样写分段文件），返回 (chunk数, SFS 累加器或 None, Est-SFS 跳过的位点数)。
     """
-    if not col_idx:
-        # 该群体未提供名单
-        nrow = gtm_float.shape[0]
-        return (np.zeros(nrow), np.zeros(nrow), np.zeros(nrow))
-
-    sub = gtm_float[:, [i-4 for i in col_idx]]  # shift，因为 gtm 从第5列开始
-    ok = ~np.isnan(sub)
-    AC = np.nansum(sub, axis=1)
-    AN = 2.0 * ok.sum(axis=1)
-    carriers = np.nansum((sub > 0).astype(float), axis=1)
-    return AC, AN, carriers
+    spec = ctx['sfs']
+    sfs = None
+    if spec:
+        sfs = (spec, spec.new(), EstSfsWriter(task['estsfs_part']) if spec.est else None)
+    with AlleleTableWriter(task['part'], ctx['fmt']) as writer:
+        n = write_chunks(RegionSource(ctx['source'], task), writer, ctx['groups'], ctx['chunksize'],
+                         tag=f"{task['label']}: ", sfs=sfs)
+    if not sfs:
+        return n, None, 0
+    if sfs[2]:
+        sfs[2].close()
+    return n, sfs[1], (sfs[2].skipped if sfs[2] else 0)
+
+def run_cached(args, source, groups, tasks, spec):
+    """--group-cache：一次扫描补齐缓存中缺失的群体，再由缓存逐块组装并写出等位元素表（与直接统计逐字节一致）。"""
+    cache = GroupCache(args.group_cache, args.gt_tsv or args.gt_store or args.vcf, source.samples, args.region)
+    labels = table_groups(groups)
+    missing = cache.missing(groups)
+    sys.stderr.write(f"[INFO] Group cache {cache.dir}: {len(labels) - len(missing)}/{len(labels)} groups cached"
+                     f"{'; computing ' + ', '.join(missing) if missing else ''}\n")
+    if missing:
+        scans = [source] if tasks is None else [RegionSource(source, t) for t in tasks]
+        cache.fill(scans, groups, missing, args.chunksize, args.workers)
+
+    sfs = (spec, spec.new(), EstSfsWriter(args.sfs_out) if spec.est else None) if spec else None
+    with AlleleTableWriter(args.out, args.out_format, threads=args.threads) as writer:
+        for chunk_idx, df in enumerate(cache.iter_tables(groups, args.chunksize), 1):
+            writer.write(df)
+            if sfs:
+                add_part(sfs[1], sfs[2], sfs[0].part(df))
+            mark_chunk(chunk_idx, len(df), 'allele_table')
+    if sfs:
+        finish_sfs(args, spec, sfs[1], sfs[2])
+    sys.stderr.write(f"[DONE] Wrote output to: {args.out}\n")
 
 def main():
     args = parse_args()
-
-    # 读取样本顺序
-    samples_order = [s.strip() for s in open(args.samples_order) if s.strip()]
+    with instrumented('02_allele_count', args.metrics, args.profile):
+        run(args)
+
+def run(args):
+    # 打开基因型源并读取样本顺序
+    source = open_gt_source(args.gt_tsv, args.gt_store, args.samples_order, sep=args.sep,
+                            vcf=args.vcf, threads=args.threads)
+    samples_order = source.samples
     n_samples = len(samples_order)
-    sys.stderr.write(f"[INFO] Loaded {n_samples} samples from {args.samples_order}\n")
-
-    # 读取各群体名单
-    anc_all = read_list(args.ancients)
-    cult    = read_list(args.cultivated)
-    wild    = read_list(args.wild)
-
-    # 可选子群
-    anc_nat   = read_list(args.anc_nat)  if args.anc_nat  else set()
-    anc_cul   = read_list(args.anc_cult) if args.anc_cult else set()
-    anc_admix = read_list(args.anc_admix) if args.anc_admix else set()
-    anc_min   = read_list(args.anc_min)   if args.anc_min   else set()
-    anc_zhu   = read_list(args.anc_zhu)   if args.anc_zhu   else set()
-
-    # 构建列索引
-    anc_cols   = build_col_index(samples_order, anc_all)
-    cult_cols  = build_col_index(samples_order, cult)
-    wild_cols  = build_col_index(samples_order, wild)
-
-    nat_cols   = build_col_index(samples_order, anc_nat)   if anc_nat   else []
-    acul_cols  = build_col_index(samples_order, anc_cul)   if anc_cul   else []
-    admix_cols = build_col_index(samples_order, anc_admix) if anc_admix else []
-    min_cols   = build_col_index(samples_order, anc_min)   if anc_min   else []
-    zhu_cols   = build_col_index(samples_order, anc_zhu)   if anc_zhu   else []
-
-    # 输入列：前4列 + 全部样本GT列
-    usecols = list(range(0, 4)) + list(range(4, 4 + n_samples))
-
-    # 分块读取
-    reader = pd.read_csv(
-        args.gt_tsv,
-        sep=args.sep,
-        header=None,
-        usecols=usecols,
-        chunksize=args.chunksize,
-        dtype=str,
-        low_memory=True
-    )
+    sys.stderr.write(f"[INFO] Loaded {n_samples} samples from {args.gt_store or args.vcf or args.samples_order}\n")
 
-    out_path = args.out
-    # 若已存在旧文件，先删
-    if os.path.exists(out_path):
-        os.remove(out_path)
-
-    chunk_idx = 0
-    for chunk in reader:
-        chunk_idx += 1
-        sys.stderr.write(f"[INFO] Processing chunk #{chunk_idx}, rows={len(chunk)}\n")
-
-        # 将 GT 列映射为 ALT=1 的等位计数（float；NaN表示缺失）
-        gtm = chunk.iloc[:, 4:].map(alt_count).to_numpy(dtype=float)
-
-        # 各群体统计
-        AC_anc,  AN_anc,  N_anc  = group_stats(gtm, anc_cols)
-        AC_cul,  AN_cul,  N_cul  = group_stats(gtm, cult_cols)
-        AC_wld,  AN_wld,  N_wld  = group_stats(gtm, wild_cols)
-
-        # 可选子群体
-        if nat_cols:
-            AC_nat, AN_nat, N_nat = group_stats(gtm, nat_cols)
-        if acul_cols:
-            AC_acul, AN_acul, N_acul = group_stats(gtm, acul_cols)
-        if admix_cols:
-            AC_admix, AN_admix, N_admix = group_stats(gtm, admix_cols)
-        if min_cols:
-            AC_min, AN_min, N_min = group_stats(gtm, min_cols)
-        if zhu_cols:
-            AC_zhu, AN_zhu, N_zhu = group_stats(gtm, zhu_cols)
-
-        # 组装输出 DataFrame
-        df = pd.DataFrame({
-            'CHR': chunk.iloc[:, 0].values,
-            'POS': chunk.iloc[:, 1].values,
-            'REF': chunk.iloc[:, 2].values,
-            'ALT': chunk.iloc[:, 3].values,
-
-            'anc_count':  N_anc,
-            'cult_count': N_cul,
-            'wild_count': N_wld,
-            'in_anc':  (N_anc  > 0).astype(int),
-            'in_cult': (N_cul  > 0).astype(int),
-            'in_wild': (N_wld  > 0).astype(int),
-
-            'AC_anc':  AC_anc,  'AN_anc':  AN_anc,
-            'AC_cult': AC_cul,  'AN_cult': AN_cul,
-            'AC_wild': AC_wld,  'AN_wild': AN_wld,
-        })
-
-        # 可选子群体输出（自然孑遗/历史栽培）
-        if nat_cols:
-            df['anc_nat_count'] = N_nat
-            df['in_anc_nat']    = (N_nat > 0).astype(int)
-            df['AC_anc_nat']    = AC_nat
-            df['AN_anc_nat']    = AN_nat
-        if acul_cols:
-            df['anc_cult_count'] = N_acul
-            df['in_anc_cult']    = (N_acul > 0).astype(int)
-            df['AC_anc_cult']    = AC_acul
-            df['AN_anc_cult']    = AN_acul
-
-        # 可选子群体输出（谱系：admix / Minjiang / Zhujiang）
-        if admix_cols:
-            df['anc_admix_count'] = N_admix
-            df['in_anc_admix']    = (N_admix > 0).astype(int)
-            df['AC_anc_admix']    = AC_admix
-            df['AN_anc_admix']    = AN_admix
-        if min_cols:
-            df['anc_min_count'] = N_min
-            df['in_anc_min']    = (N_min > 0).astype(int)
-            df['AC_anc_min']    = AC_min
-            df['AN_anc_min']    = AN_min
-        if zhu_cols:
-            df['anc_zhu_count'] = N_zhu
-            df['in_anc_zhu']    = (N_zhu > 0).astype(int)
-            df['AC_anc_zhu']    = AC_zhu
-            df['AN_anc_zhu']    = AN_zhu
-
-        # 频率列（避免除0：AN=0 -> fa=NaN）
-        base_groups = ['anc', 'cult', 'wild']
-        for g in base_groups:
-            num = df[f'AC_{g}'].astype(float)
-            den = df[f'AN_{g}'].astype(float)
-            with np.errstate(divide='ignore', invalid='ignore'):
-                df[f'fa_{g}'] = np.where(den > 0, num/den, np.nan)
-
-        # 子群体频率（若存在）
-        if nat_cols:
-            with np.errstate(divide='ignore', invalid='ignore'):
-                df['fa_anc_nat'] = np.where(df['AN_anc_nat'] > 0, df['AC_anc_nat'] / df['AN_anc_nat'], np.nan)
-        if acul_cols:
-            with np.errstate(divide='ignore', invalid='ignore'):
-                df['fa_anc_cult'] = np.where(df['AN_anc_cult'] > 0, df['AC_anc_cult'] / df['AN_anc_cult'], np.nan)
-        if admix_cols:
-            with np.errstate(divide='ignore', invalid='ignore'):
-                df['fa_anc_admix'] = np.where(df['AN_anc_admix'] > 0, df['AC_anc_admix'] / df['AN_anc_admix'], np.nan)
-        if min_cols:
-            with np.errstate(divide='ignore', invalid='ignore'):
-                df['fa_anc_min'] = np.where(df['AN_anc_min'] > 0, df['AC_anc_min'] / df['AN_anc_min'], np.nan)
-        if zhu_cols:
-            with np.errstate(divide='ignore', invalid='ignore'):
-                df['fa_anc_zhu'] = np.where(df['AN_anc_zhu'] > 0, df['AC_anc_zhu'] / df['AN_anc_zhu'], np.nan)
-
-        # 写出（首块写表头，后续追加）
-        mode = 'w' if chunk_idx == 1 else 'a'
-        header = True if chunk_idx == 1 else False
-        df.to_csv(out_path, sep='\t', index=False, mode=mode, header=header)
+    # 读取各群体名单 / 清单并构建 样本×群体 成员矩阵（可选子群未提供时不输出）
+    groups = build_group_cols(samples_order, args.ancients, args.cultivated, args.wild,
+                            anc_nat=args.anc_nat, anc_cult=args.anc_cult,
+                            anc_admix=args.anc_admix, anc_min=args.anc_min, anc_zhu=args.anc_zhu,
+                            manifest=args.groups)
 
+    out_path = args.out
+    fmt = table_format(out_path, args.out_format)
+
+    # 区段 / 染色体任务（未给 --region / --chrom-workers 时为 None：整个输入顺序扫描）
+    tasks = tasks_from_args(source, args)
+    parallel = args.chrom_workers > 1
+    if parallel and args.workers > 1:
+        raise SystemExit("[ERROR] use either --workers (chunk-parallel) or --chrom-workers (chromosome-parallel)")
+
+    # SFS / Est-SFS（--sfs-out）：主进程持有累加器与 Est-SFS 输出，各chunk的部分结果按输入顺序并入
+    spec = sfs_setup(args, groups)
+
+    # 逐群体结果缓存（--group-cache）：只统计缓存中没有的群体，整张表由缓存组装
+    if args.group_cache:
+        if parallel or args.resume:
+            raise SystemExit("[ERROR] --group-cache cannot be combined with --chrom-workers or --resume")
+        run_cached(args, source, groups, tasks, spec)
+        return
+
+    # 断点清单（TSV 输出、单次顺序扫描）：每隔 --checkpoint-interval 秒记录输入位置 / 行数 / 输出字节数
+    ckpt = None
+    if fmt == 'tsv' and not parallel and (tasks is None or len(tasks) == 1):
+        ckpt = ChunkCheckpoint(f"{out_path}.ckpt.json",
+                               {'input': args.gt_tsv or args.gt_store or args.vcf},
+                               {'chunksize': args.chunksize, 'sep': args.sep, 'samples': samples_order,
+                                'groups': groups.labels, 'group_cols': groups.cols, 'region': args.region,
+                                'sfs': spec and [args.sfs_out, spec.labels, spec.proj, args.estsfs_outgroups,
+                                                 args.estsfs_focal, spec.est and spec.est.size]},
+                               args.checkpoint_interval)
+    elif args.resume:
+        raise SystemExit("[ERROR] --resume is only supported for TSV output of a single scan "
+                         "(no --chrom-workers, at most one region)")
+
+    if parallel:
+        # 按染色体 / 区段并行：每个任务写一个分段文件，全部完成后按任务顺序合并（与顺序扫描逐字节一致）
+        parts = [part_path(out_path, i) for i in range(len(tasks))]
+        ctx = {'source': source, 'groups': groups, 'fmt': fmt, 'chunksize': args.chunksize, 'sfs': spec}
+        task_list = [dict(t, part=pp, estsfs_part=spec and part_path(args.sfs_out, i))
+                     for i, (t, pp) in enumerate(zip(tasks, parts))]
+        acc = spec.new() if spec else None
+        skipped = 0
+        for task, (n, part_acc, part_skipped) in zip(task_list, map_tasks(table_task, task_list, ctx,
+                                                                          workers=args.chrom_workers)):
+            sys.stderr.write(f"[INFO] {task['label']}: {n} chunks done\n")
+            if spec:
+                acc.merge(part_acc)
+                skipped += part_skipped
+        with timed('concat'):
+            concat_allele_tables(parts, out_path, fmt, threads=args.threads)
+        if spec:
+            est_writer = None
+            if spec.est:
+                # Est-SFS 分段文件按任务顺序拼接后删除
+                est_writer = EstSfsWriter(args.sfs_out)
+                for task in task_list:
+                    pieces = EstSfsWriter.part_paths(task['estsfs_part'])
+                    est_writer.write_files(*pieces)
+                    for pth in pieces:
+                        os.remove(pth)
+                est_writer.skipped = skipped
+            finish_sfs(args, spec, acc, est_writer)
+        sys.stderr.write(f"[DONE] Wrote output to: {out_path}\n")
+        return
+
+    # 写出器（若已存在旧文件，先删；续跑时截断到最后一个完成的chunk；TSV 首块写表头，Parquet 每个chunk一个 row group）
+    # SFS 累加器与 Est-SFS 输出同样从断点状态恢复
+    sfs = None
+    if args.resume:
+        state = ckpt.load()
+        report_resume(ckpt)
+        writer = AlleleTableWriter(out_path, fmt, resume=(ckpt.out_end, ckpt.n_chunks), threads=args.threads)
+        if spec:
+            sfs = (spec, state['sfs'] if state else spec.new(),
+                   EstSfsWriter(args.sfs_out, resume=state and state['estsfs_end']) if spec.est else None)
+            if sfs[2] and state:
+                sfs[2].skipped = state['estsfs_skipped']
+    else:
+        writer = AlleleTableWriter(out_path, fmt, threads=args.threads)
+        if ckpt:
+            ckpt.start()
+        if spec:
+            sfs = (spec, spec.new(), EstSfsWriter(args.sfs_out) if spec.est else None)
+    start = ckpt.position if args.resume else None
+    chunk_idx = ckpt.n_chunks if args.resume else 0
+    scans = [source] if tasks is None else [RegionSource(source, t) for t in tasks]
+
+    with writer:
+        for scan in scans:
+            if args.workers > 1:
+                # 并行：主进程读原始chunk（经共享内存交给子进程），子进程解析/解码/统计/编码，主进程按输入顺序写出
+                for in_start, in_end, (nrow, payload, sfs_part) in imap_chunks(
+                        scan, args.chunksize, format_chunk, args=(groups, writer.fmt, spec), workers=args.workers,
+                        start=start, first_idx=chunk_idx + 1):
+                    chunk_idx += 1
+                    sys.stderr.write(f"[INFO] Wrote chunk #{chunk_idx}, rows={nrow}\n")
+                    writer.write_encoded(payload)
+                    if sfs_part is not None:
+                        add_part(sfs[1], sfs[2], sfs_part)
+                    if ckpt:
+                        ckpt.commit(in_end, nrow, writer.flush, lambda: sfs_state(sfs))
+                    mark_chunk(chunk_idx, nrow, 'allele_table')
+            else:
+                chunk_idx = write_chunks(scan, writer, groups, args.chunksize, ckpt, start, chunk_idx, sfs=sfs)
+
+    if sfs:
+        finish_sfs(args, spec, sfs[1], sfs[2])
+    if ckpt:
+        ckpt.finish()
     sys.stderr.write(f"[DONE] Wrote output to: {out_path}\n")
 
 if __name__ == '__main__':
@@ -16,3 +16,24 @@ python 02_allele_count.py \
   --out allele_table.with_flags.tsv \
   --chunksize 200000
 
+
+# （可选）写出列式 Parquet（需 pyarrow）：把 --out 换成 allele_table.with_flags.parquet，
+# 03_ac_wac_irr.py 的 --allele-table 同样指向该文件，只读取需要的列
+
+# （可选）按染色体并行：加 --chrom-workers 8，每条染色体一个进程，写完后按文件顺序合并（与顺序扫描逐字节一致）；
+# 只统计部分区段：加 --region chr1:1000000-2000000（可重复）。GT 表首次使用时自动建立 all147.gt.tsv.gtidx.json
+
+# （可选）性能记录：加 --metrics allele_count.metrics.jsonl 逐chunk记录各阶段耗时 / rows/s / 字节数 / 内存，
+#   结束时打印汇总表；加 --profile allele_count.prof 用 cProfile 剖析（python -m pstats allele_count.prof 查看）
+
+# （可选）同一次扫描写出位点频率谱：加 --sfs-out sfs/Gpen147（默认 anc cult wild 的 1D / 2D / 3D SFS，
+#   ALT 视为衍生等位；缺失位点用 --sfs-proj 40 30 20 投影到较少拷贝数后保留），得到 fastsimcoal2 的
+#   sfs/Gpen147_DAFpop0.obs、_jointDAFpop1_0.obs、_DSFS.obs 及对应 MAF（folded）文件；
+#   再加 --estsfs-outgroups <外类群标签> 写出 Est-SFS 输入 sfs/Gpen147.est_sfs.input.txt（位点见 .est_sfs.sites.tsv）
+
+# （可选）压缩输入 / 输出：GT 表可直接导出为 bgzip 压缩（bcftools query ... | bgzip -@ 8 > all147.gt.tsv.gz），
+#   --gt-tsv all147.gt.tsv.gz 读入时按 --threads 并行解压；--out allele_table.with_flags.tsv.gz 写出 BGZF
+#   （.tsv.zst 为 zstd，需 pip install zstandard），03_ac_wac_irr.py 的 --allele-table 可直接读取
+
+# （可选）逐群体缓存：加 --group-cache acount_cache，之后修改 anc_Min43.list / anc_Zhu17.list 或在 groups.tsv 中新增群体，
+#   重跑同一命令时只统计成员有变化的群体（一次扫描、只解码这些样本列），其余群体取自缓存；不能与 --chrom-workers / --resume 同用
@@ -23,9 +23,11 @@
    - IRR_norm = IRR / Σ w（0–1）
 
 输入（最关键的列由 02_allele_count.py 产生）：
-  --allele-table allele_table.with_flags.tsv
-  --gt-tsv       all147.gt.tsv
-  --samples-order samples.order.txt
+  --allele-table allele_table.with_flags.tsv （或 02 写出的 .parquet；只读取需要的列，按 --chunksize 逐块流式读取，
+                                             内存与位点数无关；.tsv.gz / .tsv.zst 在 --threads 个后台线程中解压）
+  --gt-tsv       all147.gt.tsv      （可为 .gz / .zst；或 --gt-store all147.gtstore，见 01_gt_store.py；
+                                     或 --vcf Gpen147.DBN20.recode.vcf.gz 直接读取 VCF）
+  --samples-order samples.order.txt  （使用 --gt-store / --vcf 时可省略）
   --ancients ancients64.list
   --anc-nat anc_nat26.list        (可选)
   --anc-cult anc_cult38.list      (可选)
@@ -41,20 +43,80 @@
   --irr-coverage cult|cultwild   (默认cult)
   --chunksize 200000
   --out-prefix gpen_acwac_full
+
+单遍模式（--fused）：不需要 --allele-table，也不需要先跑 02_allele_count.py；
+只读一遍基因型，逐 chunk 算出各群体 AC/AN/carriers、fa_full、分箱与 w，
+同时累加 target×cover 的 AC/wAC 与逐古树 IRR（可用 --out-allele-table 顺带写出等位元素表，
+以 .tsv.gz / .tsv.zst 结尾时在后台线程中压缩）。
+
+置信区间（--ci bootstrap|jackknife）：扫描时按基因组区块（--block-size，默认 1 Mb）记录
+target×cover×bin 的计数 / 覆盖数 / w 之和与逐古树 IRR 的 num/den，之后只在这些小数组上做区块重抽样；
+输出 {out-prefix}.ac_wac_summary.ci.csv、{out-prefix}.irr_per_tree.ci.csv 与 {out-prefix}.blockstats.npz。
+
+参数扫描（--sweep-epsilon / --sweep-max-occ / --sweep-irr-coverage / --sweep-bins）：同一次扫描中
+按位点类别（AC_full, AN_full, anc_count, 覆盖标志）累加计数，所有参数组合的 AC/wAC 与 IRR
+写入一张长表 {out-prefix}.sweep.csv（param_set + 参数列 + kind/target/cover/bin/id + stat/value）。
+
+全组合覆盖矩阵（--coverage-matrix）：每个群体（allele table 的各 in_* 列）、群体并集（--coverage-union，
+默认 cult+wild）与可选的逐样本携带者（--coverage-samples，仅 --fused）两两之间、逐频率分箱的
+AC / wAC（出现标志压成位集，计数与 w 加权和都由 AND + popcount 得出），写入 {out-prefix}.coverage_matrix.csv。
+
+保育组合选择（--select-k K）：在 IRR 的位点上为每棵古树记录其携带的、未被 --irr-coverage 覆盖的稀有等位（位集），
+按边际 w 加权增益惰性贪心地选出至多 K 棵，逐步的增益与累计覆盖写入 {out-prefix}.selection.csv（见 conservation.py）。
+
+稀有等位共享矩阵（--sharing）：同一批稀有位点上用稀疏 位点×古树 携带矩阵计算古树两两的共享等位数与 w 加权和
+（可按频率分箱，--sharing-by-bin），写出 {out-prefix}.sharing.tsv 与 .sharing.npz（见 sharing.py）。
+
+断点续跑：每隔 --checkpoint-interval 秒（默认 60）在 GT chunk 边界原子更新 {out-prefix}.ckpt.json（输入位置、行数）及累加器状态；
+运行被杀后加 --resume 重跑同一命令，校验输入指纹与参数后从下一个chunk继续，结果与不中断时相同。
+
+区段与按染色体并行：--region chr1:1000000-2000000（可重复）只用这些区段内的位点（allele table 同样过滤）；
+--chrom-workers 8 每条染色体（或每个区段）一个任务并行扫描（两遍模式下每个任务只带自己那一段 allele table），
+各任务的 AC/wAC、IRR、区块统计量与参数扫描累加器按文件顺序合并：结果与并行进程数无关，
+与单进程扫描相比计数完全相同、w 之和只有浮点舍入级差异。GT 表 / VCF 的旁挂索引见 gt_index.py。
+
+性能记录：--metrics metrics.jsonl 逐chunk记录各阶段耗时（GT 的 read / parse / decode，allele table 的 table_read，
+site_columns / acwac / join / irr / sweep / covmat ……）、rows/s、读入字节数与常驻内存，结束时打印汇总表
+（phase 列区分 acwac / irr / fused 各遍）；--profile run.prof 用 cProfile 剖析主进程并保存结果。
 """
 
 import argparse
 import numpy as np
 import pandas as pd
 import sys
-import os
+
+from acwac import (BIN_CUTS, BIN_LABELS, AcWacAccumulator, IrrAccumulator, SiteMetaJoin, TableStream,
+                   add_site_columns)
+from allele_stats import allele_table_chunk, build_group_cols, table_groups
+from blockboot import CI_METHODS, BlockIndex, replicate_weights
+from checkpoint import CHECKPOINT_INTERVAL, ChunkCheckpoint, report_resume
+from conservation import RareAlleleSets, selection_table
+from coverage_matrix import CoverageMatrix, group_labels
+from chunk_pool import map_tasks
+from gt_index import DEFAULT_BIN_SIZE, RegionSource, region_mask, tasks_from_args
+from gt_io import iter_positioned, open_gt_source
+from perf_metrics import instrumented, mark_chunk, timed, timed_iter
+from sharing import SharingAccumulator
+from sweep import IRR_COVERAGES, SweepAccumulator, parse_bin_sets
+from table_io import (KEY_COLS, AlleleTableWriter, concat_allele_tables, iter_allele_table, part_path,
+                      table_columns, table_format)
 
 # ----------------- args -----------------
 def parse_args():
     p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    p.add_argument('--allele-table', required=True, help='allele_table.with_flags.tsv')
-    p.add_argument('--gt-tsv',       required=True, help='all147.gt.tsv (%CHROM %POS %REF %ALT [GT×N])')
-    p.add_argument('--samples-order', required=True, help='samples.order.txt')
+    p.add_argument('--allele-table', default=None,
+                   help='allele_table.with_flags.tsv or .parquet from 02_allele_count.py (not needed with --fused)')
+    p.add_argument('--fused', action='store_true',
+                   help='single genotype scan: compute the allele table, AC/wAC and per-tree IRR in one pass (no --allele-table)')
+    p.add_argument('--groups', default=None,
+                   help='with --fused: extra group manifest (sample<TAB>label[,label...]) as in 02_allele_count.py')
+    p.add_argument('--out-allele-table', default=None,
+                   help='with --fused: also write the allele table (same layout as 02_allele_count.py; .parquet for Parquet) to this path')
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument('--gt-tsv',   help='all147.gt.tsv (%%CHROM %%POS %%REF %%ALT [GT×N])')
+    src.add_argument('--gt-store', help='genotype store from 01_gt_store.py (instead of --gt-tsv)')
+    src.add_argument('--vcf',      help='VCF (.vcf/.vcf.gz) read directly for the IRR pass; only the GT subfield is used')
+    p.add_argument('--samples-order', default=None, help='samples.order.txt (optional with --gt-store / --vcf)')
 
     # groups / targets
     p.add_argument('--ancients', required=True, help='ancients64.list')
@@ -70,234 +132,533 @@ def parse_args():
     p.add_argument('--max-occ', type=int, default=2, help='anc_count ≤ max_occ defines rare-in-ancients for IRR')
     p.add_argument('--irr-coverage', choices=['cult','cultwild'], default='cult',
                    help='IRR coverage flag: "cult" uses in_cult; "cultwild" uses (in_cult OR in_wild)')
-    p.add_argument('--chunksize', type=int, default=200000, help='rows per chunk for reading GT TSV')
+    p.add_argument('--select-k', type=int, default=None,
+                   help='also write <out-prefix>.selection.csv: greedily pick up to K ancients maximising the '
+                        'w-weighted rare alleles (IRR sites) not covered under --irr-coverage, with cumulative coverage')
+    p.add_argument('--sharing', action='store_true',
+                   help='also write <out-prefix>.sharing.tsv/.npz: pairwise counts and w sums of rare alleles '
+                        '(anc_count <= max_occ) shared by every two ancients, from a sparse carrier matrix')
+    p.add_argument('--sharing-by-bin', action='store_true',
+                   help='--sharing: add one block of pairs per frequency bin to the .tsv (the .npz always has all bins)')
+    p.add_argument('--chunksize', type=int, default=200000, help='rows per chunk for reading genotypes')
+    p.add_argument('--align-check-every', type=int, default=1000,
+                   help='IRR pass: compare CHR|POS|REF|ALT of the allele table and GT rows every N rows (plus chunk ends)')
+    p.add_argument('--threads', type=int, default=4, help='threads for parallel decompression of compressed inputs (bgzipped VCF / GT table / allele table) '
+                   'and parallel compression of a .tsv.gz / .tsv.zst allele-table output')
     p.add_argument('--out-prefix', default='gpen_acwac_full', help='output prefix')
+    p.add_argument('--resume', action='store_true',
+                   help='continue an interrupted run from <out-prefix>.ckpt.json (finished chunks are skipped; '
+                        'inputs and options must be unchanged)')
+    p.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                   help='minimum seconds between two checkpoint saves (0 = after every chunk)')
+
+    # regions and chromosome-parallel scans
+    p.add_argument('--region', action='append', default=None,
+                   help='restrict AC/wAC and IRR to this region: chr or chr:start-end (1-based, inclusive); repeatable')
+    p.add_argument('--chrom-workers', type=int, default=1,
+                   help='scan chromosomes (or --region regions) in this many parallel processes; '
+                        'per-task accumulators are merged in file order')
+    p.add_argument('--gt-index', default=None,
+                   help='sidecar index for --gt-tsv / --vcf (default <input>.gtidx.json; built or refreshed automatically)')
+    p.add_argument('--index-bin-size', type=int, default=DEFAULT_BIN_SIZE,
+                   help='position bin size in bp when building the sidecar index')
+
+    # all-groups coverage matrix
+    p.add_argument('--coverage-matrix', action='store_true',
+                   help='also write <out-prefix>.coverage_matrix.csv: AC/wAC for every group (each in_* column) '
+                        'against every group, per frequency bin, from bit-packed presence flags')
+    p.add_argument('--coverage-union', nargs='*', default=['cult+wild'],
+                   help='--coverage-matrix: extra union groups used as targets and covers (labels joined by +)')
+    p.add_argument('--coverage-samples', action='store_true',
+                   help='--coverage-matrix with --fused: add every sample\'s carried alleles as a target')
+
+    # block-resampling confidence intervals
+    p.add_argument('--ci', choices=('none',) + CI_METHODS, default='none',
+                   help='confidence intervals for AC/wAC and IRR by resampling genomic blocks (bootstrap or delete-one jackknife)')
+    p.add_argument('--block-size', type=int, default=1000000, help='genomic block length in bp for --ci (blocks never span chromosomes)')
+    p.add_argument('--ci-reps', type=int, default=1000, help='bootstrap replicates for --ci bootstrap')
+    p.add_argument('--ci-level', type=float, default=0.95, help='confidence level for --ci')
+    p.add_argument('--seed', type=int, default=None, help='random seed for --ci bootstrap')
+
+    # parameter sweep: every combination is evaluated from one scan (unset lists fall back to the single options above)
+    p.add_argument('--sweep-epsilon', type=float, nargs='+', default=None, help='sweep: epsilon values')
+    p.add_argument('--sweep-max-occ', type=int, nargs='+', default=None, help='sweep: max-occ values')
+    p.add_argument('--sweep-irr-coverage', choices=IRR_COVERAGES, nargs='+', default=None, help='sweep: IRR coverage definitions')
+    p.add_argument('--sweep-bins', nargs='+', default=None,
+                   help='sweep: frequency-bin cut sets, each comma-separated and increasing (e.g. 0.005,0.01,0.05 0.01,0.05,0.1)')
+
+    # instrumentation
+    p.add_argument('--metrics', default=None,
+                   help='write per-chunk stage timings, rows/s, bytes read and RSS to this JSON-lines file '
+                        'and print a summary table at the end')
+    p.add_argument('--profile', default=None, help='profile the main process with cProfile and save the stats to this file')
     return p.parse_args()
 
 def read_list(path):
     if path is None: return []
     return [x.strip() for x in open(path) if x.strip()]
 
-# ----------------- helpers -----------------
-def bin_label_full(ac_full, fa_full):
-    if pd.notna(ac_full) and ac_full == 1:
-        return 'singleton'
-    if pd.isna(fa_full):
-        return 'NA'
-    if fa_full < 0.005:
-        return '<0.5%'
-    elif fa_full < 0.01:
-        return '0.5–1%'
-    elif fa_full < 0.05:
-        return '1–5%'
+# ----------------- main -----------------
+def irr_setup(args, samples_order):
+    """
+    古树名单、子组标注与其在 samples.order 中的列下标（IRR 只解析古树列）。
+    返回的 ancient_ids 只保留 samples.order 中存在的 ID，与 anc_col_idx 逐一对应。
+    """
+    anc_nat_ids  = set(read_list(args.anc_nat))  if args.anc_nat  else set()
+    anc_cult_ids = set(read_list(args.anc_cult)) if args.anc_cult else set()
+
+    sample_to_col = {s:i for i,s in enumerate(samples_order)}
+    listed = read_list(args.ancients)
+    ancient_ids = [s for s in listed if s in sample_to_col]
+    anc_col_idx = [sample_to_col[s] for s in ancient_ids]
+    if not anc_col_idx:
+        raise SystemExit("[ERROR] no ancient IDs found in samples.order")
+    missing = [s for s in listed if s not in sample_to_col]
+    if missing:
+        sys.stderr.write(f"[WARN] IRR: {len(missing)} ancient IDs not found in samples.order, skipped: "
+                         f"{missing[:5]}{' ...' if len(missing)>5 else ''}\n")
+    return ancient_ids, anc_nat_ids, anc_cult_ids, anc_col_idx
+
+def write_irr(args, irr_acc, anc_nat_ids, anc_cult_ids):
+    irr_df = irr_acc.table(anc_nat_ids, anc_cult_ids)
+    irr_df.to_csv(f"{args.out_prefix}.irr_per_tree.csv", index=False)
+    sys.stderr.write(f"[OK] IRR done -> {args.out_prefix}.irr_per_tree.csv (coverage base: {args.irr_coverage})\n")
+
+def write_selection(args, sets, anc_nat_ids, anc_cult_ids):
+    sel, total_w, total_n = selection_table(sets, args.select_k, anc_nat_ids, anc_cult_ids)
+    sel.to_csv(f"{args.out_prefix}.selection.csv", index=False)
+    frac = sel['cum_frac_w'].iloc[-1] if len(sel) else 0.0
+    sys.stderr.write(f"[OK] greedy selection of {len(sel)} trees covers {frac:.1%} of the weighted uncovered rare alleles "
+                     f"({total_n} alleles, w sum {total_w:.1f}) -> {args.out_prefix}.selection.csv\n")
+
+def block_ids(blocks, chr_, pos):
+    return blocks.ids(chr_, pos) if blocks is not None else None
+
+def write_ci(args, blocks, acwac_acc, irr_acc, anc_nat_ids, anc_cult_ids):
+    """由扫描中记录的逐区块统计量做区块重抽样，写出 *.ci.csv 与区块统计量缓存（*.blockstats.npz）。"""
+    n_blocks = len(blocks)
+    if n_blocks < 2:
+        sys.stderr.write(f"[WARN] --ci needs at least 2 genomic blocks, got {n_blocks}; skip (try a smaller --block-size)\n")
+        return
+    W = replicate_weights(n_blocks, args.ci_reps, args.ci, seed=args.seed)
+    acwac_acc.write_ci(args.out_prefix, n_blocks, W, args.ci, args.ci_level)
+    irr_acc.ci_table(n_blocks, W, args.ci, args.ci_level, anc_nat_ids, anc_cult_ids) \
+        .to_csv(f"{args.out_prefix}.irr_per_tree.ci.csv", index=False)
+
+    # 区块统计量本身很小；保存下来可在不重扫基因型的情况下改变重抽样设置
+    block_chr, block_start = blocks.keys()
+    arrays = {f'acwac|{t}|{c}': bs.get(n_blocks) for (t, c), bs in acwac_acc.block_stats.items()}
+    np.savez_compressed(f"{args.out_prefix}.blockstats.npz",
+                        block_chr=block_chr.astype(str), block_start=block_start,
+                        block_size=args.block_size, bins=np.array(BIN_LABELS),
+                        irr_ids=np.array(irr_acc.ids), irr_num_den=irr_acc.block_stats.get(n_blocks),
+                        **arrays)
+    sys.stderr.write(f"[OK] {args.ci} CIs over {n_blocks} blocks -> {args.out_prefix}.ac_wac_summary.ci.csv, "
+                     f"{args.out_prefix}.irr_per_tree.ci.csv\n")
+
+def sweep_setup(args, ancient_ids):
+    """任一 --sweep-* 选项给出时返回 (SweepAccumulator, 参数网格)，否则 (None, None)。"""
+    if not any([args.sweep_epsilon, args.sweep_max_occ, args.sweep_irr_coverage, args.sweep_bins]):
+        return None, None
+    grid = {
+        'epsilons':  args.sweep_epsilon or [args.epsilon],
+        'max_occs':  args.sweep_max_occ or [args.max_occ],
+        'coverages': args.sweep_irr_coverage or [args.irr_coverage],
+        'bin_sets':  parse_bin_sets(args.sweep_bins) if args.sweep_bins else [BIN_CUTS],
+    }
+    return SweepAccumulator(ancient_ids, max(grid['max_occs'])), grid
+
+def write_sweep(args, sweep, grid):
+    res = sweep.evaluate(**grid)
+    res.to_csv(f"{args.out_prefix}.sweep.csv", index=False)
+    sys.stderr.write(f"[OK] sweep of {res['param_set'].nunique()} parameter sets -> {args.out_prefix}.sweep.csv\n")
+
+def open_checkpoint(args):
+    """
+    断点清单 <out-prefix>.ckpt.json：指纹覆盖基因型输入、allele table 与各名单，参数为全部命令行选项。
+    --resume 时校验并返回 (ckpt, 保存的状态)；否则开始新的清单，状态为 None。
+    """
+    inputs = {k: getattr(args, k) for k in ('gt_tsv', 'gt_store', 'vcf', 'samples_order', 'allele_table',
+                                            'ancients', 'anc_nat', 'anc_cult', 'anc_admix', 'anc_min',
+                                            'anc_zhu', 'cultivated', 'wild', 'groups')}
+    params = {k: v for k, v in vars(args).items()
+              if k not in ('resume', 'checkpoint_interval', 'threads', 'metrics', 'profile')}
+    ckpt = ChunkCheckpoint(f"{args.out_prefix}.ckpt.json", inputs, params, args.checkpoint_interval)
+    if not args.resume:
+        ckpt.start()
+        return ckpt, None
+    state = ckpt.load()
+    report_resume(ckpt)
+    return ckpt, state
+
+def new_state(args, ancient_ids, acwac=True, cover_labels=None, samples=()):
+    """
+    一次扫描（或一个染色体任务）的累加器：AC/wAC、IRR、区块编号、参数扫描；
+    给出 cover_labels（群体标签）且 --coverage-matrix 时另加全组合覆盖矩阵。
+    """
+    state = {'irr': IrrAccumulator(ancient_ids),
+             'blocks': BlockIndex(args.block_size) if args.ci != 'none' else None,
+             'sweep': sweep_setup(args, ancient_ids)[0],
+             'select': RareAlleleSets(ancient_ids) if args.select_k else None,
+             'share': SharingAccumulator(ancient_ids) if args.sharing else None}
+    if acwac:
+        state['acwac'] = AcWacAccumulator()
+    if cover_labels is not None:
+        state['covmat'] = coverage_setup(args, cover_labels, samples)
+    return state
+
+def coverage_setup(args, labels, samples=()):
+    """--coverage-matrix 时返回 CoverageMatrix（--coverage-samples 时样本也作为 target），否则 None。"""
+    if not args.coverage_matrix:
+        return None
+    return CoverageMatrix(labels, args.coverage_union, samples if args.coverage_samples else ())
+
+def write_coverage(args, covmat):
+    res = covmat.table()
+    res.to_csv(f"{args.out_prefix}.coverage_matrix.csv", index=False)
+    sys.stderr.write(f"[OK] coverage matrix ({len(covmat.targets)} targets x {len(covmat.covers)} covers) "
+                     f"-> {args.out_prefix}.coverage_matrix.csv\n")
+
+def merge_state(state, part):
+    """把一个染色体任务的累加器并入 state（按任务顺序调用，结果与任务的完成顺序无关）。"""
+    lut = state['blocks'].merge(part['blocks']) if state['blocks'] is not None else None
+    if 'acwac' in part:
+        state['acwac'].merge(part['acwac'], lut)
+    state['irr'].merge(part['irr'], lut)
+    if state['select'] is not None:
+        state['select'].merge(part['select'])
+    if state['share'] is not None:
+        state['share'].merge(part['share'])
+    if state['sweep'] is not None:
+        state['sweep'].merge(part['sweep'])
+    if state.get('covmat') is not None:
+        state['covmat'].merge(part['covmat'])
+
+def scan_tasks(args, source):
+    """
+    --region / --chrom-workers 的任务列表（都未给出时为 None），以及是否可以记录断点
+    （只有单次顺序扫描：不按染色体并行、至多一个任务时）。
+    """
+    tasks = tasks_from_args(source, args)
+    resumable = args.chrom_workers <= 1 and (tasks is None or len(tasks) == 1)
+    return tasks, resumable
+
+def fused_scan(args, ctx, state, source, writer=None, ckpt=None, start=None, chunk_k=0, tag=''):
+    """
+    单遍扫描的逐 chunk 循环：先按 02_allele_count.py 的方式算出各群体 AC/AN/carriers，
+    随即计算 fa_full / bin / w，并同时累加 state 中的 AC/wAC、逐古树 IRR（及区块统计量 / 参数扫描）。
+    返回累计的chunk序号。
+    """
+    anc_col_idx = ctx['anc_col_idx']
+    for in_start, in_end, info, gtm in iter_positioned(source, args.chunksize, start=start):
+        chunk_k += 1
+        sys.stderr.write(f"[INFO] {tag}Fused pass, chunk {chunk_k}, rows={len(info)}\n")
+        if len(info):
+            table = allele_table_chunk(info, gtm, ctx['groups'])
+            if writer:
+                writer.write(table)
+
+            with timed('site_columns'):
+                df = add_site_columns(table, args.epsilon)
+                blk = block_ids(state['blocks'], info['CHR'], info['POS'])
+            with timed('acwac'):
+                state['acwac'].add(df, blk)
+
+            with timed('irr'):
+                rare_mask = (df['anc_count'].to_numpy() <= args.max_occ)
+                state['irr'].add(gtm[:, anc_col_idx], df['w'].to_numpy(),
+                                 df[ctx['irr_cov_flag']].to_numpy(dtype=float), rare_mask, blk)
+            if state['select'] is not None:
+                with timed('select'):
+                    state['select'].add(gtm[:, anc_col_idx], df['w'].to_numpy(),
+                                        df[ctx['irr_cov_flag']].to_numpy(dtype=float), rare_mask)
+            if state['share'] is not None:
+                with timed('sharing'):
+                    state['share'].add(gtm[:, anc_col_idx], df['w'].to_numpy(), df['bin'].to_numpy(), rare_mask)
+            if state['sweep']:
+                with timed('sweep'):
+                    state['sweep'].add_sites(df)
+                    state['sweep'].add_irr(gtm[:, anc_col_idx], df, np.ones(len(df), dtype=bool))
+            if state['covmat'] is not None:
+                with timed('covmat'):
+                    state['covmat'].add(df, gtm > 0 if state['covmat'].samples else None)
+        if ckpt:
+            ckpt.commit(in_end, len(info), writer.flush if writer else None, state)
+        mark_chunk(chunk_k, len(info), 'fused', tag.rstrip(': '))
+    return chunk_k
+
+def fused_task(task, ctx):
+    """--chrom-workers：在子进程中单遍扫描一个染色体 / 区段，返回其累加器（等位元素表写到分段文件）。"""
+    args = ctx['args']
+    state = new_state(args, ctx['ancient_ids'], cover_labels=ctx['cover_labels'], samples=ctx['source'].samples)
+    writer = AlleleTableWriter(task['part'], ctx['table_fmt']) if task['part'] else None
+    fused_scan(args, ctx, state, RegionSource(ctx['source'], task), writer, tag=f"{task['label']}: ")
+    if writer:
+        writer.close()
+    return state
+
+def run_fused(args, source):
+    """
+    单遍扫描：不需要 allele table；可按染色体 / 区段并行（各任务的累加器按任务顺序合并）。
+    """
+    samples_order = source.samples
+    groups = build_group_cols(samples_order, args.ancients, args.cultivated, args.wild,
+                            anc_nat=args.anc_nat, anc_cult=args.anc_cult,
+                            anc_admix=args.anc_admix, anc_min=args.anc_min, anc_zhu=args.anc_zhu,
+                            manifest=args.groups)
+    ancient_ids, anc_nat_ids, anc_cult_ids, anc_col_idx = irr_setup(args, samples_order)
+    irr_cov_flag = 'in_cult' if args.irr_coverage == 'cult' else 'in_cultwild'
+    _, grid = sweep_setup(args, ancient_ids)
+    cover_labels = table_groups(groups)
+    state = new_state(args, ancient_ids, cover_labels=cover_labels, samples=samples_order)
+
+    table_path = args.out_allele_table
+    table_fmt = table_format(table_path) if table_path else None
+    ctx = {'args': args, 'source': source, 'groups': groups, 'ancient_ids': ancient_ids,
+           'anc_col_idx': anc_col_idx, 'irr_cov_flag': irr_cov_flag, 'table_fmt': table_fmt,
+           'cover_labels': cover_labels}
+    tasks, resumable = scan_tasks(args, source)
+
+    # 断点：Parquet 等位元素表无法在中途续写，按染色体并行 / 多个区段时也不记录断点
+    ckpt = None
+    if resumable and table_fmt in (None, 'tsv'):
+        ckpt, saved = open_checkpoint(args)
+        if saved is not None:
+            state = saved
+    elif args.resume:
+        raise SystemExit("[ERROR] --resume with --fused needs a TSV --out-allele-table (or none), "
+                         "no --chrom-workers and at most one region")
+
+    if args.chrom_workers > 1:
+        parts = [part_path(table_path, i) if table_path else None for i in range(len(tasks))]
+        for part in map_tasks(fused_task, [dict(t, part=pp) for t, pp in zip(tasks, parts)],
+                              ctx, workers=args.chrom_workers):
+            with timed('merge'):
+                merge_state(state, part)
+        if table_path:
+            with timed('concat'):
+                concat_allele_tables(parts, table_path, table_fmt, threads=args.threads)
     else:
-        return '>5%'
-
-def alt_count(gt: str):
-    """ GT -> ALT=1 (0/1/2); any missing allele => NaN. Compatible with 0|1, 0/1, 1/1, 0/0, ./., 0/., ./0, single 0/1 """
-    if gt is None:
-        return np.nan
-    gt = str(gt).strip()
-    if gt == '' or gt == '.' or gt == './.' or gt == '.|.':
-        return np.nan
-    gt = gt.replace('|','/')
-    parts = gt.split('/')
-    if len(parts)==1:
-        a = parts[0]
-        if a == '.': return np.nan
-        return 1.0 if a=='1' else 0.0
-    a,b = parts[0], parts[1]
-    if a=='.' or b=='.': return np.nan
-    c = 0
-    if a=='1': c+=1
-    if b=='1': c+=1
-    return float(c)
+        if table_path:
+            writer = AlleleTableWriter(table_path, resume=(ckpt.out_end, ckpt.n_chunks) if args.resume else None,
+                                       threads=args.threads)
+        else:
+            writer = None
+        chunk_k = ckpt.n_chunks if args.resume else 0
+        start = ckpt.position if args.resume else None
+        for scan in ([source] if tasks is None else [RegionSource(source, t) for t in tasks]):
+            chunk_k = fused_scan(args, ctx, state, scan, writer, ckpt, start, chunk_k)
+        if writer:
+            writer.close()
+
+    acwac_acc, irr_acc, blocks = state['acwac'], state['irr'], state['blocks']
+    acwac_acc.write(args.out_prefix)
+    sys.stderr.write(f"[OK] AC/wAC done -> {args.out_prefix}.ac_wac_summary.csv + per-bin CSVs for all targets/covers\n")
+    write_irr(args, irr_acc, anc_nat_ids, anc_cult_ids)
+    if state['select'] is not None:
+        with timed('select'):
+            write_selection(args, state['select'], anc_nat_ids, anc_cult_ids)
+    if state['share'] is not None:
+        with timed('sharing'):
+            n_pairs = state['share'].write(args.out_prefix, args.sharing_by_bin)
+        sys.stderr.write(f"[OK] rare-allele sharing ({n_pairs} tree pairs) -> {args.out_prefix}.sharing.tsv "
+                         f"+ {args.out_prefix}.sharing.npz\n")
+    if blocks is not None:
+        with timed('ci'):
+            write_ci(args, blocks, acwac_acc, irr_acc, anc_nat_ids, anc_cult_ids)
+    if state['sweep']:
+        write_sweep(args, state['sweep'], grid)
+    if state['covmat'] is not None:
+        write_coverage(args, state['covmat'])
+    if table_path:
+        sys.stderr.write(f"[OK] allele table -> {table_path}\n")
+    if ckpt:
+        ckpt.finish()
+
+def irr_scan(args, ctx, state, source, join, ckpt=None, start=None, chunk_k=0, tag=''):
+    """IRR 一遍的逐 chunk 循环（只解析古树列）；返回累计的chunk序号。"""
+    irr_cov_flag = ctx['irr_cov_flag']
+
+    def commit(in_start, in_end, rows):
+        if ckpt:
+            ckpt.commit(in_end, rows, state=lambda: dict(state, join=join.state()))
+        mark_chunk(chunk_k, rows, 'irr', tag.rstrip(': '))
+
+    # 古树 ALT 计数：A 为 (nrow, n_anc) int8；MISSING<0
+    for in_start, in_end, info, A in iter_positioned(source, args.chunksize, cols=ctx['anc_col_idx'],
+                                                     start=start):
+        chunk_k += 1
+        sys.stderr.write(f"[INFO] {tag}IRR pass, chunk {chunk_k}, rows={len(info)}\n")
+        if len(info) == 0:
+            commit(in_start, in_end, 0)
+            continue
+
+        with timed('join'):
+            meta, ok_mask = join.take(info)
+        if ok_mask.sum() == 0:
+            commit(in_start, in_end, len(info))
+            continue
+
+        anc_count_v = meta['anc_count'].values
+        cover_v     = meta[irr_cov_flag].values.astype(float)  # 0/1
+        w_v         = meta['w'].values
+
+        with timed('irr'):
+            # anc_count 数值化
+            anc_count_num = pd.to_numeric(pd.Series(anc_count_v), errors='coerce').fillna(0).to_numpy()
+            rare_mask = (anc_count_num <= args.max_occ)
+
+            state['irr'].add(A, w_v, cover_v, ok_mask & rare_mask,
+                             block_ids(state['blocks'], info['CHR'], info['POS']))
+        if state['select'] is not None:
+            with timed('select'):
+                state['select'].add(A, w_v, cover_v, ok_mask & rare_mask)
+        if state['share'] is not None:
+            with timed('sharing'):
+                state['share'].add(A, w_v, meta['bin'].to_numpy(), ok_mask & rare_mask)
+        if state['sweep']:
+            with timed('sweep'):
+                state['sweep'].add_irr(A, meta, ok_mask)
+        commit(in_start, in_end, len(info))
+    return chunk_k
+
+def irr_task(task, ctx):
+    """--chrom-workers：在子进程中对一个染色体 / 区段做 IRR 一遍（流式读取该段的 allele table 行）。"""
+    args = ctx['args']
+    state = new_state(args, ctx['ancient_ids'], acwac=False)
+    join = SiteMetaJoin(table_stream(args, ctx['usecols'], [task]), ctx['join_cols'],
+                        check_every=args.align_check_every)
+    irr_scan(args, ctx, state, RegionSource(ctx['source'], task), join, tag=f"{task['label']}: ")
+    join.finish()
+    return state
+
+def table_stream(args, usecols, regions=None):
+    """
+    allele table 的流式读取（acwac.TableStream）：逐 chunk 只保留 regions（任务列表）内的行，
+    并追加 add_site_columns() 的各列；regions 为 None 时保留全部行。
+    """
+    def prepare(chunk):
+        with timed('site_columns'):
+            if regions:
+                keep = np.zeros(len(chunk), dtype=bool)
+                for t in regions:
+                    keep |= region_mask(chunk['CHR'], chunk['POS'], t['chrom'], t['beg'], t['end'])
+                chunk = chunk[keep].reset_index(drop=True)
+            return add_site_columns(chunk, args.epsilon)
+    return TableStream(lambda: timed_iter(iter_allele_table(args.allele_table, usecols, args.chunksize,
+                                                            threads=args.threads), 'table_read'),
+                       prepare)
 
-# ----------------- main -----------------
 def main():
     args = parse_args()
-    eps = args.epsilon
-
-    # 读 allele_table
-    df = pd.read_csv(args.allele_table, sep='\t',
-                     dtype={'CHR':str,'POS':str,'REF':str,'ALT':str})
+    with instrumented('03_ac_wac_irr', args.metrics, args.profile):
+        run(args)
+
+def run(args):
+    source = open_gt_source(args.gt_tsv, args.gt_store, args.samples_order,
+                            vcf=args.vcf, threads=args.threads)
+    if args.fused:
+        run_fused(args, source)
+        return
+    if not args.allele_table:
+        raise SystemExit("[ERROR] --allele-table is required unless --fused is given")
+    if args.coverage_samples:
+        raise SystemExit("[ERROR] --coverage-samples needs --fused (per-sample carriers come from the genotypes)")
+    if args.groups:
+        raise SystemExit("[ERROR] --groups needs --fused (without it the groups come from the --allele-table columns)")
+    if args.out_allele_table:
+        raise SystemExit("[ERROR] --out-allele-table needs --fused (without it the allele table is an input)")
 
     # 必要列检查（来自 02_allele_count.py）
     base_needed = ['AC_anc','AN_anc','AC_cult','AN_cult','AC_wild','AN_wild',
                    'in_anc','in_cult','in_wild','anc_count']
+    table_cols = table_columns(args.allele_table)
     for c in base_needed:
-        if c not in df.columns:
+        if c not in table_cols:
             raise SystemExit(f"[ERROR] missing column in allele_table: {c}")
 
-    # fullset 频率与权重
-    df['AC_full'] = df[['AC_anc','AC_cult','AC_wild']].sum(axis=1)
-    df['AN_full'] = df[['AN_anc','AN_cult','AN_wild']].sum(axis=1)
-    with np.errstate(divide='ignore', invalid='ignore'):
-        df['fa_full'] = np.where(df['AN_full']>0, df['AC_full']/df['AN_full'], np.nan)
-    df['bin'] = [bin_label_full(ac, f) for ac, f in zip(df['AC_full'], df['fa_full'])]
-    df['w'] = -np.log10(np.clip(df['fa_full'].fillna(0.0).values, eps, None))
-
-    # 组合出的覆盖标志
-    df['in_cultwild'] = ((df['in_cult']==1) | (df['in_wild']==1)).astype(int)
-
-    # 目标集合 S（按是否“在该集合出现过”）
-    # 基本：
-    S_defs = {'ancients64': (df['in_anc'] == 1)}
-    # 可选子群（这些列在 02_allele_count.py 新增）
-    if 'in_anc_nat' in df.columns:
-        S_defs['anc_nat26']  = (df['in_anc_nat'] == 1)
-    if 'in_anc_cult' in df.columns:
-        S_defs['anc_cult38'] = (df['in_anc_cult'] == 1)
-    if 'in_anc_admix' in df.columns:
-        S_defs['anc_admix4'] = (df['in_anc_admix'] == 1)
-    if 'in_anc_min' in df.columns:
-        S_defs['anc_Min43']  = (df['in_anc_min'] == 1)
-    if 'in_anc_zhu' in df.columns:
-        S_defs['anc_Zhu17']  = (df['in_anc_zhu'] == 1)
-    # wild33 作为 target：用 in_wild
-    S_defs['wild33'] = (df['in_wild'] == 1)
-
-    # 覆盖方定义（三种）
-    cover_defs = {
-        'covered_by_cultivated':   (df['in_cult'] == 1),
-        'covered_by_wild':         (df['in_wild'] == 1),
-        'covered_by_cultivated+wild': (df['in_cultwild'] == 1),
-    }
+    # allele_table 只取需要的列（位点键 + 全部 in_* + fullset 的 AC/AN + anc_count），逐 chunk 流式读取
+    usecols = [c for c in table_cols if c in KEY_COLS or c in base_needed or c.startswith('in_')]
 
-    # ---------- AC / wAC：输出所有要求的组合 ----------
-    out_rows = []
-    for target, mask_S in S_defs.items():
-        S = df[mask_S].copy()
-        n_AS = len(S)
-        if n_AS == 0:
-            sys.stderr.write(f"[WARN] Target {target} has 0 alleles; skip\n")
-            continue
+    # --region：AC/wAC 与 IRR 都只用区段内的位点
+    tasks, resumable = scan_tasks(args, source)
+    regions = tasks if args.region else None
 
-        for cover_name, cover_mask in cover_defs.items():
-            # 用户清单中只要求 wild33 与 covered_by_cultivated，其它 cover 可按需过滤
-            if target == 'wild33' and cover_name != 'covered_by_cultivated':
-                continue
-
-            covered = cover_mask.loc[S.index].astype(bool)
-
-            # overall
-            AC_overall  = covered.mean()
-            wAC_overall = float((S['w'] * covered).sum() / S['w'].sum()) if S['w'].sum()>0 else np.nan
-
-            # by-bin（避免 groupby.apply 警告）
-            tmp = S.assign(covered=covered.astype(float))
-            tmp['w_cov'] = tmp['w'] * tmp['covered']
-            bybin = tmp.groupby('bin', dropna=False).agg(
-                n_alleles = ('covered','size'),
-                AC        = ('covered','mean'),
-                w_sum     = ('w','sum'),
-                w_cov_sum = ('w_cov','sum')
-            ).reset_index()
-            bybin['wAC'] = bybin['w_cov_sum'] / bybin['w_sum']
-            bybin = bybin[['bin','n_alleles','AC','wAC']]
-
-            # 写每个组合的 by-bin 明细
-            bybin_path = f"{args.out_prefix}.ac_wac_bybin.{target}.{cover_name}.csv"
-            bybin.to_csv(bybin_path, index=False)
-
-            # 汇总行（overall）
-            out_rows.append({
-                'target': target,
-                'cover': cover_name,
-                'n_AS': n_AS,
-                'AC_overall': AC_overall,
-                'wAC_overall': wAC_overall
-            })
-            # 同时把分箱作为“扩展行”附加到同一个 summary CSV（便于一次读取）
-            for _, r in bybin.iterrows():
-                out_rows.append({
-                    'target': target,
-                    'cover': cover_name,
-                    'bin': r['bin'],
-                    'n_in_bin': int(r['n_alleles']),
-                    'AC_bin': float(r['AC']),
-                    'wAC_bin': float(r['wAC']),
-                })
-
-    summary_df = pd.DataFrame(out_rows)
-    summary_df.to_csv(f"{args.out_prefix}.ac_wac_summary.csv", index=False)
+    # 断点：AC/wAC 只读 allele_table，续跑时重新计算；IRR 一遍的累加器与进度从状态恢复
+    ckpt, saved = None, None
+    if resumable:
+        ckpt, saved = open_checkpoint(args)
+    elif args.resume:
+        raise SystemExit("[ERROR] --resume needs a single scan (no --chrom-workers, at most one region)")
+
+    # ---------- AC / wAC：输出所有要求的组合 ----------
+    # 逐 chunk 计算 fullset 频率、分箱、权重与组合覆盖标志并累加（内存与位点数无关）；
+    # 区块编号按首次出现的顺序分配；IRR 一遍使用同一 BlockIndex，两遍的编号一致
+    ancient_ids, anc_nat_ids, anc_cult_ids, anc_col_idx = irr_setup(args, source.samples)
+    state = saved if saved is not None else new_state(args, ancient_ids, acwac=False)
+    blocks = state['blocks']
+    acwac_acc = AcWacAccumulator()
+    covmat = coverage_setup(args, group_labels(usecols))
+    for k, chunk in enumerate(table_stream(args, usecols, regions), 1):
+        with timed('acwac'):
+            acwac_acc.add(chunk, block_ids(blocks, chunk['CHR'], chunk['POS']))
+        if state['sweep'] and saved is None:
+            with timed('sweep'):
+                state['sweep'].add_sites(chunk)
+        if covmat is not None:
+            with timed('covmat'):
+                covmat.add(chunk)
+        mark_chunk(k, len(chunk), 'acwac')
+    acwac_acc.write(args.out_prefix)
     sys.stderr.write(f"[OK] AC/wAC done -> {args.out_prefix}.ac_wac_summary.csv + per-bin CSVs for all targets/covers\n")
+    if covmat is not None:
+        write_coverage(args, covmat)
 
     # ---------- IRR_allele（逐古树；coverage 口径可切换） ----------
     # IRR 只针对古树（ancients64.list）逐个体计算；wild33 不参与 IRR。
     irr_cov_flag = 'in_cult' if args.irr_coverage == 'cult' else 'in_cultwild'
-
-    # 准备 meta：key -> anc_count, fa_full, cover_flag, w
-    meta_df = df[['CHR','POS','REF','ALT','anc_count',irr_cov_flag,'w']].copy()
-    for c in ['CHR','POS','REF','ALT']:
-        meta_df[c] = meta_df[c].astype(str)
-    meta_df['key'] = meta_df['CHR']+'|'+meta_df['POS']+'|'+meta_df['REF']+'|'+meta_df['ALT']
-    meta_df = meta_df.set_index('key')
-
-    ancient_ids = read_list(args.ancients)
-    anc_nat_ids  = set(read_list(args.anc_nat))  if args.anc_nat  else set()
-    anc_cult_ids = set(read_list(args.anc_cult)) if args.anc_cult else set()
-
-    # 只解析古树列
-    samples_order = [s.strip() for s in open(args.samples_order) if s.strip()]
-    sample_to_col = {s:i+4 for i,s in enumerate(samples_order)}
-    anc_col_idx = [sample_to_col[s] for s in ancient_ids if s in sample_to_col]
-    if not anc_col_idx:
-        raise SystemExit("[ERROR] no ancient IDs found in samples.order")
-
-    accum = {tid: {'num':0.0, 'den':0.0} for tid in ancient_ids}
-
-    usecols = list(range(0, 4)) + list(range(4, 4+len(samples_order)))
-    reader = pd.read_csv(args.gt_tsv, sep='\t', header=None, usecols=usecols,
-                         dtype=str, chunksize=args.chunksize, low_memory=True)
-
-    chunk_k = 0
-    for chunk in reader:
-        chunk_k += 1
-        sys.stderr.write(f"[INFO] IRR pass, chunk {chunk_k}, rows={len(chunk)}\n")
-
-        # 古树 ALT 计数
-        A = chunk.iloc[:, anc_col_idx].map(alt_count).to_numpy(dtype=float)  # (nrow, n_anc)
-        keys = (chunk.iloc[:,0].astype(str)+'|'+chunk.iloc[:,1].astype(str)+'|'
-                +chunk.iloc[:,2].astype(str)+'|'+chunk.iloc[:,3].astype(str)).values
-
-        meta = meta_df.reindex(keys)
-        ok_mask = meta['w'].notna().values
-        if ok_mask.sum() == 0:
-            continue
-
-        anc_count_v = meta['anc_count'].values
-        cover_v     = meta[irr_cov_flag].values.astype(float)  # 0/1
-        w_v         = meta['w'].values
-
-        # anc_count 数值化
-        anc_count_num = pd.to_numeric(pd.Series(anc_count_v), errors='coerce').fillna(0).to_numpy()
-        rare_mask = (anc_count_num <= args.max_occ)
-
-        for j, tid in enumerate(ancient_ids):
-            carr = A[:, j] > 0
-            mask = carr & ok_mask & rare_mask
-            if not np.any(mask):
-                continue
-            w_sel = w_v[mask]
-            c_sel = cover_v[mask]  # 0/1
-            accum[tid]['num'] += float((w_sel * (1.0 - c_sel)).sum())
-            accum[tid]['den'] += float(w_sel.sum())
-
-    rows = []
-    for tid in ancient_ids:
-        num = accum[tid]['num']
-        den = accum[tid]['den']
-        irr = num
-        irr_norm = (num/den) if den > 0 else np.nan
-        # 标注子组（便于后续分组可视化）
-        grp = 'anc_nat26' if tid in anc_nat_ids else ('anc_cult38' if tid in anc_cult_ids else 'anc_other')
-        rows.append({'id': tid, 'group': grp, 'IRR': irr, 'IRR_norm01': irr_norm})
-
-    irr_df = pd.DataFrame(rows).sort_values(['group','IRR_norm01'], ascending=[True, False])
-    irr_df.to_csv(f"{args.out_prefix}.irr_per_tree.csv", index=False)
-    sys.stderr.write(f"[OK] IRR done -> {args.out_prefix}.irr_per_tree.csv (coverage base: {args.irr_coverage})\n")
+    _, grid = sweep_setup(args, ancient_ids)
+
+    # allele_table 与 GT 同源同序：按行号对齐（抽样校验键，错位时才回退到键连接）
+    join_cols = ['anc_count', irr_cov_flag, 'w'] + (['bin'] if args.sharing else [])
+    if state['sweep']:
+        join_cols += [c for c in ('AC_full', 'AN_full', 'in_cult', 'in_cultwild') if c not in join_cols]
+    ctx = {'args': args, 'source': source, 'ancient_ids': ancient_ids, 'anc_col_idx': anc_col_idx,
+           'irr_cov_flag': irr_cov_flag, 'join_cols': join_cols, 'usecols': usecols}
+
+    if args.chrom_workers > 1:
+        # 每个任务只读取自己那一段 allele table；各任务的累加器按任务顺序并入
+        for part in map_tasks(irr_task, tasks, ctx, workers=args.chrom_workers):
+            with timed('merge'):
+                merge_state(state, part)
+    else:
+        chunk_k = ckpt.n_chunks if ckpt else 0
+        for scan in ([source] if tasks is None else [RegionSource(source, t) for t in tasks]):
+            table = table_stream(args, usecols, None if tasks is None else [scan.task])
+            join = SiteMetaJoin(table, join_cols, check_every=args.align_check_every)
+            if saved is not None:
+                join.restore(saved['join'])
+            chunk_k = irr_scan(args, ctx, state, scan, join, ckpt,
+                               ckpt.position if args.resume else None, chunk_k)
+            join.finish()
+
+    irr_acc = state['irr']
+    write_irr(args, irr_acc, anc_nat_ids, anc_cult_ids)
+    if state['select'] is not None:
+        with timed('select'):
+            write_selection(args, state['select'], anc_nat_ids, anc_cult_ids)
+    if state['share'] is not None:
+        with timed('sharing'):
+            n_pairs = state['share'].write(args.out_prefix, args.sharing_by_bin)
+        sys.stderr.write(f"[OK] rare-allele sharing ({n_pairs} tree pairs) -> {args.out_prefix}.sharing.tsv "
+                         f"+ {args.out_prefix}.sharing.npz\n")
+    if blocks is not None:
+        with timed('ci'):
+            write_ci(args, blocks, acwac_acc, irr_acc, anc_nat_ids, anc_cult_ids)
+    if state['sweep']:
+        write_sweep(args, state['sweep'], grid)
+    if ckpt:
+        ckpt.finish()
 
 if __name__ == '__main__':
     main()
-
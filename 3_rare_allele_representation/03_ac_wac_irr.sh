@@ -15,3 +15,52 @@ python 03_ac_wac_irr.py \
   --irr-coverage cult \
   --out-prefix gpen_acwac_full
 
+
+
+# 单遍模式：不需要先跑 02_allele_count.py，只读一遍基因型（可选顺带写出等位元素表）
+#python 03_ac_wac_irr.py \
+#  --fused \
+#  --gt-tsv all147.gt.tsv \
+#  --samples-order samples.order.txt \
+#  --ancients ancients64.list \
+#  --anc-nat anc_nat26.list \
+#  --anc-cult anc_cult38.list \
+#  --anc-admix anc_admix4.list \
+#  --anc-min anc_Min43.list \
+#  --anc-zhu anc_Zhu17.list \
+#  --cultivated cult50.list \
+#  --wild wild33.list \
+#  --epsilon 1e-3 \
+#  --max-occ 2 \
+#  --irr-coverage cult \
+#  --out-allele-table allele_table.with_flags.tsv \
+#  --out-prefix gpen_acwac_full
+
+# 置信区间：上面任一命令加 --ci bootstrap --ci-reps 2000 --block-size 1000000 --seed 1
+# （或 --ci jackknife），另写出 *.ac_wac_summary.ci.csv / *.irr_per_tree.ci.csv / *.blockstats.npz
+
+# 参数扫描：一次扫描评估所有组合，结果写入 *.sweep.csv（长表，按 param_set 区分）
+#   --sweep-epsilon 1e-3 1e-4 --sweep-max-occ 1 2 3 --sweep-irr-coverage cult cultwild \
+#   --sweep-bins 0.005,0.01,0.05 0.01,0.05,0.1
+
+# 区段 / 按染色体并行：--region chr1:1000000-2000000（可重复）只用区段内位点；
+#   --chrom-workers 8 每条染色体一个进程，各任务的累加器按文件顺序合并
+
+# 全组合覆盖矩阵：加 --coverage-matrix（可选 --coverage-union cult+wild anc_nat+anc_cult；
+#   --fused 时加 --coverage-samples 把每个样本携带的等位也作为 target），写出 *.coverage_matrix.csv
+
+# 性能基准（模拟数据，不需要真实 GT 表）：结果追加到 bench_results.jsonl，按版本标签比较
+#python simulate_gt.py --n-sites 1000000 --n-samples 147 --out-dir sim_1M --seed 1
+#python benchmark.py --sites 100000 1000000 --chunksizes 50000 200000 --stages store 02 02-store 03 03-fused --repeat 3
+#python benchmark.py --report --baseline <旧版本标签>
+
+# 性能记录 / 剖析：加 --metrics acwac.metrics.jsonl（逐chunk分阶段耗时，结束时打印汇总表）、--profile acwac.prof
+
+# 保育组合：加 --select-k 20，按边际 w 加权增益惰性贪心地选出 20 棵古树（口径同 IRR：anc_count ≤ --max-occ、
+#   未被 --irr-coverage 覆盖），逐步增益与累计覆盖比例写入 gpen_acwac_full.selection.csv
+
+# 稀有等位共享：加 --sharing（--sharing-by-bin 按频率分箱）写出古树两两共享的稀有等位数 / w 之和
+#   gpen_acwac_full.sharing.tsv（含 Jaccard，可直接用于聚类、查找冗余 / 克隆材料）与 .sharing.npz（稠密矩阵）
+
+# 压缩输入 / 输出：--allele-table / --gt-tsv 可为 .gz（bgzip）/ .zst，--out-allele-table 以 .tsv.gz 结尾时压缩写出；
+#   解压与压缩在 --threads 个后台线程中进行，与chunk计算重叠
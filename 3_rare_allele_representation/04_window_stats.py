@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+04_window_stats.py
+
+由 02_allele_count.py 的等位元素表（各群体 AC_* / AN_*）计算窗口化的
+  π（各群体）、dxy 与 Hudson Fst（各群体对），输出与 pixy 相同的
+  {out-prefix}_pi.txt / {out-prefix}_dxy.txt / {out-prefix}_fst.txt，
+代替对每条染色体、每种群体组合重复运行 pixy（每次都重新读取并解析 VCF）。
+只读取需要的列，按 --chunksize 逐块流式累加（窗口之和由逐列累积和得到），内存与位点数无关。
+
+用法示例：
+  python 04_window_stats.py \
+    --allele-table allele_table.with_flags.tsv \
+    --pops anc cult wild \
+    --window-size 200000 \
+    --out-prefix pixy_Gpen147
+
+  群体为等位元素表中的任意群体标签（anc / cult / wild、nat / acult 或 --groups 清单中的谱系）；
+  --bed-file windows.bed 按 BED 给出的窗口（可不等长）代替固定窗口；
+  不变位点：对 all-sites 基因型表运行 01 / 02 后，表中的 AC=0 行计入比较数（同 pixy 的 all-sites VCF）。
+统计口径见 window_stats.py。
+"""
+
+import argparse
+import sys
+
+from perf_metrics import instrumented, mark_chunk, timed_iter
+from table_io import iter_allele_table, table_columns
+from window_stats import WindowAccumulator, read_bed_windows, write_pixy_tables
+
+STATS = ('pi', 'dxy', 'fst')
+
+def parse_args():
+    p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--allele-table', required=True, help="02_allele_count.py 输出的等位元素表（.tsv 或 .parquet）")
+    p.add_argument('--pops', nargs='+', default=['anc', 'cult', 'wild'],
+                   help="群体标签（表中需有 AC_<标签> / AN_<标签> 列）；dxy / Fst 对所有两两组合计算")
+    win = p.add_mutually_exclusive_group()
+    win.add_argument('--window-size', type=int, default=200000, help="固定窗口长度（bp）")
+    win.add_argument('--bed-file', default=None, help="可选：BED 窗口（chrom start end，0-based 半开区间），代替固定窗口")
+    p.add_argument('--stats', nargs='+', choices=STATS, default=list(STATS), help="输出哪些统计量")
+    p.add_argument('--out-prefix', required=True, help="输出前缀：<prefix>_pi.txt / _dxy.txt / _fst.txt")
+    p.add_argument('--chunksize', type=int, default=200000, help="每次读入的行数")
+
+    # 性能记录 / 剖析
+    p.add_argument('--metrics', default=None,
+                   help="可选：逐chunk的分阶段耗时、rows/s、字节数与内存写入该 JSON lines 文件，结束时打印汇总表")
+    p.add_argument('--profile', default=None, help="可选：用 cProfile 剖析主进程，结果（pstats）保存到该文件")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    with instrumented('04_window_stats', args.metrics, args.profile):
+        run(args)
+
+def run(args):
+    if len(set(args.pops)) != len(args.pops):
+        raise SystemExit("[ERROR] --pops contains duplicates")
+    if args.window_size is not None and args.window_size <= 0 and args.bed_file is None:
+        raise SystemExit("[ERROR] --window-size must be positive")
+
+    have = set(table_columns(args.allele_table))
+    missing = [c for g in args.pops for c in (f"AC_{g}", f"AN_{g}") if c not in have]
+    if missing:
+        raise SystemExit(f"[ERROR] allele table lacks columns: {', '.join(missing)}")
+
+    if args.bed_file:
+        bed = read_bed_windows(args.bed_file)
+        acc = WindowAccumulator(args.pops, bed=bed)
+        sys.stderr.write(f"[INFO] {sum(len(s) for s, _ in bed.values())} BED windows on {len(bed)} chromosomes\n")
+    else:
+        acc = WindowAccumulator(args.pops, window_size=args.window_size)
+    if len(args.pops) < 2 and ({'dxy', 'fst'} & set(args.stats)):
+        sys.stderr.write("[WARN] dxy / fst need at least two --pops; only pi is written\n")
+
+    n_rows = 0
+    chunks = timed_iter(iter_allele_table(args.allele_table, acc.columns(), args.chunksize), 'table_read')
+    for chunk_idx, df in enumerate(chunks, 1):
+        sys.stderr.write(f"[INFO] Processing chunk #{chunk_idx}, rows={len(df)}\n")
+        acc.add(df)
+        n_rows += len(df)
+        mark_chunk(chunk_idx, len(df), 'windows')
+
+    paths = write_pixy_tables(args.out_prefix, acc, args.stats)
+    sys.stderr.write(f"[OK] {n_rows} sites, max AN per pop: "
+                     f"{', '.join(f'{g}={int(n)}' for g, n in zip(acc.pops, acc.max_an))}\n")
+    for path in paths:
+        sys.stderr.write(f"[DONE] Wrote output to: {path}\n")
+
+if __name__ == '__main__':
+    main()
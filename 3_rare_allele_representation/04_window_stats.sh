@@ -0,0 +1,20 @@
+python 04_window_stats.py \
+  --allele-table allele_table.with_flags.tsv \
+  --pops anc cult wild \
+  --window-size 200000 \
+  --out-prefix pixy_Gpen147
+
+
+
+# 代替 2_genetic_diversity_load/1pixy.sh（逐染色体 pi）与 1_population_genetics/4fst_dxy.sh（谱系间 pi / fst / dxy）：
+# 输出 pixy_Gpen147_pi.txt / _dxy.txt / _fst.txt，列与 pixy 相同，下游作图脚本可直接使用
+
+# 谱系比较：群体换成 --groups 清单中的谱系标签（02_allele_count.py 的 AC_<标签> / AN_<标签> 列）
+#python 04_window_stats.py \
+#  --allele-table allele_table.with_flags.tsv \
+#  --pops min zhu admix \
+#  --window-size 200000 \
+#  --out-prefix pixy_Gpen66_3lineage
+
+# （可选）不等长窗口：--bed-file windows.bed 代替 --window-size；
+# 不变位点：对 all-sites 基因型表运行 01 / 02，表中的 AC=0 行计入比较数（与 pixy 的 all-sites VCF 一致）
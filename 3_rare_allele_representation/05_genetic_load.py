@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+05_genetic_load.py
+
+逐个体遗传负荷：对每个样本、每个后果类别统计衍生杂合 / 衍生纯合等位数，输出一张长表。
+代替 2_genetic_diversity_load/5genetic_load/extract_derived_and_four_genetic_variation.sh
+（逐个体 vcftools 抽取 + 十几次 grep 0/1、1/1、synonymous_variant、stop_gained …… + sort | uniq，
+147 棵树即数百次全文件扫描）：这里只读一遍基因型（与 02_allele_count.py 相同的 --gt-tsv / --vcf；
+基因型库 --gt-store 只存 ALT 计数，分不出 2/2 与单倍体调用，因此不支持），
+每个chunk按 (CHR, POS) 连接逐位点注释，全部样本 × 全部类别一次矩阵乘得到计数。
+
+用法示例：
+  python 05_genetic_load.py \
+    --gt-tsv all147.gt.tsv \
+    --samples-order samples.order.txt \
+    --annotation Gpen147.cds.annotation.tsv \
+    --ref-ancestor allele_REF_is_ancestor.txt \
+    --alt-ancestor allele_ALT_is_ancestor.txt \
+    --out Gpen147.genetic_load.tsv
+
+输出（每个 样本 × 类别 一行）：sample, class, n_sites, n_called, het, hom_derived, derived_alleles
+  类别：synonymous / missense / lof（start_lost、stop_gained、stop_lost），注释表有 SIFT 分数列时另有
+  deleterious / tolerated（missense 中 SIFT < / ≥ --sift-cutoff）；--class name=term,... 可追加类别。
+  注释表格式与祖先等位的确定见 genetic_load.py。
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from chunk_pool import imap_chunks
+from genetic_load import DEFAULT_CLASSES, LoadAnnotation, load_counts, load_table, parse_class_defs
+from gt_codec import diploid_code
+from gt_io import iter_positioned, open_gt_source
+from perf_metrics import instrumented, mark_chunk, timed
+
+def parse_args():
+    p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument('--gt-tsv', help="由 bcftools query 导出的全体GT表（%%CHROM %%POS %%REF %%ALT [GT×N]）")
+    src.add_argument('--vcf', help="可选：直接读取 VCF（.vcf / .vcf.gz），只取 GT 子字段")
+    p.add_argument('--samples-order', default=None, help="VCF中的样本顺序（使用 --vcf 时可省略）")
+
+    # 逐位点注释与祖先等位
+    p.add_argument('--annotation', required=True,
+                   help="逐位点注释表（TSV，带表头：CHR/CHROM、POS、后果列，可选 REF/ALT、SIFT 分数与祖先等位列）")
+    p.add_argument('--consequence-col', default='consequence', help="注释表中的后果列（如 SIFT4G 的 VARIANT_TYPE）")
+    p.add_argument('--sift-col', default='SIFT_SCORE', help="注释表中的 SIFT 分数列（不存在时不输出 deleterious / tolerated）")
+    p.add_argument('--sift-cutoff', type=float, default=0.05, help="SIFT < 该值的 missense 记为 deleterious")
+    p.add_argument('--ref-ancestor', default=None, help="REF 为祖先等位的位点清单（allele_REF_is_ancestor.txt：CHROM<TAB>POS）")
+    p.add_argument('--alt-ancestor', default=None, help="ALT 为祖先等位的位点清单（allele_ALT_is_ancestor.txt）")
+    p.add_argument('--ancestral-col', default=None, help="可选：注释表中的祖先等位（碱基）列，代替 / 补充上面两个清单")
+    p.add_argument('--class', dest='classes', action='append', default=None,
+                   help="追加类别：name=后果词[,后果词...]（可重复），如 splice=splice_donor_variant,splice_acceptor_variant")
+
+    p.add_argument('--out', default='genetic_load.tsv', help="输出长表（TSV）")
+    p.add_argument('--chunksize', type=int, default=200000, help="分块大小（行）")
+    p.add_argument('--workers', type=int, default=1, help="并行进程数（>1 时启用进程池；结果与串行一致）")
+    p.add_argument('--sep', default='\t', help="输入文件分隔符")
+    p.add_argument('--threads', type=int, default=4, help="读取 bgzip 压缩 VCF 时并行解压的线程数")
+
+    # 性能记录 / 剖析
+    p.add_argument('--metrics', default=None,
+                   help="可选：逐chunk的分阶段耗时、rows/s、字节数与内存写入该 JSON lines 文件，结束时打印汇总表")
+    p.add_argument('--profile', default=None, help="可选：用 cProfile 剖析主进程，结果（pstats）保存到该文件")
+    return p.parse_args()
+
+def count_chunk(chunk_idx, info, gtm, ann):
+    """--workers 模式下在子进程中执行：一个chunk的 (行数, 计数或 None)。"""
+    return len(info), load_counts(info, gtm, ann)
+
+def main():
+    args = parse_args()
+    with instrumented('05_genetic_load', args.metrics, args.profile):
+        run(args)
+
+def run(args):
+    # 只计二倍体、等位为 0/1 的调用（同原脚本只数 0/1、1/1、0/0）
+    source = open_gt_source(args.gt_tsv, None, args.samples_order, sep=args.sep,
+                            vcf=args.vcf, threads=args.threads, code=diploid_code)
+    samples = source.samples
+    sys.stderr.write(f"[INFO] Loaded {len(samples)} samples from {args.vcf or args.samples_order}\n")
+
+    classes = dict(DEFAULT_CLASSES)
+    classes.update(parse_class_defs(args.classes))
+    with timed('annotation'):
+        ann = LoadAnnotation(args.annotation, classes, consequence_col=args.consequence_col, sift_col=args.sift_col,
+                             sift_cutoff=args.sift_cutoff, ancestral_col=args.ancestral_col,
+                             ref_ancestor=args.ref_ancestor, alt_ancestor=args.alt_ancestor)
+    sys.stderr.write(f"[INFO] {len(ann)} annotated, polarized sites in classes {', '.join(ann.classes)} "
+                     f"({ann.n_unpolarized} classified sites without ancestral allele skipped)\n")
+    if not len(ann):
+        raise SystemExit("[ERROR] no annotated site has both a class and an ancestral allele")
+
+    totals = np.zeros((len(ann.classes), 4, len(samples)), dtype=np.int64)
+    if args.workers > 1:
+        chunks = ((nrow, res) for _, _, (nrow, res) in
+                  imap_chunks(source, args.chunksize, count_chunk, args=(ann,), workers=args.workers))
+    else:
+        chunks = ((len(info), load_counts(info, gtm, ann)) for _, _, info, gtm in iter_positioned(source, args.chunksize))
+    for chunk_idx, (nrow, res) in enumerate(chunks, 1):
+        sys.stderr.write(f"[INFO] Processing chunk #{chunk_idx}, rows={nrow}\n")
+        if res is not None:
+            totals += res
+        mark_chunk(chunk_idx, nrow, 'load')
+
+    out = load_table(totals, ann.classes, samples)
+    out.to_csv(args.out, sep='\t', index=False)
+    matched = totals[:, 0, 0].max() if len(samples) else 0
+    sys.stderr.write(f"[OK] {matched} annotated sites matched in the genotype table (largest class)\n")
+    sys.stderr.write(f"[DONE] Wrote output to: {args.out}\n")
+
+if __name__ == '__main__':
+    main()
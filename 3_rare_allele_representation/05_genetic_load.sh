@@ -0,0 +1,18 @@
+python 05_genetic_load.py \
+  --gt-tsv all147.gt.tsv \
+  --samples-order samples.order.txt \
+  --annotation Gpen147.cds.annotation.tsv \
+  --ref-ancestor allele_REF_is_ancestor.txt \
+  --alt-ancestor allele_ALT_is_ancestor.txt \
+  --out Gpen147.genetic_load.tsv
+
+
+
+# 代替 2_genetic_diversity_load/5genetic_load/extract_derived_and_four_genetic_variation.sh 的逐个体循环：
+# 只读一遍基因型，输出 Gpen147.genetic_load.tsv（sample, class, n_sites, n_called, het, hom_derived, derived_alleles）
+
+# 注释表：每个位点（或每个转录本）一行，至少含 CHR（或 CHROM）、POS 与后果列（默认 consequence）；
+# 直接用 SIFT4G 的 *_SIFTannotations.xls 时加 --consequence-col VARIANT_TYPE（SIFT_SCORE 列自动识别，
+# 多转录本合并、SIFT 取最小值），得到 synonymous / missense / lof / deleterious / tolerated
+
+# （可选）多核：加 --workers 8；也可用 --vcf Gpen147.DBN20.recode.vcf.gz 直接读取 VCF（不支持 --gt-store：库中只有 ALT 计数）
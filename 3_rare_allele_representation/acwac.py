@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+acwac.py
+
+03_ac_wac_irr.py 的 AC/wAC 与 IRR 计算部件；均可逐 chunk 累加（--fused 单遍扫描时使用）：
+  - add_site_columns()：fullset 频率 AC_full/AN_full/fa_full、分箱 bin、权重 w、in_cultwild
+  - target_defs() / cover_defs()：目标集合（targets）与覆盖方式（covers）
+  - AcWacAccumulator：target×cover×bin 的 AC / wAC（每个单元只累加计数与精确的 w 之和，内存与位点数无关）
+  - IrrAccumulator：逐古树 IRR 的分子 Σ w*(1-cover) 与分母 Σ w（所有古树一次矩阵乘法）
+  - 传入区块编号（blockboot.BlockIndex）时，两个累加器还按基因组区块记录同样的统计量，供 --bootstrap 求置信区间
+  - 两个累加器都可 merge()：按染色体并行（--chrom-workers）时把各任务的结果按任务顺序并入
+  - SiteMetaJoin：把 GT chunk 与 allele_table 的逐位点列对齐（按行号，抽样校验，必要时回退到键连接）；
+    allele_table 可用 TableStream 流式读取，两遍模式不必把整张表读入内存
+"""
+
+import math
+import sys
+
+import numpy as np
+import pandas as pd
+
+from blockboot import BlockSums, interval, ratio_reps
+
+# 分箱标签（累加器数组的下标顺序）；输出时与 groupby('bin') 一样按标签字符串排序
+BIN_LABELS = ['singleton', '<0.5%', '0.5–1%', '1–5%', '>5%', 'NA']
+
+def bin_label_full(ac_full, fa_full):
+    if pd.notna(ac_full) and ac_full == 1:
+        return 'singleton'
+    if pd.isna(fa_full):
+        return 'NA'
+    if fa_full < 0.005:
+        return '<0.5%'
+    elif fa_full < 0.01:
+        return '0.5–1%'
+    elif fa_full < 0.05:
+        return '1–5%'
+    else:
+        return '>5%'
+
+# bin_label_full() 的频率切点
+BIN_CUTS = (0.005, 0.01, 0.05)
+
+def _pct(x):
+    return f"{x*100:g}"
+
+def cut_labels(cuts=BIN_CUTS):
+    """切点 c1<c2<...<ck 对应的频率分箱标签：'<c1%'、'c1–c2%'、...、'>ck%'（默认切点即 BIN_LABELS 中的标签）。"""
+    cuts = list(cuts)
+    return ([f"<{_pct(cuts[0])}%"]
+            + [f"{_pct(a)}–{_pct(b)}%" for a, b in zip(cuts[:-1], cuts[1:])]
+            + [f">{_pct(cuts[-1])}%"])
+
+def bin_labels(ac_full, fa_full, cuts=BIN_CUTS):
+    """bin_label_full() 的向量化版本（默认切点时结果逐位点相同）；cuts 可换成其它升序切点。"""
+    ac = np.asarray(ac_full, dtype=float)
+    fa = np.asarray(fa_full, dtype=float)
+    labels = cut_labels(cuts)
+    with np.errstate(invalid='ignore'):
+        conds = [ac == 1, np.isnan(fa)] + [fa < c for c in cuts]
+    return np.select(conds, ['singleton', 'NA'] + labels[:-1], default=labels[-1]).astype(object)
+
+def add_site_columns(df, eps):
+    """在 allele_table（或其一个chunk）上追加 fullset 频率、分箱、权重与组合覆盖标志。"""
+    df['AC_full'] = df[['AC_anc','AC_cult','AC_wild']].sum(axis=1)
+    df['AN_full'] = df[['AN_anc','AN_cult','AN_wild']].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['fa_full'] = np.where(df['AN_full']>0, df['AC_full']/df['AN_full'], np.nan)
+    df['bin'] = bin_labels(df['AC_full'].values, df['fa_full'].values)
+    df['w'] = -np.log10(np.clip(df['fa_full'].fillna(0.0).values, eps, None))
+
+    # 组合出的覆盖标志
+    df['in_cultwild'] = ((df['in_cult']==1) | (df['in_wild']==1)).astype(int)
+    return df
+
+def target_defs(df):
+    """目标集合 S（按是否“在该集合出现过”）；可选子群仅在对应列存在时加入。"""
+    # 基本：
+    S_defs = {'ancients64': (df['in_anc'] == 1)}
+    # 可选子群（这些列在 02_allele_count.py 新增）
+    if 'in_anc_nat' in df.columns:
+        S_defs['anc_nat26']  = (df['in_anc_nat'] == 1)
+    if 'in_anc_cult' in df.columns:
+        S_defs['anc_cult38'] = (df['in_anc_cult'] == 1)
+    if 'in_anc_admix' in df.columns:
+        S_defs['anc_admix4'] = (df['in_anc_admix'] == 1)
+    if 'in_anc_min' in df.columns:
+        S_defs['anc_Min43']  = (df['in_anc_min'] == 1)
+    if 'in_anc_zhu' in df.columns:
+        S_defs['anc_Zhu17']  = (df['in_anc_zhu'] == 1)
+    # wild33 作为 target：用 in_wild
+    S_defs['wild33'] = (df['in_wild'] == 1)
+    return S_defs
+
+def cover_defs(df):
+    """覆盖方定义（三种）。"""
+    return {
+        'covered_by_cultivated':   (df['in_cult'] == 1),
+        'covered_by_wild':         (df['in_wild'] == 1),
+        'covered_by_cultivated+wild': (df['in_cultwild'] == 1),
+    }
+
+def cover_pairs(targets, covers):
+    """输出的 target×cover 组合。"""
+    for target in targets:
+        for cover_name in covers:
+            # 用户清单中只要求 wild33 与 covered_by_cultivated，其它 cover 可按需过滤
+            if target == 'wild33' and cover_name != 'covered_by_cultivated':
+                continue
+            yield target, cover_name
+
+def _add_exact(cell, values):
+    """cell（[hi, lo] 两个 float64）加上 values 之和：hi 为正确舍入的和（math.fsum），lo 为余项，跨 chunk 不丢精度。"""
+    if len(values) == 0:
+        return
+    parts = values.tolist() + cell.tolist()
+    hi = math.fsum(parts)
+    parts.append(-hi)
+    cell[0], cell[1] = hi, math.fsum(parts)
+
+def _total(cells):
+    """若干 [hi, lo] 单元之和（正确舍入）。"""
+    return math.fsum(np.asarray(cells).ravel().tolist())
+
+class AcWacAccumulator:
+    """
+    逐 chunk 累加 target×cover×bin 的 AC / wAC：每个单元只有 n / n_cov 与 w_sum / w_cov_sum，内存与位点数无关。
+    w 之和逐单元精确累加（math.fsum，跨 chunk 带余项），结果为正确舍入的和，与 chunk 划分、合并顺序无关；
+    原来整表计算的分箱和为 groupby().sum() 的补偿求和，非负的 w 上与之相同，分箱 AC / wAC 逐位一致。
+    add() 传入 blk（每个位点的区块编号）时，另按区块记录 n / n_cov / w_sum / w_cov_sum（block_stats：n_blocks×4×n_bins）。
+    """
+
+    def __init__(self):
+        self.targets = None     # target_defs() 的名字（按定义顺序）
+        self.covers = None      # cover_defs() 的名字
+        self.n = self.n_cov = None           # (nt, nb) / (nt, nc, nb) int64
+        self.w_sum = self.w_cov = None       # (nt, nb, 2) / (nt, nc, nb, 2)：[hi, lo]
+        self.block_stats = {}   # (target, cover) -> BlockSums((4, n_bins))
+
+    def _setup(self, targets, covers):
+        self.targets, self.covers = list(targets), list(covers)
+        nt, nc, nb = len(self.targets), len(self.covers), len(BIN_LABELS)
+        self.n = np.zeros((nt, nb), dtype=np.int64)
+        self.n_cov = np.zeros((nt, nc, nb), dtype=np.int64)
+        self.w_sum = np.zeros((nt, nb, 2))
+        self.w_cov = np.zeros((nt, nc, nb, 2))
+
+    def add(self, df, blk=None):
+        S_defs = target_defs(df)
+        covers = cover_defs(df)
+        if self.targets is None:
+            self._setup(S_defs, covers)
+        elif list(S_defs) != self.targets:
+            raise ValueError(f"allele-table chunk has targets {list(S_defs)}, expected {self.targets}")
+        nb = len(BIN_LABELS)
+        bin_idx = pd.Categorical(df['bin'], categories=BIN_LABELS).codes
+        w = df['w'].to_numpy(dtype=float)
+
+        # 按分箱排序（稳定，分箱内保持位点顺序），逐分箱、逐 target×cover 累加
+        order = np.argsort(bin_idx, kind='stable')
+        edges = np.searchsorted(bin_idx[order], np.arange(nb + 1))
+        w_o = w[order]
+        T = np.column_stack([m.to_numpy(dtype=bool) for m in S_defs.values()])[order]
+        C = np.column_stack([m.to_numpy(dtype=bool) for m in covers.values()])[order]
+        pairs = [(self.targets.index(t), self.covers.index(c)) for t, c in cover_pairs(self.targets, self.covers)]
+        for b in range(nb):
+            a, e = edges[b], edges[b + 1]
+            if a == e:
+                continue
+            wb, Tb, Cb = w_o[a:e], T[a:e], C[a:e]
+            for ti in range(len(self.targets)):
+                mt = Tb[:, ti]
+                self.n[ti, b] += np.count_nonzero(mt)
+                _add_exact(self.w_sum[ti, b], wb[mt])
+            for ti, ci in pairs:
+                mc = Tb[:, ti] & Cb[:, ci]
+                self.n_cov[ti, ci, b] += np.count_nonzero(mc)
+                _add_exact(self.w_cov[ti, ci, b], wb[mc])
+
+        if blk is not None:
+            n_blk = int(blk.max()) + 1 if len(blk) else 0
+            blk_bin = blk * nb + bin_idx
+            for target, cover_name in cover_pairs(S_defs, covers):
+                mS = S_defs[target].to_numpy()
+                cov = mS & covers[cover_name].to_numpy()
+                m = n_blk * nb
+                vals = np.stack([
+                    np.bincount(blk_bin[mS], minlength=m),
+                    np.bincount(blk_bin[cov], minlength=m),
+                    np.bincount(blk_bin[mS], weights=w[mS], minlength=m),
+                    np.bincount(blk_bin[cov], weights=w[cov], minlength=m),
+                ]).reshape(4, n_blk, nb).transpose(1, 0, 2)
+                self.block_stats.setdefault((target, cover_name), BlockSums((4, nb))).add(n_blk, vals)
+
+    def merge(self, other, block_lut=None):
+        """并入另一个累加器；block_lut 为 other 区块编号 -> 本累加器区块编号（BlockIndex.merge 的返回值）。"""
+        if other.targets is not None:
+            if self.targets is None:
+                self._setup(other.targets, other.covers)
+            elif other.targets != self.targets:
+                raise ValueError("cannot merge AC/wAC accumulators over different targets")
+            self.n += other.n
+            self.n_cov += other.n_cov
+            for mine, theirs in ((self.w_sum, other.w_sum), (self.w_cov, other.w_cov)):
+                for idx in np.ndindex(mine.shape[:-1]):
+                    _add_exact(mine[idx], theirs[idx])
+        if block_lut is not None:
+            for key, bs in other.block_stats.items():
+                self.block_stats.setdefault(key, BlockSums(bs.shape)).add_rows(block_lut, bs.get(len(block_lut)))
+
+    def _results(self):
+        """
+        逐 target×cover 产出 (target, cover, n_AS, AC_overall, wAC_overall, bybin)；
+        bybin 与原来的 groupby('bin') 相同：只含有等位的分箱，按标签字符串排序。0 个等位的 target 产出 (target, None, 0, ...)。
+        """
+        if self.targets is None:
+            return
+        bin_order = sorted(range(len(BIN_LABELS)), key=lambda i: BIN_LABELS[i])
+        for ti, target in enumerate(self.targets):
+            n_AS = int(self.n[ti].sum())
+            if n_AS == 0:
+                yield target, None, 0, np.nan, np.nan, None
+                continue
+            keep = [b for b in bin_order if self.n[ti, b] > 0]
+            n_b = self.n[ti, keep]
+            w_tot = _total(self.w_sum[ti])
+            w_b = np.array([_total(self.w_sum[ti, b]) for b in keep])
+            for _, cover_name in cover_pairs([target], self.covers):
+                ci = self.covers.index(cover_name)
+                nc_b = self.n_cov[ti, ci, keep]
+                wc_tot = _total(self.w_cov[ti, ci])
+                wc_b = np.array([_total(self.w_cov[ti, ci, b]) for b in keep])
+                AC_overall = np.float64(nc_b.sum()) / n_AS
+                wAC_overall = float(wc_tot / w_tot) if w_tot > 0 else np.nan
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    bybin = pd.DataFrame({'bin': [BIN_LABELS[b] for b in keep], 'n_alleles': n_b,
+                                          'AC': nc_b / n_b, 'wAC': wc_b / w_b})
+                yield target, cover_name, n_AS, AC_overall, wAC_overall, bybin
+
+    def write(self, out_prefix):
+        """写出每个组合的 by-bin 明细与 ac_wac_summary.csv（与原来整表计算逐字节一致）。"""
+        out_rows = []
+        for target, cover_name, n_AS, AC_overall, wAC_overall, bybin in self._results():
+            if cover_name is None:
+                sys.stderr.write(f"[WARN] Target {target} has 0 alleles; skip\n")
+                continue
+
+            # 写每个组合的 by-bin 明细
+            bybin_path = f"{out_prefix}.ac_wac_bybin.{target}.{cover_name}.csv"
+            bybin.to_csv(bybin_path, index=False)
+
+            # 汇总行（overall）
+            out_rows.append({
+                'target': target,
+                'cover': cover_name,
+                'n_AS': n_AS,
+                'AC_overall': AC_overall,
+                'wAC_overall': wAC_overall
+            })
+            # 同时把分箱作为“扩展行”附加到同一个 summary CSV（便于一次读取）
+            for _, r in bybin.iterrows():
+                out_rows.append({
+                    'target': target,
+                    'cover': cover_name,
+                    'bin': r['bin'],
+                    'n_in_bin': int(r['n_alleles']),
+                    'AC_bin': float(r['AC']),
+                    'wAC_bin': float(r['wAC']),
+                })
+
+        summary_df = pd.DataFrame(out_rows)
+        summary_df.to_csv(f"{out_prefix}.ac_wac_summary.csv", index=False)
+
+    def write_ci(self, out_prefix, n_blocks, W, method, level):
+        """
+        由区块统计量与区块权重 W（(reps, n_blocks)，见 blockboot.replicate_weights）
+        给出 overall 与各分箱 AC / wAC 的标准误与置信区间，写出 {out_prefix}.ac_wac_summary.ci.csv。
+        行与 ac_wac_summary.csv 一一对应（overall 行 bin 为空），点估计与之相同。
+        """
+        rows = []
+        for target, cover_name, n_AS, AC_overall, wAC_overall, bybin in self._results():
+            if cover_name is None:
+                continue
+            B = self.block_stats[(target, cover_name)].get(n_blocks)
+            keep = [BIN_LABELS.index(b) for b in bybin['bin']]
+            # 第 0 列为 overall，其后为各分箱
+            Bc = np.concatenate([B.sum(axis=2, keepdims=True), B[:, :, keep]], axis=2)
+            n = np.r_[n_AS, bybin['n_alleles'].to_numpy()]
+            est = {'AC': np.r_[AC_overall, bybin['AC'].to_numpy()],
+                   'wAC': np.r_[wAC_overall, bybin['wAC'].to_numpy()]}
+            reps = {'AC': ratio_reps(W, Bc[:, 1], Bc[:, 0]), 'wAC': ratio_reps(W, Bc[:, 3], Bc[:, 2])}
+            ci = {k: interval(est[k], reps[k], method, level) for k in est}
+            for j, label in enumerate([None] + list(bybin['bin'])):
+                row = {'target': target, 'cover': cover_name, 'bin': label, 'n': int(n[j])}
+                for k in ('AC', 'wAC'):
+                    se, lo, hi = ci[k]
+                    row.update({k: est[k][j], f'{k}_se': se[j], f'{k}_ci_low': lo[j], f'{k}_ci_high': hi[j]})
+                rows.append(row)
+        pd.DataFrame(rows).to_csv(f"{out_prefix}.ac_wac_summary.ci.csv", index=False)
+
+class IrrAccumulator:
+    """
+    所有古树一起累加 IRR 的分子 Σ w*(1-cover) 与分母 Σ w（只计该树携带的稀有古树等位）。
+    每个 chunk 只做一次矩阵乘法：carrier(稀有位点 × 古树)ᵀ @ [w*(1-cover), w]。
+    add() 传入 blk（每个位点的区块编号）时，另按区块记录 num / den（block_stats：n_blocks×n_anc×2）。
+    """
+
+    def __init__(self, ancient_ids):
+        self.ids = list(ancient_ids)
+        self.num = np.zeros(len(self.ids))
+        self.den = np.zeros(len(self.ids))
+        self.block_stats = BlockSums((len(self.ids), 2))
+
+    def add(self, A, w_v, cover_v, site_mask, blk=None):
+        """
+        A：(nrow, n_anc) int8 ALT 计数（列顺序同 ids）；w_v / cover_v：每个位点的权重与覆盖标志（0/1）；
+        site_mask：参与 IRR 的位点（已对齐且 anc_count ≤ max_occ）；blk：可选的区块编号。
+        """
+        if A.shape[1] != len(self.ids):
+            raise ValueError(f"genotype chunk has {A.shape[1]} ancient columns, expected {len(self.ids)}")
+        rows = np.flatnonzero(site_mask)
+        if len(rows) == 0:
+            return
+        carr = (A[rows] > 0).astype(np.float64)
+        w_sel = np.asarray(w_v, dtype=np.float64)[rows]
+        c_sel = np.asarray(cover_v, dtype=np.float64)[rows]  # 0/1
+        W = np.column_stack([w_sel * (1.0 - c_sel), w_sel])
+        nd = carr.T @ W
+        self.num += nd[:, 0]
+        self.den += nd[:, 1]
+        if blk is not None:
+            b_sel = blk[rows]
+            for b in np.unique(b_sel):
+                m = b_sel == b
+                self.block_stats.add_block(int(b), carr[m].T @ W[m])
+
+    def merge(self, other, block_lut=None):
+        """并入另一个（同一组古树的）累加器；block_lut 同 AcWacAccumulator.merge。"""
+        if other.ids != self.ids:
+            raise ValueError("cannot merge IRR accumulators over different ancient IDs")
+        self.num += other.num
+        self.den += other.den
+        if block_lut is not None:
+            self.block_stats.add_rows(block_lut, other.block_stats.get(len(block_lut)))
+
+    def table(self, anc_nat_ids=(), anc_cult_ids=()):
+        rows = []
+        for tid, num, den in zip(self.ids, self.num.tolist(), self.den.tolist()):
+            irr = num
+            irr_norm = (num/den) if den > 0 else np.nan
+            # 标注子组（便于后续分组可视化）
+            grp = 'anc_nat26' if tid in anc_nat_ids else ('anc_cult38' if tid in anc_cult_ids else 'anc_other')
+            rows.append({'id': tid, 'group': grp, 'IRR': irr, 'IRR_norm01': irr_norm})
+        return pd.DataFrame(rows).sort_values(['group','IRR_norm01'], ascending=[True, False])
+
+    def ci_table(self, n_blocks, W, method, level, anc_nat_ids=(), anc_cult_ids=()):
+        """逐古树 IRR 与 IRR_norm01 的区块重抽样标准误与置信区间（行顺序同 table()）。"""
+        B = self.block_stats.get(n_blocks)
+        reps = {'IRR': W @ B[:, :, 0], 'IRR_norm01': ratio_reps(W, B[:, :, 0], B[:, :, 1])}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            est = {'IRR': self.num, 'IRR_norm01': np.where(self.den > 0, self.num / self.den, np.nan)}
+        df = self.table(anc_nat_ids, anc_cult_ids)
+        order = df.index.to_numpy()
+        for k in ('IRR', 'IRR_norm01'):
+            se, lo, hi = interval(est[k], reps[k], method, level)
+            df[f'{k}_se'] = se[order]
+            df[f'{k}_ci_low'] = lo[order]
+            df[f'{k}_ci_high'] = hi[order]
+        return df[['id', 'group',
+                   'IRR', 'IRR_se', 'IRR_ci_low', 'IRR_ci_high',
+                   'IRR_norm01', 'IRR_norm01_se', 'IRR_norm01_ci_low', 'IRR_norm01_ci_high']]
+
+def site_keys(chr_, pos, ref, alt):
+    """CHR|POS|REF|ALT 键（字符串数组）。"""
+    return (pd.Series(chr_).astype(str).values + '|' + pd.Series(pos).astype(str).values + '|'
+            + pd.Series(ref).astype(str).values + '|' + pd.Series(alt).astype(str).values)
+
+class FrameRows:
+    """内存中的 allele table（DataFrame）按行号取行；与 TableStream 接口相同。"""
+
+    def __init__(self, df):
+        self.df = df
+
+    def rows(self, start, stop):
+        return self.df.iloc[start:stop].reset_index(drop=True)
+
+    def frame(self):
+        return self.df
+
+    def remaining(self, offset):
+        return max(0, len(self.df) - offset)
+
+class TableStream:
+    """
+    按行号顺序流式读取 allele table（table_io.iter_allele_table），只缓存当前用到的几个 chunk；
+    prepare(chunk) 在读入后对每个 chunk 执行（过滤区段、add_site_columns 等），行号按 prepare 之后计。
+    rows() 只能向前取；需要回到已丢弃的行时从头重读。
+    """
+
+    def __init__(self, chunks, prepare=None):
+        """chunks：无参函数，返回新的 chunk 迭代器（每次调用从表头开始）。"""
+        self.chunks = chunks
+        self.prepare = prepare or (lambda c: c)
+        self._reset()
+
+    def _reset(self):
+        self._it = iter(self)
+        self._buf = None
+        self._buf_start = 0
+        self._done = False
+
+    def rows(self, start, stop):
+        if start < self._buf_start:
+            self._reset()
+        parts = [] if self._buf is None else [self._buf]
+        end = self._buf_start + (0 if self._buf is None else len(self._buf))
+        while end < stop and not self._done:
+            c = next(self._it, None)
+            if c is None:
+                self._done = True
+                break
+            if end + len(c) <= start:
+                # 整块都在 start 之前（续跑时跳过已处理的行）
+                parts, end = [], end + len(c)
+                self._buf_start = end
+                continue
+            parts.append(c)
+            end += len(c)
+        buf = pd.concat(parts, ignore_index=True) if len(parts) > 1 else (parts[0] if parts else None)
+        if buf is None:
+            self._buf = None
+            return pd.DataFrame()
+        drop = min(max(0, start - self._buf_start), len(buf))
+        self._buf = buf.iloc[drop:].reset_index(drop=True)
+        self._buf_start += drop
+        return self._buf.iloc[:max(0, stop - start)].reset_index(drop=True)
+
+    def __iter__(self):
+        """从表头起逐个产出 prepare 之后的 chunk（与 rows() 的游标无关）。"""
+        return (self.prepare(c) for c in self.chunks())
+
+    def frame(self):
+        """整张表（键连接回退时才需要；内存与位点数成正比）。"""
+        return pd.concat(list(self), ignore_index=True)
+
+    def remaining(self, offset):
+        """offset 之后还有多少行（向前读完剩余部分计数）。"""
+        if len(self.rows(offset, offset + 1)) == 0:
+            return 0
+        n = len(self._buf) + sum(len(c) for c in self._it)
+        self._reset()
+        return n
+
+class SiteMetaJoin:
+    """
+    为每个 GT chunk 取出 allele_table 中对应位点的列（anc_count / cover / w 等）。
+
+    allele_table 与 GT 表由同一个 VCF 按同一顺序导出，因此默认按行号直接切片对齐，
+    不构建字符串键索引；每个 chunk 抽样比较 CHR|POS|REF|ALT（每 check_every 行一次，外加首尾行）
+    以发现错位。一旦发现两者确实不同（行数不符或键不一致），报告位置并对剩余 chunk
+    回退到按键哈希连接（reindex；表中没有的位点 ok=False）。
+    table 可以是 DataFrame，也可以是 TableStream（按行对齐时内存只与 chunk 大小有关）。
+    """
+
+    def __init__(self, table, cols, check_every=1000):
+        self.table = table if isinstance(table, TableStream) else FrameRows(table)
+        self.cols = list(cols)
+        self.check_every = max(1, check_every)
+        self.offset = 0
+        self.hashed = None
+
+    def _aligned(self, info, block, start):
+        n = len(info)
+        if len(block) < n:
+            return False, f"allele table has only {start + len(block)} rows, GT reaches row {start + n}"
+        rows = np.unique(np.r_[np.arange(0, n, self.check_every), n - 1])
+        want = site_keys(*(info[c].to_numpy()[rows] for c in ('CHR', 'POS', 'REF', 'ALT')))
+        have = site_keys(*(block[c].to_numpy()[rows] for c in ('CHR', 'POS', 'REF', 'ALT')))
+        bad = np.flatnonzero(want != have)
+        if len(bad):
+            i = rows[bad[0]]
+            return False, f"row {start + i}: GT {want[bad[0]]} vs allele table {have[bad[0]]}"
+        return True, None
+
+    def _build_hashed(self):
+        meta_df = self.table.frame()[['CHR','POS','REF','ALT'] + self.cols].copy()
+        meta_df['key'] = site_keys(meta_df['CHR'], meta_df['POS'], meta_df['REF'], meta_df['ALT'])
+        self.hashed = meta_df.set_index('key')[self.cols]
+
+    def take(self, info):
+        """返回 (meta, ok_mask)：meta 为与 info 逐行对应的 cols（DataFrame），ok_mask 标记在表中找到的行。"""
+        n = len(info)
+        if self.hashed is None:
+            block = self.table.rows(self.offset, self.offset + n)
+            ok, why = self._aligned(info, block, self.offset)
+            if ok:
+                self.offset += n
+                return block[self.cols], np.ones(n, dtype=bool)
+            sys.stderr.write(f"[WARN] allele table and genotypes are not row-aligned ({why}); "
+                             f"falling back to a hashed CHR|POS|REF|ALT join\n")
+            self._build_hashed()
+
+        keys = site_keys(info['CHR'], info['POS'], info['REF'], info['ALT'])
+        meta = self.hashed.reindex(keys).reset_index(drop=True)
+        return meta, meta['w'].notna().values if 'w' in self.cols else meta.notna().all(axis=1).values
+
+    def state(self):
+        """断点续跑需要保存的进度（行偏移；是否已回退到键连接）。"""
+        return {'offset': self.offset, 'hashed': self.hashed is not None}
+
+    def restore(self, state):
+        self.offset = state['offset']
+        if state['hashed']:
+            self._build_hashed()
+
+    def finish(self):
+        if self.hashed is None:
+            extra = self.table.remaining(self.offset)
+            if extra:
+                sys.stderr.write(f"[WARN] allele table has {extra} rows beyond the end of the genotypes\n")
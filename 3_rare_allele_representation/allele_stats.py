@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+allele_stats.py
+
+“等位元素表”的逐chunk统计（02_allele_count.py 与 03_ac_wac_irr.py --fused 共用）：
+读取群体名单 / 群体清单（manifest）、构建列索引，
+以一次矩阵乘法算出所有群体的 AC/AN/carriers，并组装每个chunk的输出 DataFrame。
+"""
+
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from gt_codec import MISSING
+from perf_metrics import timed
+
+# 主群（固定的列布局：*_count ×3, in_* ×3, AC_/AN_ ×3）；其余群体依次追加在后面
+BASE_GROUPS = ('anc', 'cult', 'wild')
+# 旧版命令行中的可选子群（列名前缀）
+LEGACY_SUBGROUPS = ('anc_nat', 'anc_cult', 'anc_admix', 'anc_min', 'anc_zhu')
+
+_LABEL_RE = re.compile(r'^[A-Za-z0-9_]+$')
+# 03_ac_wac_irr.py 派生列占用的名字（AC_full / AN_full / fa_full、in_cultwild），不能作为群体标签
+RESERVED_LABELS = ('full', 'cultwild')
+
+def read_list(path):
+    s = set()
+    if path is None:
+        return s
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                s.add(line)
+    return s
+
+def read_group_manifest(path):
+    """
+    读取群体清单（TSV）：每行 “样本ID<TAB>群体标签[,群体标签...]”；
+    同一样本可出现在多行 / 多个群体中（群体可以重叠）。以 '#' 开头的行与表头行（sample<TAB>group）忽略。
+    标签不能是 RESERVED_LABELS；主群 / 旧版子群的标签（anc、anc_nat……）用于代替对应的命令行名单。
+    返回 {标签: set(样本)}，按标签首次出现的顺序。
+    """
+    groups = {}
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split('\t')
+            if len(parts) < 2:
+                raise SystemExit(f"[ERROR] {path}:{n}: expected 'sample<TAB>group[,group...]'")
+            sample, labels = parts[0].strip(), parts[1]
+            if n == 1 and sample.lower() in ('sample', 'id', 'sample_id'):
+                continue
+            for label in labels.split(','):
+                label = label.strip()
+                if not label:
+                    continue
+                if not _LABEL_RE.match(label):
+                    raise SystemExit(f"[ERROR] {path}:{n}: group label '{label}' must match [A-Za-z0-9_]+")
+                if label in RESERVED_LABELS:
+                    raise SystemExit(f"[ERROR] {path}:{n}: group label '{label}' is reserved "
+                                     f"(03_ac_wac_irr.py derives AC_full/AN_full/fa_full and in_cultwild)")
+                groups.setdefault(label, set()).add(sample)
+    return groups
+
+def build_col_index(samples_order, group_set):
+    """
+    给定 VCF 样本顺序（list[str]）和一个组（set[str]），
+    返回该组样本在 all147.gt.tsv 中的列索引列表（注意：前4列是 CHR POS REF ALT，从第5列开始是GT）。
+    """
+    sample_to_col = {s: i+4 for i, s in enumerate(samples_order)}
+    cols = []
+    missing = []
+    for s in group_set:
+        if s in sample_to_col:
+            cols.append(sample_to_col[s])
+        else:
+            missing.append(s)
+    if missing:
+        sys.stderr.write(f"[WARN] {len(missing)} IDs not found in samples.order: {missing[:5]}{' ...' if len(missing)>5 else ''}\n")
+    cols.sort()
+    return cols
+
+class GroupSet:
+    """
+    一组（可重叠的）样本群体及其 样本×群体 0/1 成员矩阵 M。
+
+    stats() 用一次矩阵乘法得到所有群体的 AC / AN / carriers：
+    每个基因型先编码为 c = ok + K*alt + K²*carrier（缺失=0），则 (C @ M)[i, g]
+    = 非缺失数 + K*ALT等位数 + K²*携带者数；K 取大于 2×最大群体规模的 2 的幂，
+    三个计数互不进位，float64 乘积在 2^53 内精确，再用整数运算拆开。
+    """
+
+    def __init__(self, n_samples, groups):
+        """groups: [(标签, 列索引)]，列索引使用 all147.gt.tsv 的列号（从 4 起，同 build_col_index）。"""
+        self.labels = [g for g, _ in groups]
+        self.cols = {g: list(c) for g, c in groups}
+        self.index = {g: j for j, g in enumerate(self.labels)}
+        self.membership = np.zeros((n_samples, len(groups)), dtype=np.float64)
+        for j, (_, cols) in enumerate(groups):
+            self.membership[[i-4 for i in cols], j] = 1.0  # shift，因为 gtm 从第5列开始
+
+        max_size = max((len(c) for _, c in groups), default=0)
+        self.K = 1 << max(1, int(2 * max_size + 1).bit_length())
+        K = self.K
+        # 下标 = ALT计数 + 1（MISSING=-1 -> 0）
+        self.lut = np.array([0.0, 1.0, 1.0 + K + K*K, 1.0 + 2*K + K*K])
+
+    def __contains__(self, label):
+        return label in self.index and len(self.cols[label]) > 0
+
+    def stats(self, gtm: np.ndarray):
+        """
+        对当前chunk（gtm：int8，行=位点，列=全部样本，MISSING 表示缺失）计算所有群体的：
+          AC = ALT等位总数
+          AN = 2 * 非缺失基因型数
+          carriers = 携带ALT的“人数”（ALT计数>0）
+        返回三个 (nrow, n_groups) 的 float64 数组（与旧版 NaN 语义下的 nansum 结果一致）。
+        """
+        assert MISSING == -1
+        C = self.lut.take(gtm.astype(np.intp) + 1)
+        S = np.rint(C @ self.membership).astype(np.int64)
+        K = self.K
+        AN = 2.0 * (S % K)
+        AC = ((S // K) % K).astype(np.float64)
+        carriers = (S // (K * K)).astype(np.float64)
+        return AC, AN, carriers
+
+def build_group_cols(samples_order, ancients=None, cultivated=None, wild=None,
+                     anc_nat=None, anc_cult=None, anc_admix=None, anc_min=None, anc_zhu=None,
+                     manifest=None):
+    """
+    读取各群体名单（路径）与可选的群体清单（--groups），构建 allele_table_chunk() 使用的 GroupSet。
+    主群 anc / cult / wild 可来自 --ancients / --cultivated / --wild，也可来自清单中同名的标签；
+    旧版可选子群未提供时保留空位（不输出）；清单中的其它群体按出现顺序追加。
+    """
+    listed = {
+        'anc': ancients, 'cult': cultivated, 'wild': wild,
+        'anc_nat': anc_nat, 'anc_cult': anc_cult,
+        'anc_admix': anc_admix, 'anc_min': anc_min, 'anc_zhu': anc_zhu,
+    }
+    members = {g: read_list(p) for g, p in listed.items() if p}
+    extra = read_group_manifest(manifest) if manifest else {}
+    for g, s in extra.items():
+        if g in members:
+            raise SystemExit(f"[ERROR] built-in group '{g}' is given both on the command line and in {manifest}; "
+                             f"use one of them or rename the manifest label")
+        members[g] = s
+    for g in BASE_GROUPS:
+        if g not in members:
+            raise SystemExit(f"[ERROR] main group '{g}' not given (use --ancients/--cultivated/--wild or a '{g}' label in --groups)")
+
+    order = list(BASE_GROUPS) + list(LEGACY_SUBGROUPS) + [g for g in extra if g not in BASE_GROUPS + LEGACY_SUBGROUPS]
+    groups = [(g, build_col_index(samples_order, members[g]) if members.get(g) else []) for g in order]
+    return GroupSet(len(samples_order), groups)
+
+def table_groups(groups):
+    """等位元素表中输出的群体（按列顺序）：主群，以及成员非空的子群体 / 清单群体。"""
+    return list(BASE_GROUPS) + [g for g in groups.labels if g not in BASE_GROUPS and g in groups]
+
+def allele_table_chunk(info, gtm, groups):
+    """
+    对一个chunk计算各群体统计，并组装该chunk的“等位元素表”（DataFrame）。
+    info 为 CHR/POS/REF/ALT；gtm 为全部样本的 ALT 等位计数（int8；MISSING表示缺失）；
+    groups 为 build_group_cols() 得到的 GroupSet（主群总是输出；其余群体为空时不输出）。
+    """
+    # 各群体统计（一次矩阵乘法）
+    with timed('group_stats'):
+        AC, AN, N = groups.stats(gtm)
+    return allele_table_from_stats(info, AC, AN, N, groups)
+
+def allele_table_from_stats(info, AC, AN, N, groups):
+    """由已算好的各群体 AC / AN / carriers（(nrow, n_groups)，列顺序同 groups.labels）组装等位元素表（group_cache.py）。"""
+    with timed('assemble'):
+        return _assemble(info, AC, AN, N, groups)
+
+def _assemble(info, AC, AN, N, groups):
+    col = groups.index
+
+    # 组装输出 DataFrame（主群）
+    data = {
+        'CHR': info['CHR'].values,
+        'POS': info['POS'].values,
+        'REF': info['REF'].values,
+        'ALT': info['ALT'].values,
+    }
+    for g in BASE_GROUPS:
+        data[f'{g}_count'] = N[:, col[g]]
+    for g in BASE_GROUPS:
+        data[f'in_{g}'] = (N[:, col[g]] > 0).astype(int)
+    for g in BASE_GROUPS:
+        data[f'AC_{g}'] = AC[:, col[g]]
+        data[f'AN_{g}'] = AN[:, col[g]]
+    df = pd.DataFrame(data)
+
+    # 子群体 / 清单群体输出（自然孑遗、历史栽培、谱系……）
+    extra = table_groups(groups)[len(BASE_GROUPS):]
+    for g in extra:
+        df[f'{g}_count'] = N[:, col[g]]
+        df[f'in_{g}']    = (N[:, col[g]] > 0).astype(int)
+        df[f'AC_{g}']    = AC[:, col[g]]
+        df[f'AN_{g}']    = AN[:, col[g]]
+
+    # 频率列（避免除0：AN=0 -> fa=NaN）
+    for g in list(BASE_GROUPS) + extra:
+        num = df[f'AC_{g}'].astype(float)
+        den = df[f'AN_{g}'].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df[f'fa_{g}'] = np.where(den > 0, num/den, np.nan)
+
+    return df
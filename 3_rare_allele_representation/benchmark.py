@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark.py
+
+稀有等位流程（01 / 02 / 03）的可重复性能基准：
+  - 用 simulate_gt.py 生成指定规模的模拟数据（按 位点数×样本数×种子 缓存在 --work-dir 下，只生成一次）
+  - 对每个 规模 × chunksize × 阶段 以子进程运行对应脚本，测量
+    墙钟时间、用户 / 系统 CPU 时间、吞吐（sites/s）与峰值常驻内存（wait4 的 ru_maxrss，
+    即该进程及其已回收子进程中最大的一个；经一个很小的启动器进程启动，避免继承本进程的内存）
+  - 每次测量追加一行 JSON 到 --results（默认 bench_results.jsonl），带版本标签（默认 git describe）、
+    主机名与 Python / numpy / pandas 版本，便于不同版本之间比较
+  - --report 汇总结果文件：每个 配置×标签 取中位数；给出 --baseline 时附上相对基线的比值（>1 为变慢）
+
+阶段：
+  store        01_gt_store.py 把 GT 表转为二进制基因型库
+  02           02_allele_count.py --gt-tsv
+  02-workers   02_allele_count.py --gt-tsv --workers W
+  02-store     02_allele_count.py --gt-store（需要 store，缺失时先不计时生成）
+  03           03_ac_wac_irr.py 两遍模式（需要 02 的等位元素表，缺失时先不计时生成）
+  03-fused     03_ac_wac_irr.py --fused --gt-tsv
+
+用法示例：
+  python benchmark.py --sites 100000 1000000 --samples 147 --chunksizes 50000 200000 --repeat 3
+  python benchmark.py --report --baseline v1.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = ('store', '02', '02-workers', '02-store', '03', '03-fused')
+DEFAULT_STAGES = ('02', '03', '03-fused')
+METRICS = ['wall_s', 'sites_per_s', 'max_rss_mb']
+CONFIG_KEYS = ['stage', 'n_sites', 'n_samples', 'chunksize', 'workers']
+
+def parse_args():
+    p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--sites', type=int, nargs='+', default=[100000], help="模拟数据的位点数（可多个）")
+    p.add_argument('--samples', type=int, nargs='+', default=[147], help="模拟数据的样本数（可多个）")
+    p.add_argument('--chunksizes', type=int, nargs='+', default=[200000], help="各脚本的 --chunksize（可多个）")
+    p.add_argument('--stages', nargs='+', choices=STAGES, default=list(DEFAULT_STAGES), help="要计时的阶段")
+    p.add_argument('--workers', type=int, default=4, help="02-workers 阶段的 --workers")
+    p.add_argument('--repeat', type=int, default=1, help="每个配置重复次数（每次各记一行）")
+    p.add_argument('--seed', type=int, default=1, help="模拟数据的随机种子")
+    p.add_argument('--work-dir', default='bench_work', help="模拟数据与中间输出目录")
+    p.add_argument('--results', default='bench_results.jsonl', help="结果文件（JSON lines，追加写入）")
+    p.add_argument('--label', default=None, help="本次结果的版本标签（默认 git describe --always --dirty）")
+    p.add_argument('--report', action='store_true', help="只汇总 --results，不运行基准")
+    p.add_argument('--baseline', default=None, help="--report 时作为基线的标签")
+    return p.parse_args()
+
+def git_label():
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=HERE,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip() or 'unversioned'
+    except (OSError, subprocess.CalledProcessError):
+        return 'unversioned'
+
+def dataset(work_dir, n_sites, n_samples, seed):
+    """模拟数据目录（缺失时生成）。"""
+    import simulate_gt
+    d = os.path.join(work_dir, f"sim_{n_sites}x{n_samples}_s{seed}")
+    if not os.path.exists(os.path.join(d, 'sim_params.json')):
+        sys.stderr.write(f"[INFO] Simulating {n_sites} sites x {n_samples} samples -> {d}\n")
+        simulate_gt.simulate(SimpleNamespace(
+            n_sites=n_sites, n_samples=n_samples, out_dir=d, gt_name='all.gt.tsv', n_chroms=4,
+            mean_gap=150.0, missing=0.05, phased=0.2, haploid=0.002, alpha=1.0, fst=0.05,
+            block=50000, seed=seed))
+    return d
+
+def group_args(d, with_subgroups=True):
+    a = ['--samples-order', f'{d}/samples.order.txt', '--ancients', f'{d}/ancients.list',
+         '--cultivated', f'{d}/cult.list', '--wild', f'{d}/wild.list']
+    if with_subgroups:
+        a += ['--anc-nat', f'{d}/anc_nat.list', '--anc-cult', f'{d}/anc_cult.list']
+    return a
+
+def stage_command(stage, d, out, chunksize, workers):
+    """阶段 -> (命令行, 前置阶段)。"""
+    py = [sys.executable]
+    gt = ['--gt-tsv', f'{d}/all.gt.tsv']
+    cs = ['--chunksize', str(chunksize)]
+    store = f'{out}/gtstore'
+    table = f'{out}/allele_table.tsv'
+    if stage == 'store':
+        return py + [f'{HERE}/01_gt_store.py', *gt, '--samples-order', f'{d}/samples.order.txt',
+                     '--out', store, *cs], None
+    if stage == '02':
+        return py + [f'{HERE}/02_allele_count.py', *gt, *group_args(d), '--out', table, *cs], None
+    if stage == '02-workers':
+        return py + [f'{HERE}/02_allele_count.py', *gt, *group_args(d), '--out', f'{out}/at.workers.tsv',
+                     '--workers', str(workers), *cs], None
+    if stage == '02-store':
+        return py + [f'{HERE}/02_allele_count.py', '--gt-store', store, *group_args(d),
+                     '--out', f'{out}/at.store.tsv', *cs], 'store'
+    if stage == '03':
+        return py + [f'{HERE}/03_ac_wac_irr.py', '--allele-table', table, *gt, *group_args(d),
+                     '--out-prefix', f'{out}/twopass', *cs], '02'
+    if stage == '03-fused':
+        return py + [f'{HERE}/03_ac_wac_irr.py', '--fused', *gt, *group_args(d),
+                     '--out-prefix', f'{out}/fused', *cs], None
+    raise ValueError(stage)
+
+# 计时用的小启动器：在一个很小的 Python 进程里启动命令并回报 wait4 的 rusage。
+# 直接从本进程 fork 时，子进程的 ru_maxrss 会继承父进程（已载入 numpy / pandas）的常驻内存，掩盖小规模数据的真实峰值。
+_LAUNCHER = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+pid = os.posix_spawn(sys.argv[2], sys.argv[2:], os.environ)
+_, status, ru = os.wait4(pid, 0)
+wall = time.perf_counter() - t0
+with open(sys.argv[1], 'w') as f:
+    json.dump({'wall': wall, 'exit': os.waitstatus_to_exitcode(status), 'utime': ru.ru_utime,
+               'stime': ru.ru_stime, 'maxrss_kb': ru.ru_maxrss}, f)
+"""
+
+def run_measured(cmd, log_path):
+    """运行子进程并返回计时结果（wall / exit / utime / stime / maxrss_kb）；失败时报错退出。"""
+    stats_path = log_path + '.rusage.json'
+    with open(log_path, 'w') as log:
+        subprocess.run([sys.executable, '-S', '-c', _LAUNCHER, stats_path, *cmd],
+                       stdout=log, stderr=subprocess.STDOUT, cwd=HERE, check=False)
+    try:
+        with open(stats_path) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {'exit': -1}
+    if stats['exit'] != 0:
+        raise SystemExit(f"[ERROR] benchmark command failed (exit {stats['exit']}); see {log_path}\n"
+                         f"  {shlex.join(cmd)}")
+    return stats
+
+def environment(label):
+    return {'label': label, 'host': socket.gethostname(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'cpus': os.cpu_count()}
+
+def run_benchmarks(args):
+    label = args.label or git_label()
+    env = environment(label)
+    os.makedirs(args.work_dir, exist_ok=True)
+    records = []
+    for n_sites in args.sites:
+        for n_samples in args.samples:
+            d = dataset(args.work_dir, n_sites, n_samples, args.seed)
+            input_bytes = os.path.getsize(f'{d}/all.gt.tsv')
+            for chunksize in args.chunksizes:
+                out = os.path.join(d, f'out_c{chunksize}')
+                os.makedirs(out, exist_ok=True)
+                done = set()
+
+                def ensure(stage):
+                    """不计时地运行前置阶段（本轮尚未运行过时）。"""
+                    cmd, pre = stage_command(stage, d, out, chunksize, args.workers)
+                    if pre and pre not in done:
+                        ensure(pre)
+                    if stage not in done:
+                        sys.stderr.write(f"[INFO] Preparing {stage} (untimed)\n")
+                        run_measured(cmd, f'{out}/{stage}.log')
+                        done.add(stage)
+
+                for stage in args.stages:
+                    cmd, pre = stage_command(stage, d, out, chunksize, args.workers)
+                    if pre:
+                        ensure(pre)
+                    for rep in range(args.repeat):
+                        st = run_measured(cmd, f'{out}/{stage}.log')
+                        wall = st['wall']
+                        done.add(stage)
+                        rec = dict(env, time=time.strftime('%Y-%m-%dT%H:%M:%S'), stage=stage,
+                                   n_sites=n_sites, n_samples=n_samples, chunksize=chunksize,
+                                   workers=args.workers if stage == '02-workers' else 1, rep=rep,
+                                   wall_s=round(wall, 4), user_s=round(st['utime'], 4), sys_s=round(st['stime'], 4),
+                                   sites_per_s=round(n_sites / wall, 1) if wall > 0 else None,
+                                   max_rss_mb=round(st['maxrss_kb'] / 1024, 1), input_bytes=input_bytes,
+                                   cmd=shlex.join(cmd))
+                        records.append(rec)
+                        with open(args.results, 'a') as f:
+                            f.write(json.dumps(rec) + '\n')
+                        sys.stderr.write(f"[OK] {stage:<10} sites={n_sites} samples={n_samples} chunk={chunksize} "
+                                         f"wall={wall:.2f}s {rec['sites_per_s']:.0f} sites/s "
+                                         f"rss={rec['max_rss_mb']:.0f} MB\n")
+    sys.stderr.write(f"[DONE] {len(records)} measurement(s) appended to {args.results} (label {label})\n")
+    return label
+
+def report(results, baseline=None, label=None):
+    """结果文件汇总：配置×标签 的中位数；有基线时附相对基线的 wall / RSS 比值。"""
+    if not os.path.exists(results):
+        raise SystemExit(f"[ERROR] results file not found: {results}")
+    df = pd.read_json(results, lines=True, dtype={'stage': str, 'label': str})
+    if df.empty:
+        raise SystemExit(f"[ERROR] no results in {results}")
+    med = df.groupby(CONFIG_KEYS + ['label'], sort=False)[METRICS].median().reset_index()
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_rows', None)
+    print(med.to_string(index=False))
+    if baseline is None:
+        return
+    if baseline not in set(med['label']):
+        raise SystemExit(f"[ERROR] baseline label not found in {results}: {baseline}")
+    base = med[med['label'] == baseline].drop(columns='label')
+    cur = med[med['label'] != baseline] if label is None else med[med['label'] == label]
+    cmp = cur.merge(base, on=CONFIG_KEYS, suffixes=('', '_base'))
+    cmp['wall_ratio'] = cmp['wall_s'] / cmp['wall_s_base']
+    cmp['rss_ratio'] = cmp['max_rss_mb'] / cmp['max_rss_mb_base']
+    print(f"\n# relative to {baseline} (ratio > 1 = slower / more memory)")
+    print(cmp[CONFIG_KEYS + ['label', 'wall_s', 'wall_s_base', 'wall_ratio', 'max_rss_mb', 'rss_ratio']]
+          .round(3).to_string(index=False))
+
+def main():
+    args = parse_args()
+    # 各阶段在脚本目录下运行（cwd=HERE），路径须先按调用者的当前目录解析
+    args.work_dir = os.path.abspath(args.work_dir)
+    args.results = os.path.abspath(args.results)
+    if args.report:
+        report(args.results, args.baseline, args.label)
+        return
+    label = run_benchmarks(args)
+    report(args.results, args.baseline, label if args.baseline else None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+blockboot.py
+
+03_ac_wac_irr.py 的基因组区块重抽样置信区间（--ci bootstrap|jackknife）：
+  - BlockIndex：把位点按 (CHR, POS // block_size) 划分为区块，按首次出现的顺序编号
+  - BlockSums ：按区块累加的定长统计量数组 (n_blocks, ...)，按需扩容
+  - 扫描时 AcWacAccumulator / IrrAccumulator 除总和外还按区块记录充分统计量
+    （target×cover×bin 的 n / n_cov / w_sum / w_cov_sum；逐古树 IRR 的 num / den），
+    之后只在这些小数组上做区块 bootstrap（有放回抽区块）或 delete-one jackknife，
+    每个重复 = 区块权重向量 @ 区块统计量，几千次重复只需一次矩阵乘法。
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+CI_METHODS = ('bootstrap', 'jackknife')
+
+class BlockIndex:
+    """(CHR, POS // block_size) -> 区块编号（按首次出现的顺序）；两遍模式下两遍共用同一实例以保证编号一致。"""
+
+    def __init__(self, block_size):
+        self.block_size = int(block_size)
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def ids(self, chr_, pos):
+        chr_ = np.asarray(chr_).astype(str)
+        start = (np.asarray(pos).astype(np.int64) // self.block_size) * self.block_size
+        keys = pd.MultiIndex.from_arrays([chr_, start])
+        codes, uniques = pd.factorize(keys)
+        lut = np.array([self.index.setdefault(k, len(self.index)) for k in uniques], dtype=np.int64)
+        return lut[codes]
+
+    def merge(self, other):
+        """
+        并入另一个 BlockIndex 的区块（按其编号顺序追加新区块），返回 other 编号 -> 本实例编号的映射数组。
+        按固定顺序合并各染色体任务的结果（--chrom-workers）时，编号与一次顺序扫描相同。
+        """
+        ks = sorted(other.index, key=other.index.get)
+        return np.array([self.index.setdefault(k, len(self.index)) for k in ks], dtype=np.int64)
+
+    def keys(self):
+        """按编号顺序返回 (CHR, 区块起点) 两个数组。"""
+        ks = sorted(self.index, key=self.index.get)
+        return (np.array([k[0] for k in ks], dtype=object),
+                np.array([k[1] for k in ks], dtype=np.int64))
+
+class BlockSums:
+    """形状为 (n_blocks, *shape) 的累加数组；区块编号超出容量时自动扩容（sweep.py 也用它按位点类别累加）。"""
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.data = np.zeros((0,) + self.shape)
+
+    def _ensure(self, n):
+        if n > len(self.data):
+            grown = np.zeros((max(n, 2 * len(self.data)),) + self.shape)
+            grown[:len(self.data)] = self.data
+            self.data = grown
+
+    def add(self, n_blocks, values):
+        """values：(n_blocks_in_values, *shape)，加到前 n_blocks_in_values 个区块上。"""
+        self._ensure(n_blocks)
+        self.data[:len(values)] += values
+
+    def add_rows(self, ids, values):
+        """ids：互不相同的编号；values：(len(ids), *shape)。"""
+        if len(ids):
+            self._ensure(int(ids.max()) + 1)
+            self.data[ids] += values
+
+    def add_block(self, b, values):
+        self._ensure(b + 1)
+        self.data[b] += values
+
+    def get(self, n_blocks):
+        self._ensure(n_blocks)
+        return self.data[:n_blocks]
+
+def replicate_weights(n_blocks, reps, method, seed=None):
+    """
+    每个重复中各区块的权重 (reps, n_blocks)：
+      bootstrap：有放回抽 n_blocks 个区块，权重为被抽中的次数
+      jackknife：依次删去一个区块（reps = n_blocks）
+    """
+    if method == 'jackknife':
+        return 1.0 - np.eye(n_blocks)
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(n_blocks, np.full(n_blocks, 1.0 / n_blocks), size=reps).astype(np.float64)
+
+def interval(est, reps, method, level):
+    """
+    由重复值 reps（(n_reps, ...)）给出 (se, ci_low, ci_high)：
+    bootstrap 用百分位区间；jackknife 用 jackknife 标准误的正态近似区间。
+    """
+    with np.errstate(invalid='ignore'):
+        if method == 'jackknife':
+            n = len(reps)
+            se = np.sqrt((n - 1) / n * np.nansum((reps - np.nanmean(reps, axis=0)) ** 2, axis=0))
+            z = NormalDist().inv_cdf(0.5 + level / 2)
+            return se, est - z * se, est + z * se
+        alpha = (1.0 - level) / 2
+        lo, hi = np.nanquantile(reps, [alpha, 1.0 - alpha], axis=0)
+        return np.nanstd(reps, axis=0, ddof=1), lo, hi
+
+def ratio_reps(W, num, den):
+    """各重复的比值 Σ num / Σ den（区块权重 W：(reps, n_blocks)；num/den：(n_blocks, ...)）。"""
+    shape = num.shape[1:]
+    R_num = W @ num.reshape(len(num), -1)
+    R_den = W @ den.reshape(len(den), -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(R_den > 0, R_num / R_den, np.nan)
+    return out.reshape((len(W),) + shape)
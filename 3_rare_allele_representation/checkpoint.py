@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+checkpoint.py
+
+02_allele_count.py / 03_ac_wac_irr.py 的断点续跑（--resume）：
+  - 清单（manifest，JSON）：输入指纹、影响结果的参数，以及最近一次保存时的进度
+    （已完成的chunk数与行数、下一chunk的输入位置（文本 / VCF 为解压后的字节偏移，基因型库为行号）、输出文件偏移）
+  - 状态（state，pickle）：需要跨chunk保留的累加器（IRR、AC/wAC、区块统计量……）
+每个chunk完成后调用 commit()，但只有距上次保存超过 interval 秒（--checkpoint-interval，默认 60）时才真正保存：
+刷新输出、写新的状态文件（文件名带chunk序号），再用临时文件 + os.replace 原子替换清单，最后删掉旧状态文件。
+状态随位点数增长，逐chunk重写会使总 I/O 随chunk数平方增长；按时间间隔保存时写盘开销只占运行时间的固定比例，
+清单大小也与chunk数无关。任何时刻被杀掉，清单总是指向一份完整的状态，续跑最多重算 interval 秒的chunk。
+运行正常结束后删除清单与状态文件；--resume 时校验输入指纹与参数，不一致则拒绝续跑。
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+
+from perf_metrics import timed
+
+MANIFEST_VERSION = 2
+# 默认两次保存之间的最短间隔（秒）；0 表示每个chunk都保存
+CHECKPOINT_INTERVAL = 60.0
+# 指纹取文件大小、mtime（纳秒）、inode 与首尾各 1 MiB 的 sha1（不读全文件）。
+# 重新 call 的基因型（0/1 -> 1/1）或重建的 gt.i8 大小不变、改动也常在文件中部，只有 mtime / inode 能发现
+_FP_BYTES = 1 << 20
+
+def _file_fingerprint(path):
+    st = os.stat(path)
+    size = st.st_size
+    h = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        h.update(fh.read(_FP_BYTES))
+        if size > _FP_BYTES:
+            fh.seek(max(_FP_BYTES, size - _FP_BYTES))
+            h.update(fh.read(_FP_BYTES))
+    return {'size': size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino, 'sha1_head_tail': h.hexdigest()}
+
+def input_fingerprint(path):
+    """输入文件（或基因型库目录：meta.json + gt.i8）的指纹。"""
+    if os.path.isdir(path):
+        return {name: _file_fingerprint(os.path.join(path, name))
+                for name in ('meta.json', 'gt.i8') if os.path.exists(os.path.join(path, name))}
+    return _file_fingerprint(path)
+
+class ChunkCheckpoint:
+    """
+    一次分块运行的清单与状态。progress 为最近一次保存时的进度：
+      {'chunks', 'rows', 'in_end', 'out_end'}（out_end 为保存时输出文件的字节数，可为 None）
+    """
+
+    def __init__(self, path, inputs, params, interval=CHECKPOINT_INTERVAL):
+        """inputs：{名称: 路径}（计算指纹）；params：影响结果的参数（须可 JSON 序列化）；interval：最短保存间隔（秒）。"""
+        self.path = path
+        self.fingerprint = {k: input_fingerprint(p) for k, p in inputs.items() if p}
+        self.params = json.loads(json.dumps(params, sort_keys=True, default=str))
+        self.interval = interval
+        self.progress = {'chunks': 0, 'rows': 0, 'in_end': 0, 'out_end': 0}
+        self.state_file = None
+        self._chunks, self._rows, self._in_end = 0, 0, 0   # 已完成（不一定已保存）的进度
+        self._saved_at = time.monotonic()
+
+    # ---- 续跑 ----
+    def load(self):
+        """读取已有清单并校验；返回保存的状态（没有状态时为 None）。没有清单时报错。"""
+        if not os.path.exists(self.path):
+            raise SystemExit(f"[ERROR] --resume: no checkpoint manifest at {self.path}")
+        with open(self.path) as f:
+            man = json.load(f)
+        if man.get('version') != MANIFEST_VERSION:
+            raise SystemExit(f"[ERROR] --resume: unsupported checkpoint manifest {self.path}")
+        if man['fingerprint'] != self.fingerprint:
+            raise SystemExit(f"[ERROR] --resume: input files differ from the checkpointed run ({self.path})")
+        if man['params'] != self.params:
+            changed = sorted(k for k in set(man['params']) | set(self.params)
+                             if man['params'].get(k) != self.params.get(k))
+            raise SystemExit(f"[ERROR] --resume: options differ from the checkpointed run: {', '.join(changed)}")
+        self.progress = man['progress']
+        self._chunks, self._rows, self._in_end = (self.progress[k] for k in ('chunks', 'rows', 'in_end'))
+        self.state_file = man.get('state')
+        if not self.state_file:
+            return None
+        with open(os.path.join(os.path.dirname(self.path) or '.', self.state_file), 'rb') as f:
+            return pickle.load(f)
+
+    @property
+    def n_chunks(self):
+        return self.progress['chunks']
+
+    @property
+    def position(self):
+        """下一个chunk在输入中的起始位置。"""
+        return self.progress['in_end']
+
+    @property
+    def out_end(self):
+        return self.progress['out_end']
+
+    # ---- 记录 ----
+    def start(self):
+        """开始一次新的运行（覆盖旧清单）。"""
+        self._write_manifest(None)
+
+    def commit(self, in_end, rows, flush=None, state=None):
+        """
+        记录一个已完成的chunk（in_end 为下一chunk的输入位置）；距上次保存超过 interval 秒时保存。
+        flush：刷新输出并返回输出文件字节数的函数；state：该chunk之后的累加器状态，或返回状态的函数。
+        两者都只在保存时调用，未保存的chunk不刷新输出、不序列化状态。
+        """
+        self._chunks += 1
+        self._rows += int(rows)
+        self._in_end = int(in_end)
+        if time.monotonic() - self._saved_at < self.interval:
+            return
+        with timed('checkpoint'):
+            out_end = flush() if flush else None
+            self.progress = {'chunks': self._chunks, 'rows': self._rows, 'in_end': self._in_end,
+                             'out_end': None if out_end is None else int(out_end)}
+            state = state() if callable(state) else state
+            new_state = None
+            if state is not None:
+                new_state = f"{os.path.basename(self.path)}.state.{self._chunks}.pkl"
+                full = os.path.join(os.path.dirname(self.path) or '.', new_state)
+                with open(full + '.tmp', 'wb') as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(full + '.tmp', full)
+            old_state = self.state_file
+            self._write_manifest(new_state)
+            if old_state and old_state != new_state:
+                self._remove_state(old_state)
+        self._saved_at = time.monotonic()
+
+    def finish(self):
+        """运行正常结束：删除清单与状态文件。"""
+        if self.state_file:
+            self._remove_state(self.state_file)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _write_manifest(self, state_file):
+        self.state_file = state_file
+        man = {'version': MANIFEST_VERSION, 'fingerprint': self.fingerprint, 'params': self.params,
+               'state': state_file, 'progress': self.progress}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(man, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def _remove_state(self, name):
+        full = os.path.join(os.path.dirname(self.path) or '.', name)
+        if os.path.exists(full):
+            os.remove(full)
+
+def report_resume(ckpt):
+    sys.stderr.write(f"[INFO] Resuming after {ckpt.n_chunks} finished chunks "
+                     f"({ckpt.progress['rows']} rows, input position {ckpt.position})\n")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+chunk_pool.py
+
+按 chunk 并行处理基因型源（gt_io.py）的进程池引擎：
+  - 主进程（reader）只做 source.iter_raw()：读出原始chunk；
+    文本类原始chunk写入一组复用的共享内存槽（multiprocessing.shared_memory），
+    子进程按名字挂载读取，避免整块数据来回 pickle；基因型库的行区间直接传递。
+  - 子进程执行 source.parse_raw() + fn(chunk_idx, info, G, *args)
+  - 结果按输入顺序产出（在途任务数有上限，内存有界），由调用方单线程写出；
+    每个结果附带该chunk在输入中的起止位置（见 gt_io.iter_positioned），供断点续跑记录
+另有 map_tasks()：按染色体 / 区段（gt_index.plan_tasks）整段并行（--chrom-workers），
+每个任务在子进程中独立扫描，结果按任务顺序返回，由调用方确定性地合并。
+启用 --metrics（perf_metrics.py）时子进程同样计时，计时随结果交回主进程合并。
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import perf_metrics
+from gt_io import raw_nbytes
+from perf_metrics import count_bytes, timed, timed_iter
+
+_WORKER = {}
+
+def _pool_init(source, cols, fn, args, perf_cfg=None):
+    _WORKER.update(source=source, cols=cols, fn=fn, args=args)
+    perf_metrics.init_worker(perf_cfg)
+
+def _pool_task(chunk_idx, payload):
+    if isinstance(payload, tuple) and payload and payload[0] == 'shm':
+        _, name, size = payload
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            raw = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+    else:
+        raw = payload
+    info, G = _WORKER['source'].parse_raw(raw, _WORKER['cols'])
+    res = _WORKER['fn'](chunk_idx, info, G, *_WORKER['args'])
+    return (res, perf_metrics.take()) if perf_metrics.enabled() else res
+
+def _result(fut, nbytes):
+    """等待子进程结果；启用计时时把子进程的计时与该chunk的读入字节数并入主进程（预读不计入其它chunk）。"""
+    with timed('wait'):
+        res = fut.result()
+    if perf_metrics.enabled():
+        res, snap = res
+        perf_metrics.merge(snap)
+        count_bytes('bytes_in', nbytes)
+    return res
+
+class _ShmSlots:
+    """固定数量、可按需扩容的共享内存槽；槽在对应任务的结果被取走后才复用。"""
+
+    def __init__(self, n):
+        self.shms = [None] * n
+        self.free = list(range(n))
+
+    def put(self, raw):
+        i = self.free.pop()
+        shm = self.shms[i]
+        if shm is None or shm.size < len(raw):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=max(1, int(len(raw) * 1.25)))
+            self.shms[i] = shm
+        shm.buf[:len(raw)] = raw
+        return ('shm', shm.name, len(raw)), i
+
+    def release(self, i):
+        if i is not None:
+            self.free.append(i)
+
+    def close(self):
+        for shm in self.shms:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.shms = []
+
+def imap_chunks(source, chunksize, fn, args=(), workers=2, cols=None, start=None, first_idx=1):
+    """
+    在进程池中对 source 的每个chunk执行 fn(chunk_idx, info, G, *args)（chunk_idx 从 first_idx 起），
+    从输入位置 start（默认 source.start）开始，按输入顺序逐个产出 (in_start, in_end, 结果)。
+    fn 须为模块顶层函数（可被子进程按名字引用）。
+    """
+    start = source.start if start is None else start
+    depth = 2 * workers
+    slots = _ShmSlots(depth)
+    pending = deque()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_pool_init,
+                                 initargs=(source, cols, fn, args, perf_metrics.worker_config())) as pool:
+            pos = start
+            for chunk_idx, raw in enumerate(timed_iter(source.iter_raw(chunksize, start), 'read'), first_idx):
+                if len(pending) >= depth:
+                    fut, slot, span, nbytes = pending.popleft()
+                    yield span + (_result(fut, nbytes),)
+                    slots.release(slot)
+                end = source.raw_end(pos, raw)
+                if isinstance(raw, (bytes, bytearray)):
+                    payload, slot = slots.put(raw)
+                else:
+                    payload, slot = raw, None
+                pending.append((pool.submit(_pool_task, chunk_idx, payload), slot, (pos, end), raw_nbytes(source, raw)))
+                pos = end
+            while pending:
+                fut, slot, span, nbytes = pending.popleft()
+                yield span + (_result(fut, nbytes),)
+                slots.release(slot)
+    finally:
+        slots.close()
+
+def _task_init(fn, ctx, perf_cfg=None):
+    _WORKER.update(task_fn=fn, ctx=ctx)
+    perf_metrics.init_worker(perf_cfg)
+
+def _task_run(task):
+    res = _WORKER['task_fn'](task, _WORKER['ctx'])
+    return (res, perf_metrics.take()) if perf_metrics.enabled() else res
+
+def map_tasks(fn, tasks, ctx, workers=2):
+    """
+    在进程池中对每个任务执行 fn(task, ctx)，按任务顺序产出结果（与完成顺序无关）。
+    ctx 为共享的只读上下文，每个子进程只接收一次；fn 须为模块顶层函数。
+    """
+    perf_cfg = perf_metrics.worker_config()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_task_init, initargs=(fn, ctx, perf_cfg)) as pool:
+        for res in pool.map(_task_run, tasks):
+            if perf_cfg is not None:
+                res, snap = res
+                perf_metrics.merge(snap)
+            yield res
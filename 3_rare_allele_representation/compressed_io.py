@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+compressed_io.py
+
+GT 表 / 等位元素表的透明压缩读写（gzip / bgzip / zstd），压缩与解压都在后台线程中进行，与 chunk 计算重叠：
+  - 读取（bgzf.iter_text_pieces）：BGZF 多线程并行解压；普通 gzip 与 zstd 在一个后台线程中顺序解压，
+    未压缩文件也在后台线程中预读；按文件头的魔数判断格式，与扩展名无关
+  - 写出（open_text_writer）：按扩展名选择
+      .gz / .bgz → BGZF（bgzip / tabix 兼容，也是合法的 gzip）：每 64 KB 一块，成批交给线程池并行 deflate
+      .zst       → zstd（需 zstandard；压缩在 libzstd 的工作线程中进行）
+      其它       → 不压缩
+    flush() 结束当前所有块（BGZF 块 / zstd 帧）并返回文件的字节数：截断到该位置仍是完整的压缩文件，
+    因此断点续跑（checkpoint.py）对压缩输出同样适用
+"""
+
+import io
+import queue
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_EXTS = ('.gz', '.bgz')
+ZSTD_EXTS = ('.zst', '.zstd')
+
+# BGZF：每块最多 0xff00 字节未压缩数据（同 htslib），文件末尾为固定的空块
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+# 每个线程池任务压缩的块数（≈4 MB 未压缩数据）
+BLOCKS_PER_TASK = 64
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise SystemExit("[ERROR] zstd-compressed files need the zstandard package (pip install zstandard)")
+    return zstandard
+
+def output_compression(path):
+    """按扩展名确定写出时的压缩：'bgzf' / 'zstd' / None。"""
+    low = path.lower()
+    if low.endswith(GZIP_EXTS):
+        return 'bgzf'
+    if low.endswith(ZSTD_EXTS):
+        return 'zstd'
+    return None
+
+def is_zstd(path):
+    with open(path, 'rb') as fh:
+        return fh.read(4) == ZSTD_MAGIC
+
+# ----------------- 读取 -----------------
+def prefetch(iterable, depth=4):
+    """在后台线程中迭代 iterable，最多预取 depth 项（解压 / 读盘与下游处理重叠）；异常在取出时重新抛出。"""
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def run():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        q.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            q.put((done, None))
+        except BaseException as e:   # 交给消费者
+            q.put((done, e))
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    try:
+        while True:
+            item, err = q.get()
+            if item is done:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+        # 解除生产者可能的阻塞
+        while t.is_alive():
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                t.join(0.05)
+
+def iter_zstd_pieces(path, read_size, offset=0):
+    """顺序解压 zstd 文件（可含多个帧），从解压后的第 offset 个字节开始。"""
+    zstandard = _zstd()
+    with open(path, 'rb') as raw, \
+            zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True) as fh:
+        while offset > 0:
+            skipped = fh.read(min(offset, read_size))
+            if not skipped:
+                return
+            offset -= len(skipped)
+        while True:
+            piece = fh.read(read_size)
+            if not piece:
+                return
+            yield piece
+
+class PieceReader(io.RawIOBase):
+    """把字节片段流包装成只读的二进制文件对象（供 pandas.read_csv 使用）。"""
+
+    def __init__(self, pieces):
+        self._pieces = iter(pieces)
+        self._buf = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._pieces)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        close = getattr(self._pieces, 'close', None)
+        if close:
+            close()
+        super().close()
+
+def open_binary(path, threads=4):
+    """以二进制文件对象读取（任意压缩格式，解压在后台线程中进行）。"""
+    from bgzf import iter_text_pieces   # bgzf 也引用本模块
+    return io.BufferedReader(PieceReader(iter_text_pieces(path, threads=threads)), 1 << 20)
+
+def open_text(path, threads=4):
+    """以文本方式读取（同 open_binary）。"""
+    return io.TextIOWrapper(open_binary(path, threads), newline='')
+
+# ----------------- 写出 -----------------
+def _bgzf_block(data, level):
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = c.compress(data) + c.flush()
+    if len(cdata) + 26 > 65536:   # 不可压缩的数据：拆成两块
+        half = len(data) // 2
+        return _bgzf_block(data[:half], level) + _bgzf_block(data[half:], level)
+    header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00' + struct.pack('<H', len(cdata) + 25)
+    return header + cdata + struct.pack('<II', zlib.crc32(data), len(data))
+
+def _bgzf_blocks(data, level):
+    return b''.join(_bgzf_block(data[i:i + BGZF_BLOCK_SIZE], level)
+                    for i in range(0, len(data), BGZF_BLOCK_SIZE))
+
+class BgzfWriter:
+    """BGZF 写出：满 BLOCKS_PER_TASK 块即提交线程池压缩，按提交顺序写入文件（在途任务数有上限）。"""
+
+    def __init__(self, fh, threads=4, level=6):
+        self._fh = fh
+        self.level = level
+        self.threads = max(1, threads)
+        self._pool = ThreadPoolExecutor(max_workers=self.threads)
+        self._pending = deque()
+        self._buf = []
+        self._size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._buf.append(data)
+        self._size += len(data)
+        if self._size >= BGZF_BLOCK_SIZE * BLOCKS_PER_TASK:
+            self._submit(full_only=True)
+            while len(self._pending) > 2 * self.threads:
+                self._fh.write(self._pending.popleft().result())
+
+    def _submit(self, full_only):
+        data = b''.join(self._buf)
+        cut = len(data) - len(data) % BGZF_BLOCK_SIZE if full_only else len(data)
+        if cut:
+            self._pending.append(self._pool.submit(_bgzf_blocks, data[:cut], self.level))
+        self._buf = [data[cut:]] if cut < len(data) else []
+        self._size = len(data) - cut
+
+    def flush(self):
+        """写出全部数据（末尾可能是不满的块），返回文件字节数。"""
+        self._submit(full_only=False)
+        while self._pending:
+            self._fh.write(self._pending.popleft().result())
+        self._fh.flush()
+        return self._fh.tell()
+
+    def close(self):
+        self.flush()
+        self._fh.write(BGZF_EOF)
+        self._pool.shutdown()
+        self._fh.close()
+
+class ZstdWriter:
+    """zstd 写出（libzstd 多线程压缩）；flush() 结束当前帧，之后的数据写入新帧。"""
+
+    def __init__(self, fh, threads=4, level=3):
+        zstandard = _zstd()
+        self._fh = fh
+        self._flush_frame = zstandard.COMPRESSOBJ_FLUSH_FINISH
+        self._cctx = zstandard.ZstdCompressor(level=level, threads=max(1, threads))
+        self._cobj = None
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self._cobj is None:
+            self._cobj = self._cctx.compressobj()
+        self._fh.write(self._cobj.compress(data))
+
+    def flush(self):
+        if self._cobj is not None:
+            self._fh.write(self._cobj.flush(self._flush_frame))
+            self._cobj = None
+        self._fh.flush()
+        return self._fh.tell()
+
+    def close(self):
+        self.flush()
+        self._fh.close()
+
+class TextWriter:
+    """不压缩的文本写出，接口与 BgzfWriter / ZstdWriter 相同（flush() 返回文件字节数）。"""
+
+    def __init__(self, fh):
+        self._fh = fh
+
+    def write(self, data):
+        self._fh.write(data)
+
+    def flush(self):
+        self._fh.flush()
+        return self._fh.tell()
+
+    def close(self):
+        self._fh.close()
+
+def open_text_writer(path, threads=4, resume=None):
+    """
+    按扩展名打开文本输出；resume 为字节数时把已有文件截断到该位置后继续追加。
+    返回的对象（TextWriter / BgzfWriter / ZstdWriter）有 write(str) / flush()（返回字节数）/ close()。
+    """
+    comp = output_compression(path)
+    if comp is None:
+        fh = open(path, 'w' if resume is None else 'r+', newline='')
+    else:
+        fh = open(path, 'wb' if resume is None else 'r+b')
+    if resume is not None:
+        fh.truncate(resume)
+        fh.seek(resume)
+    if comp == 'bgzf':
+        return BgzfWriter(fh, threads)
+    if comp == 'zstd':
+        return ZstdWriter(fh, threads)
+    return TextWriter(fh)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+conservation.py
+
+03_ac_wac_irr.py 的保育组合选择（--select-k）：IRR_norm01 只给出单棵古树的排序，
+这里回答“繁育哪 k 棵古树，能收集到最多（按 w 加权）尚未被栽培材料覆盖的稀有等位”。
+
+  - 等位集合：与 IRR 相同的位点（已对齐、anc_count ≤ max_occ、w > 0）中未被 --irr-coverage 覆盖的，
+    每棵古树的集合 = 它携带的这些等位；权重 w = -log10(max(fa_full, eps))，与 wAC / IRR 一致
+  - 扫描时每个位点只保存 w 与各古树的携带位（np.packbits，每位点 ⌈n_anc/8⌉ 字节）
+  - 选择前按 w 排序、把相同 w 的等位排在一起，每个 w 类别单独对齐到 64 位字：
+    每个字内的等位权重相同，古树 t 的边际增益 = popcount(集合_t AND NOT 已覆盖) 逐字之和 @ 每字的 w
+  - 贪心：每步选边际加权增益最大的古树；覆盖函数是次模的，边际增益只会变小，
+    因此用优先队列做惰性求值（只重算堆顶，重算后仍不小于下一个上界即可选中）
+"""
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from coverage_matrix import class_bitsets, popcount
+
+SELECTION_COLUMNS = ['rank', 'id', 'group', 'gain_w', 'gain_alleles', 'cum_w', 'cum_frac_w',
+                     'cum_alleles', 'cum_frac_alleles']
+
+class RareAlleleSets:
+    """逐古树的未覆盖稀有等位集合（逐 chunk 累加，可按染色体任务合并、可存入断点状态）。"""
+
+    def __init__(self, ancient_ids):
+        self.ids = list(ancient_ids)
+        self.bits = []       # 每个chunk：(位点数, ⌈n_anc/8⌉) uint8
+        self.weights = []    # 每个chunk：(位点数,) float64
+
+    def add(self, A, w_v, cover_v, site_mask):
+        """参数同 IrrAccumulator.add()：只保留 site_mask 内、未覆盖、w > 0 且至少一棵古树携带的等位。"""
+        if A.shape[1] != len(self.ids):
+            raise ValueError(f"genotype chunk has {A.shape[1]} ancient columns, expected {len(self.ids)}")
+        w = np.asarray(w_v, dtype=np.float64)
+        keep = site_mask & (np.asarray(cover_v, dtype=np.float64) == 0) & (w > 0)
+        rows = np.flatnonzero(keep)
+        if len(rows) == 0:
+            return
+        carr = A[rows] > 0
+        held = carr.any(axis=1)
+        if not held.any():
+            return
+        self.bits.append(np.packbits(carr[held], axis=1))
+        self.weights.append(w[rows][held])
+
+    def merge(self, other):
+        if other.ids != self.ids:
+            raise ValueError("cannot merge allele sets over different ancient IDs")
+        self.bits += other.bits
+        self.weights += other.weights
+
+    def compact(self):
+        """把逐 chunk 的数组并成一块（断点状态中只存一块，避免每个chunk一个小数组）。"""
+        if len(self.bits) > 1:
+            self.bits = [np.concatenate(self.bits)]
+            self.weights = [np.concatenate(self.weights)]
+
+    def __getstate__(self):
+        self.compact()
+        return dict(self.__dict__)
+
+    def __len__(self):
+        return sum(len(w) for w in self.weights)
+
+    def bitsets(self):
+        """
+        (B, w_word)：B 为每棵古树的位集 (n_anc, n_words) uint64，w_word 为每个字的等位权重
+        （按 w 分类、每类对齐到 64 位；补齐的位不属于任何古树）。
+        """
+        if not self.weights:
+            return class_bitsets(np.zeros((0, 0), dtype=np.uint8), np.zeros(0), len(self.ids))
+        return class_bitsets(np.concatenate(self.bits), np.concatenate(self.weights), len(self.ids))
+
+def greedy_select(sets, k):
+    """
+    惰性贪心选出至多 k 棵古树（边际增益为 0 时提前停止）。
+    返回 [(古树下标, 加权增益, 新增等位数)]，以及全部等位的 w 总和与等位数（任一古树携带的并集）。
+    """
+    B, w_word = sets.bitsets()
+    n_anc = len(sets.ids)
+    covered = np.zeros(B.shape[1], dtype=np.uint64)
+    union = np.bitwise_or.reduce(B, axis=0) if n_anc else covered
+    total_w = float(popcount(union).astype(np.float64) @ w_word)
+    total_n = int(popcount(union).sum())
+
+    def gain(t):
+        c = popcount(B[t] & ~covered)
+        return float(c.astype(np.float64) @ w_word), int(c.sum())
+
+    # 堆元素：(-上界, 古树下标, 上界计算时已选的数目, 新增等位数)；相同增益时按古树在名单中的顺序
+    heap = [(-g, t, 0, n) for t, (g, n) in enumerate(map(gain, range(n_anc)))]
+    heapq.heapify(heap)
+    picks = []
+    while heap and len(picks) < k:
+        neg, t, stamp, n = heapq.heappop(heap)
+        if stamp != len(picks):
+            g, n = gain(t)
+            heapq.heappush(heap, (-g, t, len(picks), n))
+            continue
+        if -neg <= 0:
+            break
+        picks.append((t, -neg, n))
+        covered |= B[t]
+    return picks, total_w, total_n
+
+def selection_table(sets, k, anc_nat_ids=(), anc_cult_ids=()):
+    """按选择顺序的表：每一步的边际增益与累计覆盖（占全部古树携带的未覆盖稀有等位的比例）。"""
+    picks, total_w, total_n = greedy_select(sets, k)
+    rows = []
+    cum_w, cum_n = 0.0, 0
+    for rank, (t, g, n) in enumerate(picks, 1):
+        cum_w += g
+        cum_n += n
+        tid = sets.ids[t]
+        grp = 'anc_nat26' if tid in anc_nat_ids else ('anc_cult38' if tid in anc_cult_ids else 'anc_other')
+        rows.append({'rank': rank, 'id': tid, 'group': grp, 'gain_w': g, 'gain_alleles': n,
+                     'cum_w': cum_w, 'cum_frac_w': cum_w / total_w if total_w > 0 else np.nan,
+                     'cum_alleles': cum_n, 'cum_frac_alleles': cum_n / total_n if total_n else np.nan})
+    return pd.DataFrame(rows, columns=SELECTION_COLUMNS), total_w, total_n
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+coverage_matrix.py
+
+03_ac_wac_irr.py 的全组合覆盖矩阵（--coverage-matrix）：
+不再只评估手工挑选的 target×cover 组合，而是对所有群体（allele table 中的每个 in_* 列）、
+群体并集（--coverage-union，如 cult+wild）以及可选的逐样本携带状态（--coverage-samples，仅 --fused），
+逐频率分箱给出 “target 中出现的等位有多少也在 cover 中出现” 的计数与 w 加权和。
+
+扫描时逐位点只保存分箱编码、w 与各 target 的出现位（np.packbits，每位点 ⌈n_targets/8⌉ 字节），
+与 conservation.py 相同：table() 时每个分箱内按 w 排序、相同 w 的位点归为一类，每类单独对齐到 64 位字，
+得到每个 target 的位集与每个字的 w。于是计数 = popcount(target 位集 AND cover 位集) 逐字之和，
+w 加权和 = 同一组逐字 popcount @ 每字的 w（不再另做稠密矩阵乘法）。
+累加器可逐 chunk 累加、按任务合并（位点接在后面）。
+"""
+
+import numpy as np
+import pandas as pd
+
+from acwac import BIN_LABELS
+
+# ----------------- 位集 -----------------
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        """逐元素置位数（uint64 数组）。"""
+        return np.bitwise_count(words)
+else:
+    _POP8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        """逐元素置位数（uint64 数组；旧版 numpy 用 8 位查表）。"""
+        b = _POP8[np.ascontiguousarray(words).view(np.uint8)]
+        return b.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint64)
+
+def pack_columns(flags):
+    """布尔矩阵 (n_sites, k) -> 每列一个位集 (k, n_words) uint64（末尾补 0）。"""
+    flags = np.asarray(flags, dtype=bool)
+    n, k = flags.shape
+    n_bytes = -(-n // 64) * 8
+    packed = np.zeros((k, n_bytes), dtype=np.uint8)
+    if n:
+        packed[:, :-(-n // 8)] = np.packbits(flags.T, axis=1)
+    return packed.view(np.uint64)
+
+def class_bitsets(bits, w, n_cols):
+    """
+    逐位点打包的标志 bits (n_sites, ⌈n_cols/8⌉) uint8 与权重 w -> (B, w_word)：B 为每列的位集 (n_cols, n_words) uint64，
+    w_word 为每个字的权重（位点按 w 分类、每类对齐到 64 位；补齐的位不属于任何列）。
+    不逐类循环：类内第 r 个位点落在该类首字节之后的第 r//8 个字节、第 r%8 位，同一字节的位点用 reduceat 一次合并。
+    """
+    n = len(w)
+    if n == 0:
+        return np.zeros((n_cols, 0), dtype=np.uint64), np.zeros(0)
+    order = np.argsort(w, kind='stable')
+    w_sorted = w[order]
+    starts = np.flatnonzero(np.r_[True, w_sorted[1:] != w_sorted[:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    n_words = -(-sizes // 64)
+    first_word = np.cumsum(n_words) - n_words
+    cls = np.repeat(np.arange(len(starts)), sizes)
+    rank = np.arange(n) - starts[cls]
+    flags = np.unpackbits(bits[order], axis=1, count=n_cols)
+    lead = np.flatnonzero(rank % 8 == 0)   # 每个字节的第一个位点
+    shift = (7 - rank % 8).astype(np.uint8)[:, None]
+    packed = np.add.reduceat(flags << shift, lead, axis=0, dtype=np.uint8)
+    out = np.zeros((int(n_words.sum()) * 8, n_cols), dtype=np.uint8)
+    out[first_word[cls[lead]] * 8 + rank[lead] // 8] = packed
+    return np.ascontiguousarray(out.T).view(np.uint64), np.repeat(w_sorted[starts], n_words)
+
+# ----------------- 覆盖矩阵 -----------------
+def parse_unions(values, labels):
+    """'cult+wild' 形式的群体并集 -> [(名称, [成员下标])]；成员必须是已有群体标签。"""
+    out = []
+    for v in values or []:
+        members = [m.strip() for m in v.split('+') if m.strip()]
+        missing = [m for m in members if m not in labels]
+        if len(members) < 2 or missing:
+            raise SystemExit(f"[ERROR] bad --coverage-union '{v}': needs two or more of {', '.join(labels)}")
+        out.append(('+'.join(members), [labels.index(m) for m in members]))
+    return out
+
+def group_labels(columns):
+    """allele table 的 in_* 列对应的群体标签（in_cultwild 是 add_site_columns 派生的并集，不计入）。"""
+    return [c[3:] for c in columns if c.startswith('in_') and c != 'in_cultwild']
+
+class CoverageMatrix:
+    """
+    逐分箱的所有 target×cover 的 (n_target, n_both, w_target, w_both)。
+    covers = 群体 + 并集；targets = covers + 可选的逐样本携带者（samples），即 covers 是 targets 的前几列。
+    """
+
+    def __init__(self, labels, unions=(), samples=()):
+        self.labels = list(labels)
+        self.unions = parse_unions(unions, self.labels)
+        self.covers = self.labels + [name for name, _ in self.unions]
+        self.samples = list(samples)
+        self.targets = self.covers + self.samples
+        self.bits = []      # 每个chunk：(位点数, ⌈n_targets/8⌉) uint8
+        self.weights = []   # 每个chunk：(位点数,) float64
+        self.bins = []      # 每个chunk：(位点数,) int8（BIN_LABELS 下标）
+
+    def _cover_flags(self, df):
+        F = np.column_stack([df[f'in_{g}'].to_numpy() == 1 for g in self.labels]) if len(df) else \
+            np.zeros((0, len(self.labels)), dtype=bool)
+        if self.unions:
+            F = np.column_stack([F] + [F[:, idx].any(axis=1) for _, idx in self.unions])
+        return F
+
+    def add(self, df, carriers=None):
+        """
+        df：带 add_site_columns() 各列（bin / w）与 in_* 列的 chunk；
+        carriers：逐样本携带 ALT 的布尔矩阵 (n_sites, n_samples)，构造时给了 samples 才需要。
+        只保留至少出现在一个 target 中的位点。
+        """
+        if len(df) == 0:
+            return
+        C = self._cover_flags(df)
+        T = C if not self.samples else np.column_stack([C, np.asarray(carriers, dtype=bool)])
+        rows = np.flatnonzero(T.any(axis=1))
+        if len(rows) == 0:
+            return
+        self.bits.append(np.packbits(T[rows], axis=1))
+        self.weights.append(df['w'].to_numpy(dtype=float)[rows])
+        self.bins.append(pd.Categorical(df['bin'], categories=BIN_LABELS).codes[rows].astype(np.int8))
+
+    def merge(self, other):
+        """并入另一个（同一组 target/cover 的）累加器。"""
+        if other.targets != self.targets or other.covers != self.covers:
+            raise ValueError("cannot merge coverage matrices over different groups")
+        self.bits += other.bits
+        self.weights += other.weights
+        self.bins += other.bins
+
+    def compact(self):
+        """把逐 chunk 的数组并成一块。"""
+        if len(self.weights) > 1:
+            self.bits = [np.concatenate(self.bits)]
+            self.weights = [np.concatenate(self.weights)]
+            self.bins = [np.concatenate(self.bins)]
+
+    def __getstate__(self):
+        self.compact()
+        return dict(self.__dict__)
+
+    def counts(self):
+        """逐分箱的 (n_target (n_bins, nt), w_target, n_both (n_bins, nt, nc), w_both)，由各分箱的位集得出。"""
+        nb, nt, nc = len(BIN_LABELS), len(self.targets), len(self.covers)
+        n_target = np.zeros((nb, nt), dtype=np.int64)
+        w_target = np.zeros((nb, nt))
+        n_both = np.zeros((nb, nt, nc), dtype=np.int64)
+        w_both = np.zeros((nb, nt, nc))
+        self.compact()
+        if not self.weights:
+            return n_target, w_target, n_both, w_both
+        bits, w, bins = self.bits[0], self.weights[0], self.bins[0]
+        for b in np.unique(bins):
+            rows = np.flatnonzero(bins == b)
+            B, w_word = class_bitsets(bits[rows], w[rows], nt)
+            c = popcount(B).astype(np.int64)
+            n_target[b] = c.sum(axis=1)
+            w_target[b] = c @ w_word
+            for t in range(nt):
+                c = popcount(B[t] & B[:nc]).astype(np.int64)
+                n_both[b, t] = c.sum(axis=1)
+                w_both[b, t] = c @ w_word
+        return n_target, w_target, n_both, w_both
+
+    def table(self):
+        """长表：target, cover, bin（overall 为空）, n_target, n_covered, AC, w_target, w_covered, wAC。"""
+        n_target, w_target, n_both, w_both = self.counts()
+        bin_order = sorted(range(len(BIN_LABELS)), key=lambda i: BIN_LABELS[i])
+        n_t = np.concatenate([n_target.sum(axis=0, keepdims=True), n_target[bin_order]])
+        w_t = np.concatenate([w_target.sum(axis=0, keepdims=True), w_target[bin_order]])
+        n_b = np.concatenate([n_both.sum(axis=0, keepdims=True), n_both[bin_order]])
+        w_b = np.concatenate([w_both.sum(axis=0, keepdims=True), w_both[bin_order]])
+        bins = [None] + [BIN_LABELS[i] for i in bin_order]
+
+        rows = []
+        for ti, target in enumerate(self.targets):
+            for k, b in enumerate(bins):
+                if n_t[k, ti] == 0 and b is not None:
+                    continue
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ac = n_b[k, ti] / n_t[k, ti]
+                    wac = np.where(w_t[k, ti] > 0, w_b[k, ti] / w_t[k, ti], np.nan)
+                for ci, cover in enumerate(self.covers):
+                    rows.append({'target': target, 'cover': cover, 'bin': b,
+                                 'n_target': int(n_t[k, ti]), 'n_covered': int(n_b[k, ti, ci]), 'AC': ac[ci],
+                                 'w_target': w_t[k, ti], 'w_covered': w_b[k, ti, ci], 'wAC': float(wac[ci])})
+        return pd.DataFrame(rows, columns=['target', 'cover', 'bin', 'n_target', 'n_covered', 'AC',
+                                           'w_target', 'w_covered', 'wAC'])
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+genetic_load.py
+
+05_genetic_load.py 的逐个体遗传负荷计数：把解码后的基因型矩阵与逐位点注释（后果类别、SIFT 分数、祖先等位）
+按 (CHR, POS) 连接，一次统计全部样本 × 全部类别的衍生纯合 / 杂合等位数。
+
+  - 注释表（制表符分隔、带表头）：CHR（或 CHROM）、POS、后果列（默认 consequence；
+    可为 snpEff / VEP 的 synonymous_variant&... 或 SIFT4G 的 VARIANT_TYPE），可选 SIFT 分数列（默认 SIFT_SCORE）
+    与祖先等位列（碱基）；同一位点多行（多个转录本）时合并后果、SIFT 取最小值
+  - 后果按 & , | ; 空白 切分为词，与类别的词逐个精确比较（SIFT4G 的 SYNONYMOUS 不会匹配 NONSYNONYMOUS）；
+    一个位点可同时属于多个类别（同 grep 各类别分别统计）
+  - 祖先等位：REF 为祖先的位点清单 / ALT 为祖先的位点清单（CHROM<TAB>POS，同 vcftools --positions），
+    或注释表中的祖先等位列；没有祖先信息的位点不计入
+  - 只计二倍体、等位均为 0/1 的调用（gt_codec.diploid_code()，同原脚本只数 0/1、1/1、0/0）：单倍体调用、
+    含其它等位（2/2、0/2……）或缺失等位的调用都当作未调用；
+    衍生等位数：REF 为祖先时 = ALT 计数，ALT 为祖先时 = 2 - ALT 计数
+
+类别 × 样本 的计数由 成员矩阵(类别×位点) @ 指示矩阵(位点×样本) 一次得到，与样本数无关地只扫描一遍输入。
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from gt_codec import MISSING
+from perf_metrics import timed
+
+# 默认类别：名字 -> 后果词（snpEff / VEP 与 SIFT4G VARIANT_TYPE 的写法）
+DEFAULT_CLASSES = {
+    'synonymous': ('synonymous_variant', 'SYNONYMOUS'),
+    'missense':   ('missense_variant', 'NONSYNONYMOUS'),
+    'lof':        ('start_lost', 'stop_gained', 'stop_lost', 'START-LOST', 'STOP-GAIN', 'STOP-LOSS'),
+}
+# 由 missense 与 SIFT 分数派生的类别
+SIFT_CLASSES = ('deleterious', 'tolerated')
+
+OUT_COLUMNS = ['sample', 'class', 'n_sites', 'n_called', 'het', 'hom_derived', 'derived_alleles']
+
+_TOKENS = re.compile(r'[&,|;\s]+')
+
+def parse_class_defs(values):
+    """--class name=term1,term2 形式的附加类别。"""
+    out = {}
+    for v in values or []:
+        name, sep, terms = v.partition('=')
+        terms = tuple(t for t in terms.split(',') if t)
+        if not sep or not name or not terms:
+            raise SystemExit(f"[ERROR] --class expects name=term[,term...]: {v}")
+        out[name] = terms
+    return out
+
+def _read_positions(path):
+    """CHROM<TAB>POS 位点清单（可带 # 注释或表头行）-> MultiIndex。"""
+    df = pd.read_csv(path, sep=r'\s+', header=None, usecols=[0, 1], comment='#', dtype=str)
+    df = df[df[1].str.isdigit()]
+    return pd.MultiIndex.from_arrays([df[0].to_numpy(), df[1].astype(np.int64).to_numpy()])
+
+class LoadAnnotation:
+    """
+    逐位点注释：index 为 (CHR, POS) 的 MultiIndex，member 为 (位点数, 类别数) 的布尔成员矩阵，
+    alt_ancestral 为 ALT 是否为祖先等位（没有祖先信息的位点已去掉）。
+    """
+
+    def __init__(self, path, classes=None, consequence_col='consequence', sift_col='SIFT_SCORE',
+                 sift_cutoff=0.05, ancestral_col=None, ref_ancestor=None, alt_ancestor=None):
+        classes = dict(DEFAULT_CLASSES if classes is None else classes)
+        ann = pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False)
+        ann = ann.rename(columns={'CHROM': 'CHR', '#CHROM': 'CHR', 'REF_ALLELE': 'REF', 'ALT_ALLELE': 'ALT'})
+        for c in ('CHR', 'POS', consequence_col):
+            if c not in ann.columns:
+                raise SystemExit(f"[ERROR] annotation table {path} lacks column '{c}'")
+        for c in ([ancestral_col, 'REF', 'ALT'] if ancestral_col else []):
+            if c not in ann.columns:
+                raise SystemExit(f"[ERROR] annotation table {path} lacks column '{c}' (needed by --ancestral-col)")
+        if not ancestral_col and not (ref_ancestor or alt_ancestor):
+            raise SystemExit("[ERROR] give --ref-ancestor / --alt-ancestor lists or --ancestral-col")
+        ann['POS'] = ann['POS'].astype(np.int64)
+        has_sift = sift_col in ann.columns
+        sift = pd.to_numeric(ann[sift_col], errors='coerce') if has_sift else None
+
+        # 多转录本：同一位点的后果合并，SIFT 取最小值（最有害）
+        key = ['CHR', 'POS']
+        agg = {consequence_col: '&'.join}
+        extra = [c for c in ('REF', 'ALT', ancestral_col) if c and c in ann.columns]
+        agg.update({c: 'first' for c in extra})
+        if has_sift:
+            ann['_sift'] = sift
+            agg['_sift'] = 'min'
+        site = ann.groupby(key, sort=False).agg(agg).reset_index()
+
+        # 后果 -> 类别成员（只对不同的后果字符串切词）
+        codes, uniques = pd.factorize(site[consequence_col])
+        names = list(classes)
+        lut = np.zeros((len(uniques), len(names)), dtype=bool)
+        for i, text in enumerate(uniques):
+            toks = set(_TOKENS.split(text))
+            lut[i] = [bool(toks.intersection(classes[n])) for n in names]
+        member = lut[codes]
+        if has_sift and 'missense' in names:
+            mis = member[:, names.index('missense')]
+            s = site['_sift'].to_numpy(np.float64)
+            member = np.column_stack([member, mis & (s < sift_cutoff), mis & (s >= sift_cutoff)])
+            names += list(SIFT_CLASSES)
+
+        # 祖先等位
+        idx = pd.MultiIndex.from_arrays([site['CHR'].to_numpy(), site['POS'].to_numpy()])
+        alt_anc = np.full(len(site), np.nan)
+        if ancestral_col:
+            aa = site[ancestral_col].str.upper().to_numpy()
+            alt_anc[aa == site['REF'].str.upper().to_numpy()] = 0
+            alt_anc[aa == site['ALT'].str.upper().to_numpy()] = 1
+        if ref_ancestor:
+            alt_anc[idx.isin(_read_positions(ref_ancestor))] = 0
+        if alt_ancestor:
+            alt_anc[idx.isin(_read_positions(alt_ancestor))] = 1
+        keep = ~np.isnan(alt_anc) & member.any(axis=1)
+
+        self.classes = names
+        self.n_total = len(site)
+        self.n_unpolarized = int((np.isnan(alt_anc) & member.any(axis=1)).sum())
+        site, member, alt_anc = site[keep], member[keep], alt_anc[keep].astype(bool)
+        self.index = pd.MultiIndex.from_arrays([site['CHR'].to_numpy(), site['POS'].to_numpy()])
+        self.ref = site['REF'].to_numpy() if 'REF' in site.columns else None
+        self.alt = site['ALT'].to_numpy() if 'ALT' in site.columns else None
+        self.member = member
+        self.alt_ancestral = alt_anc
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, info):
+        """一个chunk的 (行号, 注释行号)：只保留有注释（且 REF/ALT 一致，若注释表给出）的位点。"""
+        pos = pd.to_numeric(info['POS']).to_numpy(np.int64)
+        ai = self.index.get_indexer(pd.MultiIndex.from_arrays([info['CHR'].astype(str).to_numpy(), pos]))
+        rows = np.flatnonzero(ai >= 0)
+        ai = ai[rows]
+        if self.ref is not None and self.alt is not None:
+            ok = (info['REF'].to_numpy()[rows] == self.ref[ai]) & (info['ALT'].to_numpy()[rows] == self.alt[ai])
+            rows, ai = rows[ok], ai[ok]
+        return rows, ai
+
+def load_counts(info, gtm, ann):
+    """
+    一个chunk的计数：(类别数, 4, 样本数) 的 int64 数组，依次为 位点数（该类别位点，含缺失）/ 调用数 / 杂合 / 衍生纯合；
+    gtm 须由 diploid_code() 解码（MISSING 为非二倍体 0/1 调用）；没有注释位点时返回 None。
+    """
+    with timed('load_join'):
+        rows, ai = ann.lookup(info)
+    if not len(rows):
+        return None
+    with timed('load_count'):
+        G = gtm[rows]
+        called = G != MISSING
+        derived = np.where(ann.alt_ancestral[ai][:, None], 2 - G, G)
+        het = called & (derived == 1)
+        hom = called & (derived == 2)
+        M = ann.member[ai].T.astype(np.float32)                   # 类别 × 位点
+        out = np.empty((M.shape[0], 4, G.shape[1]), dtype=np.int64)
+        out[:, 0] = M.sum(axis=1, dtype=np.int64)[:, None]
+        # float32 的矩阵乘在每块 ≤ 2^24 个位点内是精确的整数
+        for k, X in enumerate((called, het, hom), 1):
+            out[:, k] = np.rint(M @ X.astype(np.float32)).astype(np.int64)
+    return out
+
+def load_table(totals, classes, samples):
+    """累计计数 -> 长表（sample × class 一行）。"""
+    n_cls, _, n_s = totals.shape
+    t = totals.transpose(2, 0, 1).reshape(n_s * n_cls, 4)
+    het, hom = t[:, 2], t[:, 3]
+    return pd.DataFrame({
+        'sample': np.repeat(np.asarray(samples, dtype=object), n_cls),
+        'class': np.tile(np.asarray(classes, dtype=object), n_s),
+        'n_sites': t[:, 0], 'n_called': t[:, 1], 'het': het, 'hom_derived': hom,
+        'derived_alleles': het + 2 * hom,
+    }, columns=OUT_COLUMNS)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+group_cache.py
+
+02_allele_count.py 的逐群体结果缓存（--group-cache DIR）。修改某个子群名单（如 anc_Min43.list）或新增来源群体后重跑时，
+只重新统计成员有变化的群体，不必对全部群体重新扫描全基因组。
+
+  - 缓存键：输入基因型的指纹（checkpoint.input_fingerprint：大小、mtime、inode、首尾 1 MiB 的 sha1）
+    + 样本顺序 + 区段（--region），对应目录 DIR/<键的 sha1 前 16 位>/；输入文件变了（包括重新 call 后大小不变的
+    GT 表、重建的 gt.i8）自然落到新目录。指纹同时存入 meta.json，复用任何 <hash>.i32 前先核对，不符时整个目录重算
+  - 每个群体的结果以其成员名单（排序后的样本ID）的 sha1 命名：<hash>.i32 为 (位点数, 3) 的 int32 矩阵
+    （AC / AN / carriers，C 顺序）。与群体标签无关：改名、在清单中调换顺序都不必重算
+  - sites.tsv：位点键列 CHR/POS/REF/ALT（与矩阵的行一一对应）；meta.json：位点数与各 hash 的标签 / 成员数
+  - 缺失的群体在一次扫描中统计，只解码这些群体的样本列（gt_io 的 cols）。先写 .tmp，扫描完成后再 os.replace，
+    中途被杀不会留下不完整的缓存
+  - 组装：按 chunksize 逐块读取 sites.tsv 与各群体矩阵（np.memmap），交给 allele_stats 组装，
+    输出与不使用缓存时逐字节一致
+不再使用的 <hash>.i32 可以直接删除（下次用到时重算）。
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from allele_stats import GroupSet, allele_table_from_stats, table_groups
+from checkpoint import input_fingerprint
+from chunk_pool import imap_chunks
+from gt_io import iter_positioned
+from perf_metrics import mark_chunk, timed
+
+CACHE_VERSION = 2
+SITE_COLS = ['CHR', 'POS', 'REF', 'ALT']
+
+def member_hash(samples):
+    """群体成员名单（与顺序无关）的 sha1 前 16 位。"""
+    return hashlib.sha1('\n'.join(sorted(samples)).encode()).hexdigest()[:16]
+
+def _stats_chunk(chunk_idx, info, G, groups, keep_info):
+    """--workers 模式下在子进程中执行：一个chunk的 (位点键列或 None, AC, AN, carriers)。"""
+    with timed('group_stats'):
+        AC, AN, N = groups.stats(G)
+    return (info[SITE_COLS] if keep_info else None), AC, AN, N
+
+class GroupCache:
+    """一个输入（+ 样本顺序 + 区段）的逐群体结果缓存目录。"""
+
+    def __init__(self, root, input_path, samples, regions=None):
+        self.samples = list(samples)
+        fingerprint = input_fingerprint(input_path)
+        key = {'version': CACHE_VERSION, 'input': fingerprint, 'samples': self.samples, 'regions': regions}
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+        self.dir = os.path.join(root, digest)
+        os.makedirs(self.dir, exist_ok=True)
+        self.meta_path = os.path.join(self.dir, 'meta.json')
+        self.sites_path = os.path.join(self.dir, 'sites.tsv')
+        self.meta = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta.get('fingerprint') != fingerprint:
+                sys.stderr.write(f"[WARN] group cache {self.dir} was built from a different input; recomputing all groups\n")
+                self.meta = None
+        if self.meta is None:
+            self.meta = {'input': input_path, 'fingerprint': fingerprint, 'regions': regions,
+                         'n_sites': None, 'groups': {}}
+
+    def _path(self, h):
+        return os.path.join(self.dir, f"{h}.i32")
+
+    def hashes(self, groups):
+        """{标签: 成员 hash}，只含等位元素表中输出的群体。"""
+        return {g: member_hash(self.samples[c - 4] for c in groups.cols[g]) for g in table_groups(groups)}
+
+    def has_sites(self):
+        return self.meta['n_sites'] is not None and os.path.exists(self.sites_path)
+
+    def missing(self, groups):
+        """需要重新统计的群体（按列顺序）：没有缓存的成员 hash；没有位点键列时为全部群体。"""
+        if not self.has_sites():
+            return table_groups(groups)
+        return [g for g, h in self.hashes(groups).items() if not os.path.exists(self._path(h))]
+
+    def fill(self, scans, groups, labels, chunksize, workers=1):
+        """一次扫描统计 labels 中的群体（只解码它们的样本列）并写入缓存；没有位点键列时一并写出。"""
+        hashes = self.hashes(groups)
+        todo = {}
+        for g in labels:
+            todo.setdefault(hashes[g], g)   # 成员相同的群体只算一次
+        cols = sorted({c for g in todo.values() for c in groups.cols[g]})
+        at = {c: i for i, c in enumerate(cols)}
+        sub = GroupSet(max(1, len(cols)), [(g, [4 + at[c] for c in groups.cols[g]]) for g in todo.values()])
+        scan_cols = [c - 4 for c in cols] or [0]   # 全部为空群体时仍需读出位点
+        keep_info = not self.has_sites()
+
+        tmp = {h: open(self._path(h) + '.tmp', 'wb') for h in todo}
+        sites = open(self.sites_path + '.tmp', 'w', newline='') if keep_info else None
+        n_sites = 0
+        chunk_idx = 0
+        try:
+            for scan in scans:
+                if workers > 1:
+                    chunks = (res for _, _, res in imap_chunks(scan, chunksize, _stats_chunk, args=(sub, keep_info),
+                                                               workers=workers, cols=scan_cols))
+                else:
+                    chunks = (_stats_chunk(0, info, G, sub, keep_info)
+                              for _, _, info, G in iter_positioned(scan, chunksize, cols=scan_cols))
+                for info, AC, AN, N in chunks:
+                    chunk_idx += 1
+                    nrow = len(AC)
+                    sys.stderr.write(f"[INFO] Group cache: chunk #{chunk_idx}, rows={nrow}\n")
+                    with timed('write'):
+                        for j, h in enumerate(todo):
+                            S = np.column_stack([AC[:, j], AN[:, j], N[:, j]]).astype(np.int32)
+                            tmp[h].write(S.tobytes())
+                        if sites is not None and nrow:
+                            sites.write(info.to_csv(sep='\t', index=False, header=(n_sites == 0)))
+                    n_sites += nrow
+                    mark_chunk(chunk_idx, nrow, 'group_cache')
+        finally:
+            for fh in tmp.values():
+                fh.close()
+            if sites is not None:
+                sites.close()
+
+        if not keep_info and n_sites != self.meta['n_sites']:
+            raise SystemExit(f"[ERROR] group cache {self.dir} holds {self.meta['n_sites']} sites but the scan read "
+                             f"{n_sites}; delete the cache directory and rerun")
+        if sites is not None:
+            if n_sites == 0:
+                with open(self.sites_path + '.tmp', 'w') as f:
+                    f.write('\t'.join(SITE_COLS) + '\n')
+            os.replace(self.sites_path + '.tmp', self.sites_path)
+            self.meta['n_sites'] = n_sites
+        for h, g in todo.items():
+            os.replace(self._path(h) + '.tmp', self._path(h))
+            self.meta['groups'][h] = {'label': g, 'n_members': len(groups.cols[g])}
+        with open(self.meta_path + '.tmp', 'w') as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+
+    def iter_tables(self, groups, chunksize):
+        """按 chunksize 逐块产出等位元素表（DataFrame）；全部输出群体须已在缓存中。"""
+        hashes = self.hashes(groups)
+        n = self.meta['n_sites']
+        mats = {h: (np.memmap(self._path(h), dtype=np.int32, mode='r', shape=(n, 3)) if n
+                    else np.zeros((0, 3), dtype=np.int32)) for h in set(hashes.values())}
+        start = 0
+        for info in pd.read_csv(self.sites_path, sep='\t', dtype=str, keep_default_na=False, chunksize=chunksize):
+            stop = start + len(info)
+            with timed('cache_read'):
+                S = np.zeros((3, len(info), len(groups.labels)))
+                for g, h in hashes.items():
+                    S[:, :, groups.index[g]] = mats[h][start:stop].T
+            yield allele_table_from_stats(info, S[0], S[1], S[2], groups)
+            start = stop
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+gt_codec.py
+
+02_allele_count.py / 03_ac_wac_irr.py 共用的 GT 解码工具。
+
+把一个 chunk 的 GT 字符串（0/0、0|1、./.、0/.、单等位 1 等）解码为 int8 矩阵：
+  0 / 1 / 2 = ALT 等位计数
+  MISSING(-1) = 缺失（对应旧版 alt_count() 返回的 NaN）
+
+实现方式：先对整个 chunk 的 GT 字符串做 factorize，只对“不同的”GT 字符串调用
+一次 alt_count() 得到查找表（LUT），再用整数编码一次性映射回矩阵。
+一个 chunk 里不同的 GT 字符串通常只有十几种，因此 Python 层的调用次数与样本数、位点数无关。
+"""
+
+import numpy as np
+import pandas as pd
+
+# int8 矩阵中的缺失哨兵值
+MISSING = -1
+
+def alt_count(gt: str):
+    """
+    将GT转换为ALT=1的等位计数：
+      0/0, 0|0 -> 0
+      0/1, 1/0, 0|1, 1|0 -> 1
+      1/1, 1|1 -> 2
+    含缺失等位（任一为 '.'）或完全缺失（'.', './.', '.|.'） -> np.nan（整个位点当缺失，不计入AN）
+    兼容单等位字符串：'0' -> 0, '1' -> 1
+
+    这是逐个GT的“参考语义”；decode_gt() 用它为每个不同的GT字符串建查找表。
+    """
+    if gt is None:
+        return np.nan
+    gt = str(gt).strip()
+    if gt == '' or gt == '.' or gt == './.' or gt == '.|.':
+        return np.nan
+
+    gt = gt.replace('|', '/')
+    parts = gt.split('/')
+
+    # 单等位（少见；当作haploid或异常编码）
+    if len(parts) == 1:
+        a = parts[0]
+        if a == '.':
+            return np.nan
+        return 1.0 if a == '1' else 0.0
+
+    a, b = parts[0], parts[1]
+    # 任一等位缺失 -> 整个基因型视作缺失
+    if a == '.' or b == '.':
+        return np.nan
+
+    c = 0
+    if a == '1':
+        c += 1
+    if b == '1':
+        c += 1
+    return float(c)
+
+def alt_code(gt) -> int:
+    """alt_count() 的 int8 版本：NaN -> MISSING。"""
+    v = alt_count(gt)
+    return MISSING if np.isnan(v) else int(v)
+
+def diploid_code(gt) -> int:
+    """
+    只认二倍体、等位均为 0/1 的调用（0/0、0/1、1/0、1/1 及相应的 |）：返回 ALT 计数；
+    其它一律为 MISSING——单倍体调用、含其它等位（2/2、0/2……）或缺失等位的调用。
+    05_genetic_load.py 用它代替 alt_code()：alt_count() 把 2/2 计为 0、单等位 0 计为 0，
+    在 ALT 为祖先的位点上会被当成衍生纯合。
+    """
+    if gt is None or (isinstance(gt, float) and np.isnan(gt)):
+        return MISSING
+    parts = str(gt).strip().replace('|', '/').split('/')
+    if len(parts) != 2 or parts[0] not in ('0', '1') or parts[1] not in ('0', '1'):
+        return MISSING
+    return (parts[0] == '1') + (parts[1] == '1')
+
+def decode_gt(gts, code=alt_code) -> np.ndarray:
+    """
+    将 GT 字符串矩阵（DataFrame 或二维数组；行=位点，列=样本）解码为 int8 矩阵。
+    语义与逐格调用 code()（默认 alt_code()，即 alt_count()）完全一致（包括 pandas 读入的空值 NaN）。
+    """
+    if isinstance(gts, pd.DataFrame):
+        arr = gts.to_numpy(dtype=object)
+    else:
+        arr = np.asarray(gts, dtype=object)
+    if arr.size == 0:
+        return np.zeros(arr.shape, dtype=np.int8)
+
+    codes, uniques = pd.factorize(arr.ravel(), use_na_sentinel=False)
+    lut = np.fromiter((code(u) for u in uniques), dtype=np.int8, count=len(uniques))
+    return lut[codes].reshape(arr.shape)
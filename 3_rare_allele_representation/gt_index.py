@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+gt_index.py
+
+GT 表 / VCF 的染色体与位置索引，用于 --region 区段查询与按染色体并行（--chrom-workers）：
+  - 旁挂索引文件 <输入>.gtidx.json：每条染色体（连续区段）在解压后数据流中的起止字节偏移、
+    首行行号与行数，以及固定位置分箱（默认 1 Mb）中首个位点的字节偏移与行号。
+    首次使用时自动扫描建立；输入文件指纹不符时自动重建。
+  - 二进制基因型库（01_gt_store.py）不需要旁挂索引：直接用 meta.json 的 chrom_rows 与 pos.npy。
+  - plan_tasks()：把 --region 列表（或全部染色体）转换为任务列表
+    [{label, chrom, beg, end, start, stop}]，start/stop 为输入位置（字节偏移或行号），
+    beg/end 非空时读入后还需按 POS 精确过滤（region_mask）。
+  - RegionSource：把基因型源限制在一个任务的输入范围内（接口同 gt_io 的各个源，可直接用于
+    iter_positioned / chunk_pool.imap_chunks / 断点续跑）。
+"""
+
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from bgzf import iter_line_chunks, iter_text_pieces
+from checkpoint import input_fingerprint
+
+INDEX_FORMAT = 'gtidx'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.gtidx.json'
+DEFAULT_BIN_SIZE = 1000000
+
+# 区段的位置部分；染色体名本身可以含 ':'（HLA-A*01:01、scaffold:1 等），因此同 samtools：
+# 只有最后一个 ':' 之后是 beg-end 形式时才把它当作位置，否则整串都是染色体名
+_RANGE_RE = re.compile(r'^(?P<beg>[\d,]+)?-(?P<end>[\d,]+)?$')
+
+def parse_region(text):
+    """'chr'、'chr:beg-end'、'chr:beg-'、'chr:-end'（1-based，闭区间）-> (chrom, beg, end)；缺省端为 None。"""
+    text = text.strip()
+    chrom, sep, rng = text.rpartition(':')
+    m = _RANGE_RE.match(rng) if sep else None
+    if m is None:
+        chrom = text
+    if not chrom:
+        raise SystemExit(f"[ERROR] bad region '{text}' (expected chr, chr:start-end)")
+    beg = int(m.group('beg').replace(',', '')) if m and m.group('beg') else None
+    end = int(m.group('end').replace(',', '')) if m and m.group('end') else None
+    if beg is not None and end is not None and end < beg:
+        raise SystemExit(f"[ERROR] bad region '{text}': end < start")
+    return chrom, beg, end
+
+def region_mask(chr_, pos, chrom, beg=None, end=None):
+    """位点是否落在区段内（逐行布尔数组）。"""
+    m = np.asarray(chr_).astype(str) == chrom
+    if beg is not None or end is not None:
+        p = np.asarray(pos).astype(np.int64)
+        if beg is not None:
+            m &= p >= beg
+        if end is not None:
+            m &= p <= end
+    return m
+
+# ----------------- 文本 / VCF 旁挂索引 -----------------
+def build_index(path, bin_size=DEFAULT_BIN_SIZE, threads=4):
+    """顺序扫描一遍输入（只取每行前两列），建立染色体区段与位置分箱索引。"""
+    runs = []
+    cur = None
+    offset = 0
+    row = 0
+    for lines in iter_line_chunks(iter_text_pieces(path, threads=threads), 1 << 16):
+        for line in lines:
+            n = len(line) + 1
+            if not line or line[:1] == b'#':
+                offset += n
+                continue
+            f = line.split(b'\t', 2)
+            chrom = f[0].decode()
+            pos = int(f[1])
+            if cur is None or chrom != cur['chrom']:
+                if cur is not None:
+                    cur['stop'] = offset
+                    cur['n_rows'] = row - cur['first_row']
+                cur = {'chrom': chrom, 'start': offset, 'stop': None, 'first_row': row, 'n_rows': 0,
+                       'sorted': True, 'bins': []}
+                runs.append(cur)
+                last_pos = -1
+            if pos < last_pos:
+                cur['sorted'] = False
+            last_pos = pos
+            b = pos // bin_size
+            if not cur['bins'] or b > cur['bins'][-1][0] // bin_size:
+                cur['bins'].append([b * bin_size, offset, row])
+            offset += n
+            row += 1
+    if cur is not None:
+        cur['stop'] = offset
+        cur['n_rows'] = row - cur['first_row']
+    return {'format': INDEX_FORMAT, 'version': INDEX_VERSION, 'bin_size': bin_size,
+            'n_rows': row, 'fingerprint': input_fingerprint(path), 'runs': runs}
+
+def load_index(path, index_path=None, bin_size=DEFAULT_BIN_SIZE, threads=4):
+    """
+    读取旁挂索引；不存在、格式不符、分箱大小不同或输入已改变时重新建立并写出。
+    无法写出（只读的数据目录）时给出警告，索引只在本次运行中使用（可用 --gt-index 指向可写的路径）。
+    """
+    index_path = index_path or path + INDEX_SUFFIX
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            idx = json.load(f)
+        if (idx.get('format') == INDEX_FORMAT and idx.get('version') == INDEX_VERSION
+                and idx.get('bin_size') == bin_size and idx.get('fingerprint') == input_fingerprint(path)):
+            return idx
+        sys.stderr.write(f"[INFO] {index_path} is stale; rebuilding\n")
+    sys.stderr.write(f"[INFO] Indexing {path} (bin size {bin_size}) -> {index_path}\n")
+    idx = build_index(path, bin_size, threads)
+    tmp = index_path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(idx, f)
+        os.replace(tmp, index_path)
+    except OSError as e:
+        sys.stderr.write(f"[WARN] cannot write {index_path} ({e.strerror}); using the index for this run only "
+                         f"(pass --gt-index with a writable path to keep it)\n")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return idx
+
+def _index_span(run, bin_size, beg, end):
+    """文本索引中一个染色体区段内 [beg, end] 的字节范围（按分箱取整，读入后再精确过滤）。"""
+    if not run['sorted']:
+        return run['start'], run['stop']
+    bins = run['bins']
+    starts = np.array([b[0] for b in bins], dtype=np.int64)
+    start, stop = run['start'], run['stop']
+    if beg is not None:
+        i = np.searchsorted(starts, (beg // bin_size) * bin_size, side='left')
+        start = bins[i][1] if i < len(bins) else stop
+    if end is not None:
+        j = np.searchsorted(starts, (end // bin_size + 1) * bin_size, side='left')
+        stop = bins[j][1] if j < len(bins) else stop
+    return start, max(start, stop)
+
+# ----------------- 任务规划 -----------------
+def _store_runs(store):
+    return [{'chrom': c, 'start': s, 'stop': e} for c, s, e in store.meta['chrom_rows']]
+
+def _store_span(store, run, beg, end):
+    s, e = run['start'], run['stop']
+    pos = np.asarray(store.pos[s:e])
+    if len(pos) > 1 and np.any(pos[1:] < pos[:-1]):
+        return s, e
+    lo = s + (int(np.searchsorted(pos, beg, side='left')) if beg is not None else 0)
+    hi = s + (int(np.searchsorted(pos, end, side='right')) if end is not None else e - s)
+    return lo, hi
+
+def plan_tasks(source, regions=None, index_path=None, bin_size=DEFAULT_BIN_SIZE, threads=4):
+    """
+    regions（parse_region 的结果列表）为空时：每个染色体区段一个任务（按文件顺序）；
+    否则每个区段与染色体区段的交集一个任务（按给定顺序）。
+    """
+    if hasattr(source, 'meta'):   # StoreGTSource
+        runs = _store_runs(source)
+        span = lambda run, beg, end: _store_span(source, run, beg, end)
+    else:
+        idx = load_index(source.path, index_path, bin_size, threads)
+        runs = idx['runs']
+        span = lambda run, beg, end: _index_span(run, idx['bin_size'], beg, end)
+
+    tasks = []
+    if not regions:
+        for run in runs:
+            tasks.append({'label': run['chrom'], 'chrom': run['chrom'], 'beg': None, 'end': None,
+                          'start': run['start'], 'stop': run['stop']})
+        return tasks
+    for chrom, beg, end in regions:
+        hits = [r for r in runs if r['chrom'] == chrom]
+        if not hits:
+            sys.stderr.write(f"[WARN] region {chrom}: chromosome not found in the input\n")
+        label = chrom if beg is None and end is None else f"{chrom}:{beg or ''}-{end or ''}"
+        for run in hits:
+            start, stop = span(run, beg, end)
+            tasks.append({'label': label, 'chrom': chrom, 'beg': beg, 'end': end, 'start': start, 'stop': stop})
+    return tasks
+
+class RegionSource:
+    """基因型源在一个任务（plan_tasks() 的一项）范围内的视图；beg/end 非空时按 POS 精确过滤每个chunk。"""
+
+    def __init__(self, source, task):
+        self.source = source
+        self.task = task
+        self.samples = source.samples
+        self.start = task['start']
+
+    def iter_raw(self, chunksize, start=None, stop=None):
+        start = self.start if start is None else start
+        stop = self.task['stop'] if stop is None else min(stop, self.task['stop'])
+        return self.source.iter_raw(chunksize, start, stop)
+
+    def raw_end(self, start, raw):
+        return self.source.raw_end(start, raw)
+
+    def parse_raw(self, raw, cols=None):
+        info, G = self.source.parse_raw(raw, cols)
+        t = self.task
+        if (t['beg'] is None and t['end'] is None) or len(info) == 0:
+            return info, G
+        m = region_mask(info['CHR'], info['POS'], t['chrom'], t['beg'], t['end'])
+        if m.all():
+            return info, G
+        return info[m].reset_index(drop=True), G[m]
+
+def tasks_from_args(source, args):
+    """
+    由命令行的 --region / --chrom-workers / --gt-index / --index-bin-size 规划任务；
+    两者都未给出时返回 None（整个输入顺序扫描一次）。
+    """
+    if not args.region and args.chrom_workers <= 1:
+        return None
+    regions = [parse_region(r) for r in args.region or []]
+    tasks = plan_tasks(source, regions, args.gt_index, args.index_bin_size, getattr(args, 'threads', 4))
+    if not tasks:
+        raise SystemExit("[ERROR] no genotype rows fall into the requested regions")
+    sys.stderr.write(f"[INFO] {len(tasks)} task(s): {', '.join(t['label'] for t in tasks[:10])}"
+                     f"{' ...' if len(tasks) > 10 else ''}\n")
+    return tasks
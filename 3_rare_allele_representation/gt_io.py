@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+gt_io.py
+
+02_allele_count.py / 03_ac_wac_irr.py 共用的基因型输入源：
+  - TextGTSource ：bcftools query 导出的 GT 表（all147.gt.tsv：%CHROM %POS %REF %ALT [GT×N]）
+                   可为 gzip / bgzip / zstd 压缩（.gt.tsv.gz 等，后台线程解压，见 compressed_io.py）
+  - StoreGTSource：01_gt_store.py 生成的二进制基因型库（int8 memmap 矩阵 + 位点索引）
+  - VCFSource    ：直接读取 .vcf / .vcf.gz（BGZF 块多线程并行解压，只取 GT 子字段）
+
+每个源都提供 iter_chunks(chunksize, cols)，逐块产出 (info, G)：
+  info = DataFrame[CHR, POS, REF, ALT]
+  G    = int8 矩阵（行=位点，列=cols 指定的样本，按 cols 给定的顺序；MISSING 表示缺失）
+cols 为样本在 samples.order 中的下标（从 0 起）；None 表示全部样本。
+并行处理（chunk_pool.py）时拆成两步：主进程 iter_raw(chunksize) 只读出原始chunk
+（文本源为字节串，基因型库为行区间），子进程 parse_raw(raw, cols) 完成解析与解码。
+iter_raw(chunksize, start, stop) 可读取任意输入范围（文本 / VCF 为解压后的字节偏移，基因型库为行号），
+raw_end(start, raw) 给出该chunk之后的位置；iter_positioned() 据此产出带位置的chunk，供断点续跑使用。
+属性 start 为默认的起始位置（整个输入为 0；gt_index.RegionSource 为所选区段的起点）。
+
+基因型库目录结构（site-major，列=样本）：
+  meta.json          n_sites / n_samples / dtype / 染色体名 / 每条染色体的行区间
+  samples.order.txt  样本顺序（即矩阵列顺序）
+  gt.i8              int8 矩阵（n_sites × n_samples，C 顺序；MISSING=-1）
+  chrom.npy          每个位点的染色体编码（int32，对应 meta.json 的 chroms）
+  pos.npy            POS（int64）
+  ref.dat / ref.off.npy, alt.dat / alt.off.npy
+                     REF/ALT 文本（逐行换行分隔）及每行起始字节偏移（n_sites+1）
+"""
+
+import io
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from bgzf import is_gzip, iter_line_chunks, iter_text_pieces
+from compressed_io import is_zstd, open_binary
+from gt_codec import MISSING, alt_code, decode_gt
+from perf_metrics import count_bytes, timed, timed_iter
+
+INFO_COLS = ['CHR', 'POS', 'REF', 'ALT']
+
+STORE_FORMAT = 'gtstore'
+STORE_VERSION = 1
+
+def read_samples_order(path):
+    return [s.strip() for s in open(path) if s.strip()]
+
+# ----------------- 文本 GT 表 -----------------
+def _gt_usecols(samples, cols):
+    """GT 表中需要解析的列号（前4列 + cols 对应的样本列）及按 cols 顺序排列的样本列号。"""
+    if cols is None:
+        cols = list(range(len(samples)))
+    gt_cols = [4 + c for c in cols]
+    # 只解析需要的样本列；pandas 按文件顺序返回，之后再按 cols 的顺序取列
+    return list(range(0, 4)) + sorted(set(gt_cols)), gt_cols
+
+def _split_gt_frame(chunk, gt_cols, code=alt_code):
+    info = chunk[[0, 1, 2, 3]]
+    info.columns = INFO_COLS
+    with timed('decode'):
+        return info, decode_gt(chunk[gt_cols], code)
+
+def _take_bytes(pieces, n):
+    """字节片段流的前 n 个字节（n 为 None 时不截断）。"""
+    if n is None:
+        yield from pieces
+        return
+    for piece in pieces:
+        if n <= 0:
+            return
+        if len(piece) > n:
+            piece = piece[:n]
+        n -= len(piece)
+        yield piece
+
+class TextGTSource:
+    """bcftools query 导出的 GT 表（无表头；前4列 CHR POS REF ALT，之后每列一个样本）。"""
+
+    start = 0
+
+    def __init__(self, path, samples, sep='\t', threads=4, code=alt_code):
+        self.path = path
+        self.samples = list(samples)
+        self.sep = sep
+        self.threads = threads
+        self.code = code
+
+    def iter_chunks(self, chunksize, cols=None):
+        usecols, gt_cols = _gt_usecols(self.samples, cols)
+        # 压缩输入（gzip / bgzip / zstd）在后台线程中解压
+        compressed = is_gzip(self.path) or is_zstd(self.path)
+        reader = pd.read_csv(
+            open_binary(self.path, self.threads) if compressed else self.path,
+            sep=self.sep,
+            header=None,
+            usecols=usecols,
+            chunksize=chunksize,
+            dtype=str,
+            low_memory=True
+        )
+        for chunk in reader:
+            yield _split_gt_frame(chunk, gt_cols, self.code)
+
+    def iter_raw(self, chunksize, start=0, stop=None):
+        pieces = iter_text_pieces(self.path, threads=self.threads, offset=start)
+        for lines in iter_line_chunks(_take_bytes(pieces, None if stop is None else stop - start), chunksize):
+            yield b'\n'.join(lines)
+
+    def raw_end(self, start, raw):
+        return start + len(raw) + 1
+
+    def parse_raw(self, raw, cols=None):
+        usecols, gt_cols = _gt_usecols(self.samples, cols)
+        with timed('parse'):
+            chunk = pd.read_csv(io.BytesIO(raw), sep=self.sep, header=None, usecols=usecols, dtype=str)
+        return _split_gt_frame(chunk, gt_cols, self.code)
+
+# ----------------- VCF -----------------
+# 样本列中 GT 之后的其它子字段（:AD:DP:...），GT 按规范总是 FORMAT 的第一个键
+_SUBFIELDS = re.compile(rb':[^\t]*')
+
+def read_vcf_samples(path):
+    """从 VCF 表头的 #CHROM 行读取样本顺序。"""
+    with open_binary(path) as fh:
+        for line in fh:
+            if line.startswith(b'#CHROM'):
+                return line.rstrip(b'\r\n').decode().split('\t')[9:]
+            if not line.startswith(b'#'):
+                break
+    raise SystemExit(f"[ERROR] no #CHROM header line found in {path}")
+
+def vcf_to_gt_lines(lines, n_samples):
+    """
+    把 VCF 数据行转换为与 bcftools query '%CHROM\\t%POS\\t%REF\\t%ALT[\\t%GT]\\n' 相同的文本行：
+    只保留 CHROM/POS/REF/ALT 与每个样本的 GT 子字段；FORMAT 中没有 GT 的行视作全部缺失。
+    """
+    missing = b'\t'.join([b'.'] * n_samples)
+    out = []
+    for line in lines:
+        if not line or line[0] == 35:  # '#'
+            continue
+        f = line.rstrip(b'\r').split(b'\t', 9)
+        fmt = f[8]
+        gts = f[9]
+        if fmt != b'GT':
+            if fmt.startswith(b'GT:'):
+                gts = _SUBFIELDS.sub(b'', gts)
+            else:
+                gts = missing
+        out.append(b'\t'.join((f[0], f[1], f[3], f[4], gts)))
+    return b'\n'.join(out)
+
+class VCFSource:
+    """
+    直接读取 .vcf / .vcf.gz，省去 bcftools query 导出的中间文本。
+    BGZF 压缩的文件按独立块在线程池中并行解压；逐块转换为 GT 表文本后，
+    走与 TextGTSource 相同的解析与解码流程。
+    """
+
+    start = 0
+
+    def __init__(self, path, samples=None, threads=4, code=alt_code):
+        self.path = path
+        self.threads = threads
+        self.code = code
+        self.samples = read_vcf_samples(path)
+        if samples is not None and list(samples) != self.samples:
+            raise SystemExit(f"[ERROR] --samples-order does not match the sample columns of {path}")
+
+    def iter_raw(self, chunksize, start=0, stop=None):
+        pieces = iter_text_pieces(self.path, threads=self.threads, offset=start)
+        for lines in iter_line_chunks(_take_bytes(pieces, None if stop is None else stop - start), chunksize):
+            yield b'\n'.join(lines)
+
+    def raw_end(self, start, raw):
+        return start + len(raw) + 1
+
+    def parse_raw(self, raw, cols=None):
+        usecols, gt_cols = _gt_usecols(self.samples, cols)
+        with timed('parse'):
+            buf = vcf_to_gt_lines(raw.split(b'\n'), len(self.samples))
+            if not buf:
+                # 只含表头行的chunk
+                return (pd.DataFrame({c: pd.Series(dtype=object) for c in INFO_COLS}),
+                        np.zeros((0, len(gt_cols)), dtype=np.int8))
+            chunk = pd.read_csv(io.BytesIO(buf), sep='\t', header=None, usecols=usecols, dtype=str)
+        return _split_gt_frame(chunk, gt_cols, self.code)
+
+    def iter_chunks(self, chunksize, cols=None):
+        for raw in self.iter_raw(chunksize):
+            info, G = self.parse_raw(raw, cols)
+            if len(info):
+                yield info, G
+
+# ----------------- 二进制基因型库 -----------------
+class GTStoreWriter:
+    """逐块追加写出二进制基因型库（见模块说明）。"""
+
+    def __init__(self, path, samples):
+        self.path = path
+        self.samples = list(samples)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'samples.order.txt'), 'w') as f:
+            for s in self.samples:
+                f.write(s + '\n')
+        self._gt = open(os.path.join(path, 'gt.i8'), 'wb')
+        self._ref = open(os.path.join(path, 'ref.dat'), 'wb')
+        self._alt = open(os.path.join(path, 'alt.dat'), 'wb')
+        self._chrom_names = {}
+        self._chrom, self._pos = [], []
+        self._ref_len, self._alt_len = [], []
+        self.n_sites = 0
+
+    def append(self, info, G):
+        if G.shape[1] != len(self.samples):
+            raise ValueError(f"chunk has {G.shape[1]} sample columns, store expects {len(self.samples)}")
+        self._gt.write(np.ascontiguousarray(G, dtype=np.int8).tobytes())
+
+        chroms = info['CHR'].astype(str).to_numpy()
+        uniq, inv = np.unique(chroms, return_inverse=True)
+        codes = np.array([self._chrom_names.setdefault(c, len(self._chrom_names)) for c in uniq],
+                         dtype=np.int32)
+        self._chrom.append(codes[inv])
+        self._pos.append(info['POS'].astype(np.int64).to_numpy())
+
+        for col, fh, lens in (('REF', self._ref, self._ref_len), ('ALT', self._alt, self._alt_len)):
+            vals = info[col].astype(str).tolist()
+            fh.write(('\n'.join(vals) + '\n').encode())
+            lens.append(np.fromiter((len(v.encode()) + 1 for v in vals), dtype=np.int64, count=len(vals)))
+        self.n_sites += len(info)
+
+    def close(self, source=None):
+        for fh in (self._gt, self._ref, self._alt):
+            fh.close()
+
+        chrom = np.concatenate(self._chrom) if self._chrom else np.zeros(0, dtype=np.int32)
+        np.save(os.path.join(self.path, 'chrom.npy'), chrom)
+        np.save(os.path.join(self.path, 'pos.npy'),
+                np.concatenate(self._pos) if self._pos else np.zeros(0, dtype=np.int64))
+        for name, lens in (('ref', self._ref_len), ('alt', self._alt_len)):
+            off = np.zeros(self.n_sites + 1, dtype=np.int64)
+            if lens:
+                np.cumsum(np.concatenate(lens), out=off[1:])
+            np.save(os.path.join(self.path, f'{name}.off.npy'), off)
+
+        # 每条染色体（连续区段）的行区间
+        chrom_names = sorted(self._chrom_names, key=self._chrom_names.get)
+        runs = []
+        if self.n_sites:
+            starts = np.flatnonzero(np.r_[True, chrom[1:] != chrom[:-1]])
+            ends = np.r_[starts[1:], self.n_sites]
+            runs = [[chrom_names[chrom[s]], int(s), int(e)] for s, e in zip(starts, ends)]
+
+        meta = {
+            'format': STORE_FORMAT,
+            'version': STORE_VERSION,
+            'n_sites': self.n_sites,
+            'n_samples': len(self.samples),
+            'dtype': 'int8',
+            'missing': MISSING,
+            'chroms': chrom_names,
+            'chrom_rows': runs,
+            'source': source,
+        }
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+class StoreGTSource:
+    """以 np.memmap 只读打开二进制基因型库；可按任意行区间 / 样本子集读取，无文本解析。"""
+
+    start = 0
+
+    def __init__(self, path):
+        self.path = path
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise SystemExit(f"[ERROR] not a genotype store (missing meta.json): {path}")
+        with open(meta_path) as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != STORE_FORMAT or self.meta.get('version') != STORE_VERSION:
+            raise SystemExit(f"[ERROR] unsupported genotype store format in {path}")
+
+        self.samples = read_samples_order(os.path.join(path, 'samples.order.txt'))
+        self.n_sites = int(self.meta['n_sites'])
+        shape = (self.n_sites, int(self.meta['n_samples']))
+        if self.n_sites:
+            self.gt = np.memmap(os.path.join(path, 'gt.i8'), dtype=np.int8, mode='r', shape=shape)
+        else:
+            self.gt = np.zeros(shape, dtype=np.int8)
+
+        self.chrom_names = np.array(self.meta['chroms'], dtype=object)
+        self.chrom = np.load(os.path.join(path, 'chrom.npy'), mmap_mode='r')
+        self.pos = np.load(os.path.join(path, 'pos.npy'), mmap_mode='r')
+        self._alleles = {}
+        for name in ('ref', 'alt'):
+            off = np.load(os.path.join(path, f'{name}.off.npy'), mmap_mode='r')
+            dat_path = os.path.join(path, f'{name}.dat')
+            dat = np.memmap(dat_path, dtype=np.uint8, mode='r') if os.path.getsize(dat_path) else np.zeros(0, np.uint8)
+            self._alleles[name] = (off, dat)
+
+    def _allele_strings(self, name, start, stop):
+        off, dat = self._alleles[name]
+        blob = dat[off[start]:off[stop]].tobytes().decode()
+        return blob.split('\n')[:-1]
+
+    def variants(self, start, stop):
+        """行区间 [start, stop) 的 CHR/POS/REF/ALT。"""
+        return pd.DataFrame({
+            'CHR': self.chrom_names[np.asarray(self.chrom[start:stop])],
+            'POS': np.asarray(self.pos[start:stop]).astype(str).astype(object),
+            'REF': self._allele_strings('ref', start, stop),
+            'ALT': self._allele_strings('alt', start, stop),
+        })
+
+    def genotypes(self, start, stop, cols=None):
+        """行区间 [start, stop)、样本子集 cols 的 int8 矩阵（拷贝）。"""
+        block = self.gt[start:stop]
+        if cols is None:
+            return np.array(block)
+        return np.take(block, cols, axis=1)
+
+    def iter_raw(self, chunksize, start=0, stop=None):
+        stop = self.n_sites if stop is None else min(stop, self.n_sites)
+        for s in range(start, stop, chunksize):
+            yield (s, min(s + chunksize, stop))
+
+    def raw_end(self, start, raw):
+        return raw[1]
+
+    def parse_raw(self, raw, cols=None):
+        s, e = raw
+        with timed('read'):
+            return self.variants(s, e), self.genotypes(s, e, cols)
+
+    def iter_chunks(self, chunksize, cols=None, start=0, stop=None):
+        for raw in self.iter_raw(chunksize, start, stop):
+            yield self.parse_raw(raw, cols)
+
+    def __reduce__(self):
+        # 传给子进程时只传路径，由子进程自行重新 memmap
+        return (StoreGTSource, (self.path,))
+
+# ----------------- 带位置的分块读取 -----------------
+def raw_nbytes(source, raw):
+    """一个原始chunk对应的输入字节数（文本 / VCF 为解压后的字节数，基因型库为 int8 矩阵的字节数）。"""
+    if isinstance(raw, (bytes, bytearray)):
+        return len(raw) + 1
+    return (raw[1] - raw[0]) * len(source.samples)
+
+def iter_positioned(source, chunksize, cols=None, start=None):
+    """
+    从输入位置 start（默认 source.start）起逐块产出 (start, end, info, G)；end 为下一块的起始位置，
+    可记入断点清单（checkpoint.py），续跑时从该位置继续。
+    """
+    start = source.start if start is None else start
+    pos = start
+    for raw in timed_iter(source.iter_raw(chunksize, start), 'read'):
+        count_bytes('bytes_in', raw_nbytes(source, raw))
+        end = source.raw_end(pos, raw)
+        info, G = source.parse_raw(raw, cols)
+        yield pos, end, info, G
+        pos = end
+
+# ----------------- 入口 -----------------
+def open_gt_source(gt_tsv=None, gt_store=None, samples_order=None, sep='\t', vcf=None, threads=4, code=alt_code):
+    """
+    根据命令行参数打开基因型源（--gt-tsv / --gt-store / --vcf 三选一）。
+    使用基因型库或 VCF 时 --samples-order 可省略；若提供，则必须与库 / VCF 表头中的样本顺序一致。
+    code 为 GT 字符串的解码函数（gt_codec）；基因型库只存有 alt_code() 的结果，不能换用其它解码。
+    """
+    if vcf:
+        return VCFSource(vcf, read_samples_order(samples_order) if samples_order else None, threads=threads,
+                         code=code)
+    if gt_store:
+        if code is not alt_code:
+            raise SystemExit("[ERROR] a genotype store keeps only ALT counts (2/2 and haploid calls folded in); "
+                             "use --gt-tsv or --vcf here")
+        src = StoreGTSource(gt_store)
+        if samples_order:
+            order = read_samples_order(samples_order)
+            if order != src.samples:
+                raise SystemExit(f"[ERROR] {samples_order} does not match the sample order stored in {gt_store}")
+        return src
+    if not samples_order:
+        raise SystemExit("[ERROR] --samples-order is required with --gt-tsv")
+    return TextGTSource(gt_tsv, read_samples_order(samples_order), sep=sep, threads=threads, code=code)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+perf_metrics.py
+
+02_allele_count.py / 03_ac_wac_irr.py 的可选性能记录（--metrics）与剖析（--profile）：
+  - timed('parse') 等上下文按阶段累计耗时（嵌套时各阶段只计自身时间，不重复计入外层）；
+    count_bytes('bytes_in', n) 累计读入 / 写出字节数；
+    mark_chunk() 在每个chunk结束时写一行 JSON：该chunk的各阶段耗时 t_*、行数、rows/s、字节数、
+    当前 / 峰值常驻内存，之后清零，开始下一个chunk
+  - 未启用时上述函数都是空操作（只检查一个全局变量），不影响正常运行的速度
+  - 进程池（chunk_pool.py）：子进程同样启用记录，把各自的计时随结果交回主进程合并
+    （--workers：并入对应chunk的记录；--chrom-workers：子进程的逐chunk记录原样写出）
+  - 运行结束时在 stderr 打印汇总表（各阶段总耗时、占比、每chunk平均），并写一行 phase=total 的汇总记录
+  - --profile：主进程用 cProfile 做确定性剖析，保存 pstats 文件（可用 python -m pstats / snakeviz 查看），
+    并打印累计耗时最多的函数；子进程不剖析（需要时可对其用 py-spy 等采样剖析器）
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+_REC = None
+_NULL = nullcontext()
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _rss_mb():
+    """当前常驻内存（MB；无 /proc 时为 None）。"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    """峰值常驻内存（MB；Linux 的 ru_maxrss 以 KB 计，macOS 以字节计）。"""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+class _Recorder:
+    """一个进程内的计时与计数状态；path 为 None 时只在内存中保存记录（子进程）。"""
+
+    def __init__(self, script, path=None):
+        self.script = script
+        self._fh = open(path, 'w') if path else None
+        self.records = []
+        self.stack = []                      # [阶段, 起始时刻, 子阶段耗时]
+        self.pending = defaultdict(float)    # 当前chunk内各阶段耗时
+        self.counts = defaultdict(int)       # 当前chunk内的字节计数
+        self.totals = defaultdict(float)
+        self.total_counts = defaultdict(int)
+        self.phases = {}                     # phase -> [chunk数, 行数]
+        self.t0 = self.last = time.perf_counter()
+
+    def enter(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, t0, child = self.stack.pop()
+        dt = time.perf_counter() - t0
+        self.pending[name] += dt - child
+        self.totals[name] += dt - child
+        if self.stack:
+            self.stack[-1][2] += dt
+
+    def emit(self, rec):
+        if self._fh is None:
+            self.records.append(rec)
+        else:
+            self._fh.write(json.dumps(rec) + '\n')
+            self._fh.flush()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+class _Timed:
+    __slots__ = ('rec', 'name')
+
+    def __init__(self, rec, name):
+        self.rec, self.name = rec, name
+
+    def __enter__(self):
+        self.rec.enter(self.name)
+
+    def __exit__(self, *exc):
+        self.rec.exit()
+
+def enabled():
+    return _REC is not None
+
+def timed(name):
+    """阶段计时上下文（未启用时为空操作）。"""
+    return _NULL if _REC is None else _Timed(_REC, name)
+
+def timed_iter(iterable, name):
+    """逐项计时地迭代（每次取下一项的耗时计入阶段 name）。"""
+    if _REC is None:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        with timed(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+def count_bytes(name, n):
+    if _REC is not None:
+        _REC.counts[name] += n
+        _REC.total_counts[name] += n
+
+def mark_chunk(chunk_idx, rows, phase='', task=''):
+    """一个chunk结束：写出其记录并清零当前chunk的计时 / 计数。"""
+    r = _REC
+    if r is None:
+        return
+    now = time.perf_counter()
+    wall = now - r.last
+    r.last = now
+    rec = {'script': r.script, 'phase': phase, 'task': task, 'chunk': chunk_idx, 'rows': rows,
+           'wall_s': round(wall, 6), 'rows_per_s': round(rows / wall, 1) if wall > 0 else None}
+    rec.update({f't_{k}': round(v, 6) for k, v in r.pending.items()})
+    rec.update(r.counts)
+    rec['rss_mb'] = _rss_mb()
+    rec['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+    r.pending.clear()
+    r.counts.clear()
+    ph = r.phases.setdefault(phase, [0, 0])
+    ph[0] += 1
+    ph[1] += rows
+    r.emit(rec)
+
+# ----------------- 进程池 -----------------
+def worker_config():
+    """传给进程池初始化函数的配置（未启用时为 None）。"""
+    return None if _REC is None else {'script': _REC.script}
+
+def init_worker(cfg):
+    """子进程中按 worker_config() 启用记录（只保存在内存中）。"""
+    global _REC
+    if cfg is not None:
+        _REC = _Recorder(cfg['script'])
+
+def take():
+    """取出并清空本进程（子进程）的全部计时、计数与记录，交回主进程 merge()。"""
+    global _REC
+    r = _REC
+    if r is None:
+        return None
+    snap = {'pending': dict(r.pending), 'counts': dict(r.counts), 'totals': dict(r.totals),
+            'total_counts': dict(r.total_counts), 'phases': r.phases, 'records': r.records}
+    _REC = _Recorder(r.script)
+    return snap
+
+def merge(snap):
+    """并入子进程的 take() 结果：未归属chunk的计时计入主进程当前chunk，逐chunk记录直接写出。"""
+    r = _REC
+    if r is None or snap is None:
+        return
+    for k, v in snap['pending'].items():
+        r.pending[k] += v
+    for k, v in snap['counts'].items():
+        r.counts[k] += v
+    for k, v in snap['totals'].items():
+        r.totals[k] += v
+    for k, v in snap['total_counts'].items():
+        r.total_counts[k] += v
+    for phase, (n, rows) in snap['phases'].items():
+        ph = r.phases.setdefault(phase, [0, 0])
+        ph[0] += n
+        ph[1] += rows
+    for rec in snap['records']:
+        r.emit(rec)
+
+# ----------------- 汇总 / 入口 -----------------
+def summary(out=sys.stderr):
+    """打印汇总表并写出 phase=total 的汇总记录。"""
+    r = _REC
+    if r is None:
+        return
+    wall = time.perf_counter() - r.t0
+    staged = sum(r.totals.values())
+    peak, peak_children = _peak_rss_mb(), _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    mb_in, mb_out = r.total_counts.get('bytes_in', 0) / 2**20, r.total_counts.get('bytes_out', 0) / 2**20
+    n_chunks = max([n for n, _ in r.phases.values()] or [0])
+
+    out.write(f"[PERF] {r.script}: wall {wall:.2f} s; read {mb_in:.1f} MB, wrote {mb_out:.1f} MB; "
+              f"peak RSS {peak:.0f} MB (child processes {peak_children:.0f} MB)\n")
+    for phase, (n, rows) in r.phases.items():
+        out.write(f"[PERF]   phase {phase or '-'}: {n} chunks, {rows} rows\n")
+    out.write(f"[PERF] {'stage':<16}{'seconds':>10}{'share':>9}{'ms/chunk':>11}\n")
+    for name, secs in sorted(r.totals.items(), key=lambda kv: -kv[1]):
+        share = 100 * secs / staged if staged else 0.0
+        per_chunk = 1000 * secs / n_chunks if n_chunks else 0.0
+        out.write(f"[PERF] {name:<16}{secs:>10.3f}{share:>8.1f}%{per_chunk:>11.1f}\n")
+    if staged > wall:
+        out.write("[PERF] (stage seconds include time spent in worker processes, so they can exceed the wall time)\n")
+    else:
+        out.write(f"[PERF] {'(untimed)':<16}{wall - staged:>10.3f}\n")
+
+    r.emit({'script': r.script, 'phase': 'total', 'wall_s': round(wall, 6),
+            'rows': {p or '-': rows for p, (_, rows) in r.phases.items()},
+            **{f't_{k}': round(v, 6) for k, v in r.totals.items()}, **r.total_counts,
+            'peak_rss_mb': round(peak, 1), 'peak_rss_children_mb': round(peak_children, 1)})
+
+@contextmanager
+def instrumented(script, metrics_path=None, profile_path=None, top=25):
+    """
+    在 --metrics / --profile 下运行一个脚本的主体：
+    metrics_path 给出时启用记录并在结束时打印汇总；profile_path 给出时用 cProfile 剖析并保存。
+    """
+    global _REC
+    if metrics_path:
+        _REC = _Recorder(script, metrics_path)
+    prof = cProfile.Profile() if profile_path else None
+    try:
+        if prof:
+            prof.enable()
+        yield
+    finally:
+        if prof:
+            prof.disable()
+            prof.dump_stats(profile_path)
+            sys.stderr.write(f"[INFO] profile saved to {profile_path} (python -m pstats {profile_path}); "
+                             f"top {top} by cumulative time:\n")
+            pstats.Stats(prof, stream=sys.stderr).sort_stats('cumulative').print_stats(top)
+        if _REC is not None:
+            summary()
+            _REC.close()
+            sys.stderr.write(f"[INFO] per-chunk metrics -> {metrics_path}\n")
+            _REC = None
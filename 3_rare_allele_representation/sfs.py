@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+sfs.py
+
+02_allele_count.py 在同一次扫描中顺带输出的位点频率谱（--sfs-out），省去 vcftools .frq 与另行准备的 .obs：
+  - 1D（每个群体）、2D（每对群体）与 3D（三个群体时）联合 SFS，unfolded（ALT 视作衍生等位）与 folded 各一份
+  - 投影（--sfs-proj）：有缺失的位点按超几何分布下采样到固定的拷贝数 m（ALT 数为 j 的概率
+    C(k,j)·C(n-k,m-j)/C(n,m)，n=AN、k=AC），AN < m 的位点不计入；不投影时 m = 2×群体样本数（只用无缺失位点）
+  - 输出 fastsimcoal2 的 .obs：{prefix}_DAFpop{i}.obs / _MAFpop{i}.obs（1D），
+    {prefix}_jointDAFpop{j}_{i}.obs / _jointMAFpop{j}_{i}.obs（2D：行为 pop j，列为 pop i），
+    {prefix}_DSFS.obs / _MSFS.obs（3D：pop0 变化最快）；pop 编号即 --sfs-groups 中的顺序
+  - Est-SFS 输入（--estsfs-outgroups）：每个双等位 SNP 一行 “焦点群体 A,C,G,T 计数<TAB>外类群1<TAB>...”，
+    焦点计数按频率缩放到固定拷贝数（同 est_sfs_input.dfe.Gpen147.pl 的 294×freq），
+    外类群取多数等位的一个拷贝（无调用或持平时为 0,0,0,0）；另写 .sites.tsv 记录每行对应的位点
+
+扫描中只累加每个位点各群体 (AN, AC) 组合的直方图（组合数与位点数无关），
+投影与折叠在扫描结束后一次完成；直方图可逐 chunk / 逐任务合并，也可存入断点状态。
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from perf_metrics import timed
+
+# 投影时每批处理的直方图行数上限（3D 时中间数组约 batch×(m0+1)×(m1+1) 个 float64）
+_BATCH_CELLS = 1 << 23
+
+def _log_factorials(nmax):
+    lf = np.zeros(nmax + 1)
+    lf[1:] = np.cumsum(np.log(np.arange(1, nmax + 1)))
+    return lf
+
+def projection_matrix(n, k, m, logfact=None):
+    """
+    逐行 (n, k) 不放回抽取 m 个拷贝时 ALT 数为 0..m 的超几何概率，形状 (len(n), m+1)；
+    要求 n >= m。logfact 为 log(0..N!) 表（缺省时按需计算）。
+    """
+    n = np.asarray(n, dtype=np.int64)[:, None]
+    k = np.asarray(k, dtype=np.int64)[:, None]
+    if logfact is None:
+        logfact = _log_factorials(int(n.max(initial=m)))
+    j = np.arange(m + 1)[None, :]
+    ok = (j <= k) & (m - j <= n - k)
+
+    def log_choose(a, b):
+        b = np.clip(b, 0, a)
+        return logfact[a] - logfact[b] - logfact[a - b]
+
+    logp = log_choose(k, j) + log_choose(n - k, m - j) - log_choose(n, np.full_like(n, m))
+    return np.where(ok, np.exp(logp), 0.0)
+
+def fold(sfs):
+    """按全部群体合计的少数等位折叠（合计恰为一半的格子与其镜像格各取一半），形状不变。"""
+    sfs = np.asarray(sfs, dtype=float)
+    total = sum(np.indices(sfs.shape))
+    half = sum(s - 1 for s in sfs.shape) / 2
+    rev = sfs[(slice(None, None, -1),) * sfs.ndim]
+    return np.where(total < half, sfs + rev, np.where(total == half, (sfs + rev) / 2, 0.0))
+
+class SfsAccumulator:
+    """
+    --sfs-groups 中 1–3 个群体的逐位点 (AN, AC) 组合直方图。
+    sizes 为各群体的最大拷贝数（2×样本数）；proj 为投影拷贝数（缺省等于 sizes）。
+    """
+
+    def __init__(self, labels, sizes, proj=None):
+        if not 1 <= len(labels) <= 3:
+            raise SystemExit("[ERROR] --sfs-groups takes one to three group labels")
+        self.labels = list(labels)
+        self.sizes = [int(s) for s in sizes]
+        self.proj = [int(p) for p in (proj or self.sizes)]
+        if len(self.proj) != len(self.labels):
+            raise SystemExit("[ERROR] --sfs-proj needs one value per --sfs-groups label")
+        for g, m, n in zip(self.labels, self.proj, self.sizes):
+            if not 1 <= m <= n:
+                raise SystemExit(f"[ERROR] --sfs-proj for '{g}' must be between 1 and {n} (2 x group size)")
+        self.base = max(self.sizes) + 1
+        if self.base ** (2 * len(self.labels)) >= 2 ** 63:
+            raise SystemExit("[ERROR] --sfs-groups: groups too large to encode (AN, AC) in 64 bits; use fewer groups")
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+
+    def add(self, df):
+        """累加一个chunk（allele_table_chunk() 的输出，含 AC_<群体> / AN_<群体> 列）。"""
+        if len(df) == 0:
+            return
+        with timed('sfs'):
+            B = self.base
+            key = np.zeros(len(df), dtype=np.int64)
+            for i, g in enumerate(self.labels):
+                an = df[f'AN_{g}'].to_numpy().astype(np.int64)
+                ac = df[f'AC_{g}'].to_numpy().astype(np.int64)
+                key += (an * B + ac) * (B * B) ** i
+            u, c = np.unique(key, return_counts=True)
+            self._pending.append((u, c))
+            if len(self._pending) >= 32:
+                self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self.keys] + [u for u, _ in self._pending])
+        counts = np.concatenate([self.counts] + [c for _, c in self._pending])
+        self.keys, inv = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inv, weights=counts, minlength=len(self.keys)).astype(np.int64)
+        self._pending = []
+
+    def merge(self, other):
+        """并入另一个（同一组群体的）累加器。"""
+        if other.labels != self.labels or other.sizes != self.sizes:
+            raise ValueError("cannot merge SFS accumulators over different groups")
+        other._compact()
+        self._pending.append((other.keys, other.counts))
+
+    def __getstate__(self):
+        self._compact()
+        return self.__dict__
+
+    def histogram(self):
+        """(AN (U, G), AC (U, G), 位点数 (U,))。"""
+        self._compact()
+        B = self.base
+        AN = np.empty((len(self.keys), len(self.labels)), dtype=np.int64)
+        AC = np.empty_like(AN)
+        rest = self.keys.copy()
+        for i in range(len(self.labels)):
+            code = rest % (B * B)
+            rest //= B * B
+            AN[:, i], AC[:, i] = code // B, code % B
+        return AN, AC, self.counts
+
+    def spectrum(self, pops):
+        """群体下标 pops（如 (0,) / (0, 2) / (0, 1, 2)）的投影联合 SFS（unfolded，ALT 计数为下标）。"""
+        AN, AC, counts = self.histogram()
+        m = [self.proj[p] for p in pops]
+        keep = np.all([AN[:, p] >= self.proj[p] for p in pops], axis=0)
+        AN, AC, w = AN[keep], AC[keep], counts[keep].astype(float)
+        out = np.zeros(tuple(x + 1 for x in m))
+        logfact = _log_factorials(max(self.sizes))
+        step = max(1, _BATCH_CELLS // int(np.prod([x + 1 for x in m[:2]])))
+        for s in range(0, len(w), step):
+            P = [projection_matrix(AN[s:s+step, p], AC[s:s+step, p], self.proj[p], logfact) for p in pops]
+            ws = w[s:s+step]
+            if len(P) == 1:
+                out += ws @ P[0]
+            elif len(P) == 2:
+                out += (P[0] * ws[:, None]).T @ P[1]
+            else:
+                A = ((P[0] * ws[:, None])[:, :, None] * P[1][:, None, :]).reshape(len(ws), -1)
+                out += (A.T @ P[2]).reshape(out.shape)
+        return out
+
+    def n_sites(self, pops):
+        """参与 pops 投影的位点数（各群体 AN 都不小于投影拷贝数）。"""
+        AN, _, counts = self.histogram()
+        keep = np.all([AN[:, p] >= self.proj[p] for p in pops], axis=0)
+        return int(counts[keep].sum())
+
+# ----------------- fastsimcoal2 .obs -----------------
+def _fmt(v):
+    return f"{v:.6f}".rstrip('0').rstrip('.')
+
+def _row(vals):
+    return '\t'.join(_fmt(v) for v in vals)
+
+def write_obs_1d(path, sfs, pop):
+    with open(path, 'w') as f:
+        f.write("1 observations\n")
+        f.write('\t'.join(f"d{pop}_{i}" for i in range(len(sfs))) + '\n')
+        f.write(_row(sfs) + '\n')
+
+def write_obs_2d(path, sfs, pop_i, pop_j):
+    """sfs[a, b]：pop_i 有 a 个、pop_j 有 b 个衍生拷贝；文件中行为 pop_j，列为 pop_i。"""
+    with open(path, 'w') as f:
+        f.write("1 observations\n")
+        f.write('\t' + '\t'.join(f"d{pop_i}_{a}" for a in range(sfs.shape[0])) + '\n')
+        for b in range(sfs.shape[1]):
+            f.write(f"d{pop_j}_{b}\t" + _row(sfs[:, b]) + '\n')
+
+def write_obs_multi(path, sfs):
+    """多维 SFS（pop0 变化最快）。"""
+    with open(path, 'w') as f:
+        f.write("1 observations. No. of demes and sample sizes are on next line\n")
+        f.write(f"{sfs.ndim}\t" + '\t'.join(str(s - 1) for s in sfs.shape) + '\n')
+        f.write(_row(sfs.transpose(tuple(reversed(range(sfs.ndim)))).ravel()) + '\n')
+
+def write_sfs(prefix, acc):
+    """写出全部 1D / 2D / 3D（unfolded 与 folded）.obs 及群体编号说明 {prefix}.sfs_pops.tsv。"""
+    d = os.path.dirname(prefix)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    G = len(acc.labels)
+    written = []
+    for i in range(G):
+        s = acc.spectrum((i,))
+        for tag, arr in (('DAF', s), ('MAF', fold(s))):
+            path = f"{prefix}_{tag}pop{i}.obs"
+            write_obs_1d(path, arr, i)
+            written.append(path)
+    for i in range(G):
+        for j in range(i + 1, G):
+            s = acc.spectrum((i, j))
+            for tag, arr in (('DAF', s), ('MAF', fold(s))):
+                path = f"{prefix}_joint{tag}pop{j}_{i}.obs"
+                write_obs_2d(path, arr, i, j)
+                written.append(path)
+    if G == 3:
+        s = acc.spectrum((0, 1, 2))
+        for tag, arr in (('DSFS', s), ('MSFS', fold(s))):
+            path = f"{prefix}_{tag}.obs"
+            write_obs_multi(path, arr)
+            written.append(path)
+    with open(f"{prefix}.sfs_pops.tsv", 'w') as f:
+        f.write("pop\tgroup\tmax_copies\tprojected_copies\tn_sites\n")
+        for i, g in enumerate(acc.labels):
+            f.write(f"pop{i}\t{g}\t{acc.sizes[i]}\t{acc.proj[i]}\t{acc.n_sites((i,))}\n")
+    return written
+
+# ----------------- Est-SFS 输入 -----------------
+_BASE_IDX = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+# 外类群的单个拷贝：下标 = 碱基下标 + 1（0 表示无调用 / 持平）
+_ONE_COPY = np.array(['0,0,0,0', '1,0,0,0', '0,1,0,0', '0,0,1,0', '0,0,0,1'], dtype=object)
+
+class EstSfsInput:
+    """
+    Est-SFS 输入行的生成（逐chunk；可在子进程中调用）：焦点群体 focal（若干群体合并）的 REF/ALT 计数
+    缩放到 size 个拷贝，外类群 outgroups（1–3 个群体）各取多数等位的一个拷贝。
+    只输出 REF/ALT 均为单个碱基且焦点群体有调用的位点。
+    """
+
+    def __init__(self, focal, outgroups, size):
+        if not 1 <= len(outgroups) <= 3:
+            raise SystemExit("[ERROR] --estsfs-outgroups takes one to three group labels")
+        self.focal = list(focal)
+        self.outgroups = list(outgroups)
+        self.size = int(size)
+
+    def lines(self, df):
+        """返回 (Est-SFS 输入文本, 位点文本 CHR/POS/REF/ALT, 跳过的位点数)。"""
+        if len(df) == 0:
+            return '', '', 0
+        with timed('estsfs'):
+            ref = df['REF'].astype(str).map(_BASE_IDX).fillna(-1).to_numpy(dtype=np.int64)
+            alt = df['ALT'].astype(str).map(_BASE_IDX).fillna(-1).to_numpy(dtype=np.int64)
+            ac = sum(df[f'AC_{g}'].to_numpy(dtype=float) for g in self.focal)
+            an = sum(df[f'AN_{g}'].to_numpy(dtype=float) for g in self.focal)
+            ok = (ref >= 0) & (alt >= 0) & (ref != alt) & (an > 0)
+            ref, alt, ac, an = ref[ok], alt[ok], ac[ok], an[ok]
+
+            # 焦点群体：频率缩放到 size 个拷贝后四舍五入（同 perl 脚本的 sprintf("%.0f", 294*freq)）
+            n_alt = np.rint(ac / an * self.size).astype(np.int64)
+            counts = np.zeros((len(ref), 4), dtype=np.int64)
+            rows = np.arange(len(ref))
+            counts[rows, ref] = self.size - n_alt
+            counts[rows, alt] = n_alt
+            c = counts.astype(str).astype(object)
+            cols = [c[:, 0] + ',' + c[:, 1] + ',' + c[:, 2] + ',' + c[:, 3]]
+            for g in self.outgroups:
+                oac = df[f'AC_{g}'].to_numpy(dtype=float)[ok]
+                oan = df[f'AN_{g}'].to_numpy(dtype=float)[ok]
+                idx = np.where(2 * oac > oan, alt, np.where(2 * oac < oan, ref, -1))
+                cols.append(_ONE_COPY[np.where(oan > 0, idx, -1) + 1])
+            body = cols[0]
+            for col in cols[1:]:
+                body = body + '\t' + col
+            sites = df.loc[ok, ['CHR', 'POS', 'REF', 'ALT']].astype(str)
+            site_lines = sites['CHR'] + '\t' + sites['POS'] + '\t' + sites['REF'] + '\t' + sites['ALT']
+        text = ''.join(s + '\n' for s in body)
+        site_text = ''.join(s + '\n' for s in site_lines)
+        return text, site_text, int((~ok).sum())
+
+class EstSfsWriter:
+    """{prefix}.est_sfs.input.txt 与 {prefix}.est_sfs.sites.tsv；resume=(两个文件的字节数) 时截断后续写。"""
+
+    @staticmethod
+    def part_paths(prefix):
+        return f"{prefix}.est_sfs.input.txt", f"{prefix}.est_sfs.sites.tsv"
+
+    def __init__(self, prefix, resume=None):
+        self.paths = self.part_paths(prefix)
+        d = os.path.dirname(prefix)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._fh = []
+        for i, p in enumerate(self.paths):
+            if resume is not None:
+                fh = open(p, 'r+', newline='')
+                fh.truncate(resume[i])
+                fh.seek(resume[i])
+            else:
+                fh = open(p, 'w', newline='')
+            self._fh.append(fh)
+        self.skipped = 0
+
+    def write(self, text, site_text, skipped=0):
+        self._fh[0].write(text)
+        self._fh[1].write(site_text)
+        self.skipped += skipped
+
+    def write_files(self, input_path, sites_path):
+        """原样追加一个分段（--chrom-workers 的分段文件）。"""
+        for fh, p in zip(self._fh, (input_path, sites_path)):
+            with open(p, newline='') as src:
+                shutil.copyfileobj(src, fh)
+
+    def flush(self):
+        for fh in self._fh:
+            fh.flush()
+        return tuple(fh.tell() for fh in self._fh)
+
+    def close(self):
+        for fh in self._fh:
+            fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ----------------- 02 的扫描接口 -----------------
+class SfsSpec:
+    """
+    02_allele_count.py 的 SFS / Est-SFS 设置（可传给子进程）：part(df) 在任一进程中把一个chunk
+    转为可合并的结果 (SFS 直方图, Est-SFS 行)，由主进程 add_part() 按输入顺序并入累加器与输出文件。
+    """
+
+    def __init__(self, labels, sizes, proj=None, est=None):
+        self.labels, self.sizes, self.proj = list(labels), list(sizes), proj
+        self.est = est
+        self.new()   # 校验参数
+
+    def new(self):
+        return SfsAccumulator(self.labels, self.sizes, self.proj)
+
+    def part(self, df):
+        acc = self.new()
+        acc.add(df)
+        return acc, (self.est.lines(df) if self.est else None)
+
+def add_part(acc, est_writer, part):
+    """把 SfsSpec.part() 的结果并入主进程的累加器与 Est-SFS 输出。"""
+    acc.merge(part[0])
+    if est_writer is not None and part[1] is not None:
+        est_writer.write(*part[1])
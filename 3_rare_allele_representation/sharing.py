@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+sharing.py
+
+03_ac_wac_irr.py 的古树两两稀有等位共享矩阵（--sharing）：IRR 只给出逐棵古树的总量，
+这里统计“哪些古树携带相同的稀有等位”，用于发现冗余 / 克隆材料并做聚类。
+
+  - 位点：与 IRR 相同（已对齐、anc_count ≤ max_occ）；每个 chunk 只取这些位点构建稀疏的 位点×古树 携带矩阵 X
+    （每行至多 max_occ 个非零元，稀疏度与古树数无关）
+  - 共享数 S = Xᵀ X，加权共享数 S_w = Xᵀ diag(w) X（w 同 wAC / IRR），逐频率分箱各一份；
+    对角线为每棵古树携带的稀有等位数 / w 之和
+  - 稀疏乘积用 scipy.sparse（已安装时）；否则退回 numpy：按每行的携带者两两展开成 (i, j) 对后 bincount，
+    计算量同样只与非零元有关
+  - 累加器只保存 n_bins × n_anc × n_anc 的数组，可逐 chunk 累加、按任务合并、存入断点状态
+
+输出：{out-prefix}.sharing.tsv（长表：只列共享数 > 0 的古树对 i ≤ j，含 Jaccard 相似度，便于聚类），
+{out-prefix}.sharing.npz（ids、bins 与全部分箱的稠密矩阵 shared / shared_w）。
+"""
+
+import numpy as np
+import pandas as pd
+
+from acwac import BIN_LABELS
+
+try:
+    import scipy.sparse as _sparse
+except ImportError:  # 可选依赖：没有 scipy 时用 numpy 的 bincount 实现
+    _sparse = None
+
+SHARING_COLUMNS = ['bin', 'id1', 'id2', 'shared', 'shared_w', 'n1', 'n2', 'jaccard']
+
+def _pair_sums(carr, w, n_anc):
+    """携带矩阵 carr（布尔，位点×古树）的 Xᵀ X 与 Xᵀ diag(w) X（稠密 n_anc×n_anc）。"""
+    if _sparse is not None:
+        X = _sparse.csr_matrix(carr, dtype=np.float64)
+        S = (X.T @ X).toarray()
+        Sw = (X.T @ _sparse.diags(w) @ X).toarray()
+        return np.rint(S).astype(np.int64), Sw
+    rows, cols = np.nonzero(carr)
+    # 同一位点的携带者两两成对（含 i == j）：按行分组后做笛卡尔积
+    starts = np.searchsorted(rows, np.arange(len(carr) + 1))
+    k = np.diff(starts)
+    pair_row = np.repeat(np.arange(len(carr)), k * k)
+    base = np.repeat(starts[:-1], k * k)
+    off = np.arange(len(pair_row)) - np.repeat(np.cumsum(k * k) - k * k, k * k)
+    kk = np.repeat(k, k * k)
+    i = cols[base + off // np.maximum(kk, 1)]
+    j = cols[base + off % np.maximum(kk, 1)]
+    flat = i * n_anc + j
+    S = np.bincount(flat, minlength=n_anc * n_anc).reshape(n_anc, n_anc)
+    Sw = np.bincount(flat, weights=w[pair_row], minlength=n_anc * n_anc).reshape(n_anc, n_anc)
+    return S.astype(np.int64), Sw
+
+class SharingAccumulator:
+    """古树两两的稀有等位共享数与加权共享数（逐频率分箱）。"""
+
+    def __init__(self, ancient_ids):
+        self.ids = list(ancient_ids)
+        n, nb = len(self.ids), len(BIN_LABELS)
+        self.shared = np.zeros((nb, n, n), dtype=np.int64)
+        self.shared_w = np.zeros((nb, n, n))
+
+    def add(self, A, w_v, bin_v, site_mask):
+        """A：(nrow, n_anc) ALT 计数；w_v / bin_v：每个位点的权重与分箱标签；site_mask：参与的（稀有）位点。"""
+        if A.shape[1] != len(self.ids):
+            raise ValueError(f"genotype chunk has {A.shape[1]} ancient columns, expected {len(self.ids)}")
+        rows = np.flatnonzero(site_mask)
+        if len(rows) == 0:
+            return
+        carr = A[rows] > 0
+        held = carr.any(axis=1)
+        if not held.any():
+            return
+        carr = carr[held]
+        w = np.asarray(w_v, dtype=np.float64)[rows][held]
+        codes = pd.Categorical(np.asarray(bin_v, dtype=object)[rows][held], categories=BIN_LABELS).codes
+        for b in np.unique(codes):
+            if b < 0:
+                continue
+            m = codes == b
+            S, Sw = _pair_sums(carr[m], w[m], len(self.ids))
+            self.shared[b] += S
+            self.shared_w[b] += Sw
+
+    def merge(self, other):
+        if other.ids != self.ids:
+            raise ValueError("cannot merge sharing matrices over different ancient IDs")
+        self.shared += other.shared
+        self.shared_w += other.shared_w
+
+    def table(self, by_bin=False):
+        """长表：全部分箱合计（bin='all'）；by_bin 时另加逐分箱的行。只列 shared > 0 的 i ≤ j。"""
+        strata = [('all', self.shared.sum(axis=0), self.shared_w.sum(axis=0))]
+        if by_bin:
+            strata += [(lab, self.shared[b], self.shared_w[b]) for b, lab in enumerate(BIN_LABELS)]
+        ids = np.asarray(self.ids, dtype=object)
+        parts = []
+        for lab, S, Sw in strata:
+            i, j = np.nonzero(np.triu(S))
+            n = np.diag(S)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                jac = S[i, j] / (n[i] + n[j] - S[i, j])
+            parts.append(pd.DataFrame({'bin': lab, 'id1': ids[i], 'id2': ids[j], 'shared': S[i, j],
+                                       'shared_w': Sw[i, j], 'n1': n[i], 'n2': n[j], 'jaccard': jac},
+                                      columns=SHARING_COLUMNS))
+        return pd.concat(parts, ignore_index=True)
+
+    def write(self, prefix, by_bin=False):
+        """写出 {prefix}.sharing.tsv 与 {prefix}.sharing.npz，返回长表的行数。"""
+        tab = self.table(by_bin)
+        tab.to_csv(f"{prefix}.sharing.tsv", sep='\t', index=False)
+        np.savez_compressed(f"{prefix}.sharing.npz", ids=np.asarray(self.ids), bins=np.asarray(BIN_LABELS),
+                            shared=self.shared, shared_w=self.shared_w)
+        return len(tab)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+simulate_gt.py
+
+生成与 all147.gt.tsv 同格式的模拟数据（真实数据太大且不公开），用于 benchmark.py 与回归比较：
+  - GT 表（%CHROM %POS %REF %ALT [GT×N]，无表头；.gz 结尾时 gzip 压缩）
+  - samples.order.txt（样本顺序打乱，模拟 VCF 中任意的样本排列）
+  - ancients.list / cult.list / wild.list / anc_nat.list / anc_cult.list / anc_{min,zhu,admix}.list
+    与 groups.tsv（古树谱系标签，供 02 的 --groups 使用）
+  - sim_params.json（生成参数）
+
+模型：
+  - 位点频率谱：祖先 ALT 计数 k ∈ [1, 2N-1]，P(k) ∝ k^(-alpha)（alpha=1 即中性 1/k 谱，稀有位点占多数）
+  - 群体分化：各群体频率 ~ Balding–Nichols Beta(p(1-F)/F, (1-p)(1-F)/F)，F 为 --fst
+  - 基因型：二倍体 ~ Binomial(2, p_g)；按 --haploid 比例输出单倍体调用（'0' / '1'）
+  - 缺失率 --missing（'./.'，单倍体为 '.'）；已定相比例 --phased（'0|1' / '1|0' ...）
+  - 染色体数 --n-chroms，位点间距 ~ 1 + Poisson(--mean-gap)
+
+用法示例：
+  python simulate_gt.py --n-sites 1000000 --n-samples 147 --out-dir sim_1M --seed 1
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 基因型字符串查找表（编码见 _gt_codes）
+GT_STRINGS = np.array(['0/0', '0/1', '1/1', '0|0', '0|1', '1|0', '1|1', './.', '0', '1', '.'], dtype=object)
+MISSING_DIPLOID, HAPLOID_BASE, MISSING_HAPLOID = 7, 8, 10
+
+# 各群体占样本数的比例（按 147 份材料的设计：古树 64 = 自然 26 + 栽培 38，栽培品种 50，野生 33）
+DESIGN = {'ancients': 64, 'cult': 50, 'wild': 33}
+ANC_SUBGROUPS = {'anc_nat': 26, 'anc_cult': 38}
+LINEAGES = ('Min', 'Zhu', 'admix')
+BASES = np.array(list('ACGT'))
+
+def parse_args():
+    p = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('--n-sites', type=int, default=100000, help="位点数")
+    p.add_argument('--n-samples', type=int, default=147, help="样本数（按 古树:栽培:野生 = 64:50:33 分配）")
+    p.add_argument('--out-dir', default='sim_gt', help="输出目录")
+    p.add_argument('--gt-name', default='all.gt.tsv', help="GT 表文件名（.gz 结尾时 gzip 压缩）")
+    p.add_argument('--n-chroms', type=int, default=4, help="染色体数")
+    p.add_argument('--mean-gap', type=float, default=150.0, help="相邻位点的平均间距（bp）")
+    p.add_argument('--missing', type=float, default=0.05, help="缺失调用比例")
+    p.add_argument('--phased', type=float, default=0.2, help="已定相调用比例")
+    p.add_argument('--haploid', type=float, default=0.002, help="单倍体调用比例")
+    p.add_argument('--alpha', type=float, default=1.0, help="位点频率谱指数：P(k) ∝ k^-alpha（1 为中性谱）")
+    p.add_argument('--fst', type=float, default=0.05, help="群体间分化（Balding–Nichols F；0 表示不分化）")
+    p.add_argument('--block', type=int, default=50000, help="每次生成并写出的位点数（内存与之成正比）")
+    p.add_argument('--seed', type=int, default=1, help="随机种子")
+    return p.parse_args()
+
+def design_groups(n_samples, rng):
+    """样本名、打乱后的样本顺序与各群体名单（按 DESIGN 比例分配，至少各 1 份）。"""
+    total = sum(DESIGN.values())
+    sizes = {g: max(1, round(n_samples * k / total)) for g, k in DESIGN.items()}
+    sizes['wild'] = max(1, n_samples - sizes['ancients'] - sizes['cult'])
+    prefix = {'ancients': 'ANC', 'cult': 'CUL', 'wild': 'WLD'}
+    members = {g: [f"{prefix[g]}{i + 1:03d}" for i in range(n)] for g, n in sizes.items()}
+
+    anc = members['ancients']
+    n_nat = round(len(anc) * ANC_SUBGROUPS['anc_nat'] / DESIGN['ancients'])
+    members['anc_nat'], members['anc_cult'] = anc[:n_nat], anc[n_nat:]
+    lineage = {s: LINEAGES[i] for s, i in zip(anc, rng.choice(len(LINEAGES), len(anc), p=[0.6, 0.3, 0.1]))}
+
+    order = [s for g in DESIGN for s in members[g]]
+    order = [order[i] for i in rng.permutation(len(order))]
+    return order, members, lineage
+
+def site_frequencies(n_sites, n_chrom2, alpha, rng):
+    """按 P(k) ∝ k^-alpha 抽取祖先 ALT 频率 k / 2N。"""
+    k = np.arange(1, n_chrom2)
+    w = k ** -float(alpha)
+    return rng.choice(k, size=n_sites, p=w / w.sum()) / n_chrom2
+
+def group_frequencies(p, fst, rng):
+    """Balding–Nichols：以祖先频率 p 为均值、F 为分化程度的群体频率。"""
+    if fst <= 0:
+        return p
+    a = p * (1 - fst) / fst
+    b = (1 - p) * (1 - fst) / fst
+    return rng.beta(a, b)
+
+def _gt_codes(freqs, args, rng):
+    """逐格的基因型字符串编码 (n_sites, n_samples)；freqs 为每格所属群体的 ALT 频率。"""
+    shape = freqs.shape
+    haploid = rng.random(shape) < args.haploid
+    alt = rng.binomial(np.where(haploid, 1, 2), freqs)
+    phased = rng.random(shape) < args.phased
+    flip = rng.random(shape) < 0.5
+    # 未定相：0/0 0/1 1/1 -> 0 1 2；已定相：0|0 -> 3，0|1 / 1|0 -> 4 / 5，1|1 -> 6
+    codes = np.where(phased, np.choose(alt.clip(0, 2), [3, 4, 6]) + (phased & (alt == 1) & flip), alt)
+    codes = np.where(haploid, HAPLOID_BASE + alt, codes)
+    missing = rng.random(shape) < args.missing
+    codes = np.where(missing, np.where(haploid, MISSING_HAPLOID, MISSING_DIPLOID), codes)
+    return codes
+
+def simulate(args):
+    """按 args 生成全部文件，返回 GT 表路径。"""
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.out_dir, exist_ok=True)
+    order, members, lineage = design_groups(args.n_samples, rng)
+    n = len(order)
+
+    def write_list(name, ids):
+        with open(os.path.join(args.out_dir, name), 'w') as f:
+            f.write(''.join(f"{s}\n" for s in ids))
+    write_list('samples.order.txt', order)
+    write_list('ancients.list', members['ancients'])
+    write_list('cult.list', members['cult'])
+    write_list('wild.list', members['wild'])
+    write_list('anc_nat.list', members['anc_nat'])
+    write_list('anc_cult.list', members['anc_cult'])
+    for lin in LINEAGES:
+        write_list(f'anc_{lin.lower()}.list', [s for s in members['ancients'] if lineage[s] == lin])
+    with open(os.path.join(args.out_dir, 'groups.tsv'), 'w') as f:
+        for s in members['ancients']:
+            f.write(f"{s}\t{lineage[s]}\n")
+
+    # 每个样本所属的主群（频率矩阵的列）
+    group_names = list(DESIGN)
+    sample_group = np.array([next(i for i, g in enumerate(group_names) if s in set(members[g])) for s in order])
+
+    gt_path = os.path.join(args.out_dir, args.gt_name)
+    opener = gzip.open if gt_path.endswith('.gz') else open
+    chrom_of = np.minimum((np.arange(args.n_sites) * args.n_chroms) // max(1, args.n_sites), args.n_chroms - 1)
+    pos = np.zeros(args.n_chroms, dtype=np.int64)
+    with opener(gt_path, 'wt', newline='') as fh:
+        for s in range(0, args.n_sites, args.block):
+            e = min(s + args.block, args.n_sites)
+            m = e - s
+            p = site_frequencies(m, 2 * n, args.alpha, rng)
+            pg = np.column_stack([group_frequencies(p, args.fst, rng) for _ in group_names])
+            codes = _gt_codes(pg[:, sample_group], args, rng)
+
+            chrom = chrom_of[s:e]
+            gaps = 1 + rng.poisson(args.mean_gap, m)
+            site_pos = np.empty(m, dtype=np.int64)
+            for c in np.unique(chrom):
+                idx = np.flatnonzero(chrom == c)
+                site_pos[idx] = pos[c] + np.cumsum(gaps[idx])
+                pos[c] = site_pos[idx[-1]]
+            ref = rng.integers(0, 4, m)
+            alt = (ref + rng.integers(1, 4, m)) % 4
+
+            block = pd.DataFrame(GT_STRINGS[codes], columns=order)
+            block.insert(0, 'ALT', BASES[alt])
+            block.insert(0, 'REF', BASES[ref])
+            block.insert(0, 'POS', site_pos)
+            block.insert(0, 'CHROM', np.char.add('chr', (chrom + 1).astype(str)))
+            block.to_csv(fh, sep='\t', header=False, index=False)
+            sys.stderr.write(f"[INFO] Simulated {e}/{args.n_sites} sites\n")
+
+    with open(os.path.join(args.out_dir, 'sim_params.json'), 'w') as f:
+        json.dump({k: v for k, v in vars(args).items()}, f, indent=1)
+    return gt_path
+
+def main():
+    args = parse_args()
+    gt_path = simulate(args)
+    sys.stderr.write(f"[DONE] {args.n_sites} sites x {args.n_samples} samples -> {gt_path}\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+sweep.py
+
+03_ac_wac_irr.py 的参数扫描（--sweep-*）：一次扫描同时评估
+  epsilon × max-occ × irr-coverage × 频率分箱切点 的所有组合。
+
+AC/wAC 与 IRR 只通过少数几个逐位点量依赖这些参数：
+  w / bin 只取决于 (AC_full, AN_full)；IRR 还取决于 anc_count 与覆盖标志 in_cult / in_cultwild。
+因此扫描时不保存逐位点数据，只按“位点类别”累加：
+  - AC/wAC：每个 target×cover 在每个 (AC_full, AN_full) 类别中的等位数 n 与被覆盖数 n_cov
+  - IRR   ：每棵古树在每个 (AC_full, AN_full, anc_count, in_cult, in_cultwild) 类别中携带的稀有等位数
+类别数只有几百到几千，之后每个参数组合只是在这些小数组上做一次加权求和。
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from acwac import bin_labels, cover_defs, cover_pairs, target_defs
+from blockboot import BlockSums
+
+IRR_COVERAGES = ('cult', 'cultwild')
+
+def parse_bin_sets(values):
+    """'0.005,0.01,0.05' 形式的切点组（每组升序）。"""
+    out = []
+    for v in values:
+        cuts = tuple(float(x) for x in v.split(',') if x.strip())
+        if not cuts or list(cuts) != sorted(cuts) or len(set(cuts)) != len(cuts):
+            raise SystemExit(f"[ERROR] bin cut points must be strictly increasing: {v}")
+        out.append(cuts)
+    return out
+
+def cuts_name(cuts):
+    return ','.join(f"{c:g}" for c in cuts)
+
+class _ClassIndex:
+    """位点类别（若干数值列的组合）-> 类别编号，按首次出现的顺序。"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def ids(self, cols):
+        keys = pd.MultiIndex.from_arrays([np.asarray(c, dtype=np.float64) for c in cols])
+        codes, uniques = pd.factorize(keys)
+        lut = np.array([self.index.setdefault(k, len(self.index)) for k in uniques], dtype=np.int64)
+        return lut[codes]
+
+    def merge(self, other):
+        """并入另一个 _ClassIndex 的类别，返回 other 编号 -> 本实例编号的映射数组。"""
+        ks = sorted(other.index, key=other.index.get)
+        return np.array([self.index.setdefault(k, len(self.index)) for k in ks], dtype=np.int64)
+
+    def table(self):
+        ks = sorted(self.index, key=self.index.get)
+        return pd.DataFrame(ks, columns=self.names, dtype=np.float64) if ks else \
+            pd.DataFrame({c: np.zeros(0) for c in self.names})
+
+def _weights(ac, an, eps):
+    """与 add_site_columns() 相同的 fa_full 与 w。"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fa = np.where(an > 0, ac / an, np.nan)
+    return fa, -np.log10(np.clip(np.nan_to_num(fa, nan=0.0), eps, None))
+
+class SweepAccumulator:
+    """按位点类别累加 AC/wAC 与 IRR 的计数；evaluate() 对参数网格逐一求值。"""
+
+    def __init__(self, ancient_ids, max_occ_max):
+        self.ids = list(ancient_ids)
+        self.max_occ_max = max_occ_max
+        self.site_cls = _ClassIndex(['AC_full', 'AN_full'])
+        self.acwac = {}   # (target, cover) -> BlockSums((2,))：每个类别的 n / n_cov
+        self.irr_cls = _ClassIndex(['AC_full', 'AN_full', 'anc_count', 'in_cult', 'in_cultwild'])
+        self.irr = BlockSums((len(self.ids),))
+
+    def add_sites(self, df):
+        """df：带 add_site_columns() 各列的 allele_table（或其一个chunk）。"""
+        cls = self.site_cls.ids([df['AC_full'].to_numpy(), df['AN_full'].to_numpy()])
+        n_cls = len(self.site_cls)
+        S_defs = target_defs(df)
+        covers = cover_defs(df)
+        for target, cover_name in cover_pairs(S_defs, covers):
+            mS = S_defs[target].to_numpy()
+            cov = mS & covers[cover_name].to_numpy()
+            vals = np.column_stack([np.bincount(cls[mS], minlength=n_cls),
+                                    np.bincount(cls[cov], minlength=n_cls)])
+            self.acwac.setdefault((target, cover_name), BlockSums((2,))).add(n_cls, vals)
+
+    def add_irr(self, A, meta, site_mask):
+        """
+        A：(nrow, n_anc) 古树 ALT 计数；meta：逐行的 AC_full / AN_full / anc_count / in_cult / in_cultwild；
+        site_mask：已对齐的行。只保留 anc_count ≤ 最大 max-occ 的行（更常见的位点在任何参数下都不参与 IRR）。
+        """
+        anc = pd.to_numeric(meta['anc_count'], errors='coerce').fillna(0).to_numpy()
+        rows = np.flatnonzero(site_mask & (anc <= self.max_occ_max))
+        if len(rows) == 0:
+            return
+        cls = self.irr_cls.ids([meta[c].to_numpy()[rows] if c != 'anc_count' else anc[rows]
+                                for c in self.irr_cls.names])
+        # 按类别排序后分段求和：每个类别内各古树的携带数
+        order = np.argsort(cls, kind='stable')
+        cls_sorted = cls[order]
+        starts = np.flatnonzero(np.r_[True, cls_sorted[1:] != cls_sorted[:-1]])
+        carr = (A[rows[order]] > 0).astype(np.float64)
+        self.irr.add_rows(cls_sorted[starts], np.add.reduceat(carr, starts, axis=0))
+
+    def merge(self, other):
+        """并入另一个 SweepAccumulator（同一组古树；--chrom-workers 时按任务顺序合并）。"""
+        lut = self.site_cls.merge(other.site_cls)
+        for key, bs in other.acwac.items():
+            self.acwac.setdefault(key, BlockSums((2,))).add_rows(lut, bs.get(len(lut)))
+        lut = self.irr_cls.merge(other.irr_cls)
+        self.irr.add_rows(lut, other.irr.get(len(lut)))
+
+    def evaluate(self, epsilons, max_occs, coverages, bin_sets):
+        """参数网格上的全部结果（长表：参数列 + kind/target/cover/bin/id + stat/value）。"""
+        sites = self.site_cls.table()
+        s_ac, s_an = sites['AC_full'].to_numpy(), sites['AN_full'].to_numpy()
+        n_site = len(sites)
+        irr_cls = self.irr_cls.table()
+        i_ac, i_an = irr_cls['AC_full'].to_numpy(), irr_cls['AN_full'].to_numpy()
+        i_anc = irr_cls['anc_count'].to_numpy()
+        i_cov = {'cult': irr_cls['in_cult'].to_numpy(), 'cultwild': irr_cls['in_cultwild'].to_numpy()}
+        counts = self.irr.get(len(irr_cls))   # (n_class, n_anc)
+
+        rows = []
+        for k, (eps, max_occ, coverage, cuts) in enumerate(
+                itertools.product(epsilons, max_occs, coverages, bin_sets), 1):
+            key = {'param_set': k, 'epsilon': eps, 'max_occ': max_occ,
+                   'irr_coverage': coverage, 'bin_cuts': cuts_name(cuts)}
+
+            # ---- AC / wAC ----
+            fa, w = _weights(s_ac, s_an, eps)
+            labels = bin_labels(s_ac, fa, cuts)
+            for (target, cover_name), bs in self.acwac.items():
+                n, n_cov = bs.get(n_site).T
+                if n.sum() == 0:
+                    continue
+                # overall（bin 为空）+ 出现过的各分箱（按标签排序，同 ac_wac_summary.csv）
+                stats = [(None, np.ones(n_site, dtype=bool))] + [(b, labels == b) for b in sorted(set(labels[n > 0]))]
+                for b, m in stats:
+                    tot, tot_cov = n[m].sum(), n_cov[m].sum()
+                    w_tot, w_cov = (n[m] * w[m]).sum(), (n_cov[m] * w[m]).sum()
+                    base = dict(key, kind='acwac', target=target, cover=cover_name, bin=b)
+                    rows.append(dict(base, stat='n', value=float(tot)))
+                    rows.append(dict(base, stat='AC', value=tot_cov / tot))
+                    rows.append(dict(base, stat='wAC', value=w_cov / w_tot if w_tot > 0 else np.nan))
+
+            # ---- IRR ----
+            _, wi = _weights(i_ac, i_an, eps)
+            m = i_anc <= max_occ
+            num = counts[m].T @ (wi[m] * (1.0 - i_cov[coverage][m]))
+            den = counts[m].T @ wi[m]
+            for tid, a, b in zip(self.ids, num.tolist(), den.tolist()):
+                base = dict(key, kind='irr', id=tid)
+                rows.append(dict(base, stat='IRR', value=a))
+                rows.append(dict(base, stat='IRR_norm01', value=(a / b) if b > 0 else np.nan))
+
+        cols = ['param_set', 'epsilon', 'max_occ', 'irr_coverage', 'bin_cuts',
+                'kind', 'target', 'cover', 'bin', 'id', 'stat', 'value']
+        return pd.DataFrame(rows, columns=cols)
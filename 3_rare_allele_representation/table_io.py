@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+table_io.py
+
+“等位元素表”的读写（02_allele_count.py 写出；03_ac_wac_irr.py 读入）：
+  - tsv    ：制表符分隔文本（默认；与旧版逐字节一致，作为导出 / 交换格式）
+  - parquet：列式二进制（需要 pyarrow）；每个处理chunk写成一个 row group，
+             计数列存为整数（*_count / AC_* / AN_* 为 int32，in_* 为 int8），频率 fa_* 为 float32
+格式由 --out-format 指定，默认（auto）按扩展名判断：.parquet / .pq 为 parquet，其余为 tsv。
+tsv 可压缩：写出按扩展名（.tsv.gz / .tsv.bgz 为 BGZF，.tsv.zst 为 zstd），读入按文件头自动识别；
+压缩 / 解压在后台线程中进行（见 compressed_io.py），分段文件不压缩。
+读取时可只取需要的列（parquet 只解码这些列；tsv 用 usecols 只解析这些列）。
+按染色体并行（--chrom-workers）时各任务先写分段文件，再由 concat_allele_tables() 按任务顺序合并。
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from bgzf import is_gzip
+from compressed_io import is_zstd, open_binary, open_text_writer
+from perf_metrics import count_bytes, timed
+
+TABLE_FORMATS = ('auto', 'tsv', 'parquet')
+PARQUET_EXTS = ('.parquet', '.pq')
+
+# 位点键列（03 按行号对齐时抽样校验用）
+KEY_COLS = ['CHR', 'POS', 'REF', 'ALT']
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("[ERROR] the parquet allele-table format needs pyarrow (pip install pyarrow)")
+    return pa, pq
+
+def table_format(path, fmt='auto'):
+    """按 fmt（或 auto 时按扩展名）确定表格格式：'tsv' / 'parquet'。"""
+    if fmt and fmt != 'auto':
+        return fmt
+    return 'parquet' if str(path).lower().endswith(PARQUET_EXTS) else 'tsv'
+
+def _arrow_type(pa, name):
+    if name == 'POS':
+        return pa.int64()
+    # 前缀优先于后缀：标签本身可能以 in_ 开头或以 _count 结尾
+    if name.startswith('fa_'):
+        return pa.float32()
+    if name.startswith(('AC_', 'AN_')) or name.endswith('_count'):
+        return pa.int32()
+    if name.startswith('in_'):
+        return pa.int8()
+    return pa.string()
+
+def _to_arrow(df):
+    """把一个chunk的 DataFrame 转为带固定类型的 Arrow 表（计数列转整数，频率 float32）。"""
+    pa, _ = _pyarrow()
+    arrays, fields = [], []
+    for name in df.columns:
+        t = _arrow_type(pa, name)
+        v = df[name].to_numpy()
+        if pa.types.is_string(t):
+            arr = pa.array(v.astype(str), type=t)
+        elif pa.types.is_floating(t):
+            arr = pa.array(v.astype(np.float32), type=t)
+        else:
+            arr = pa.array(v.astype(t.to_pandas_dtype()), type=t)
+        arrays.append(arr)
+        fields.append(pa.field(name, t))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+def encode_chunk(df, fmt, header):
+    """
+    把一个chunk编码为可直接写出的对象（--workers 时在子进程中执行）：
+    tsv -> 文本（header 为 True 时带表头）；parquet -> Arrow 表。
+    """
+    with timed('encode'):
+        if fmt == 'parquet':
+            return _to_arrow(df)
+        return df.to_csv(sep='\t', index=False, header=header)
+
+class AlleleTableWriter:
+    """
+    逐chunk写出等位元素表；parquet 时每个chunk一个 row group。打开时删除同名旧文件。
+    resume=(字节数, 已写chunk数)：断点续跑（仅 tsv），把已有文件截断到该字节数后继续追加。
+    threads：压缩 tsv 输出时的压缩线程数。
+    """
+
+    def __init__(self, path, fmt='auto', resume=None, threads=4):
+        self.path = path
+        self.fmt = table_format(path, fmt)
+        self.threads = threads
+        self._fh = None
+        self._pq = None
+        self.n_chunks = 0
+        if resume is not None:
+            if self.fmt != 'tsv':
+                raise SystemExit("[ERROR] resuming is only supported for TSV allele-table output")
+            size, self.n_chunks = resume
+            self._fh = open_text_writer(path, threads, resume=size)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        self.write_encoded(encode_chunk(df, self.fmt, header=(self.n_chunks == 0)))
+
+    def write_encoded(self, payload):
+        with timed('write'):
+            if self.fmt == 'parquet':
+                if self._pq is None:
+                    _, pq = _pyarrow()
+                    self._pq = pq.ParquetWriter(self.path, payload.schema)
+                if payload.num_rows:
+                    self._pq.write_table(payload, row_group_size=payload.num_rows)
+                count_bytes('bytes_out', payload.nbytes)   # Arrow 内存大小（压缩前）
+            else:
+                if self._fh is None:
+                    self._fh = open_text_writer(self.path, self.threads)
+                self._fh.write(payload)
+                count_bytes('bytes_out', len(payload))
+        self.n_chunks += 1
+
+    def write_file(self, fh):
+        """把已编码的 tsv 文本（打开的文件对象）原样追加到输出。"""
+        if self._fh is None:
+            self._fh = open_text_writer(self.path, self.threads)
+        shutil.copyfileobj(fh, self._fh)
+        self.n_chunks += 1
+
+    def flush(self):
+        """刷新到磁盘并返回 tsv 输出当前的字节数（压缩时为压缩后的字节数，截断到此仍是完整文件；parquet 返回 None）。"""
+        if self.fmt != 'tsv':
+            return None
+        if self._fh is None:
+            return 0
+        return self._fh.flush()
+
+    def close(self):
+        if self._pq is not None:
+            self._pq.close()
+        if self._fh is not None:
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def part_path(path, i):
+    """第 i 个任务的分段文件名。"""
+    return f"{path}.part{i:05d}"
+
+def concat_allele_tables(parts, path, fmt='auto', threads=4):
+    """
+    按顺序合并分段写出的等位元素表并删除分段文件；不存在的分段（该任务没有位点）跳过。
+    tsv 只保留第一个分段的表头，与一次顺序写出逐字节一致（压缩输出在合并时压缩）；parquet 逐 row group 复制。
+    """
+    fmt = table_format(path, fmt)
+    with AlleleTableWriter(path, fmt, threads=threads) as writer:
+        for part in parts:
+            if not os.path.exists(part):
+                continue
+            if fmt == 'parquet':
+                _, pq = _pyarrow()
+                with pq.ParquetFile(part) as pf:
+                    for i in range(pf.num_row_groups):
+                        writer.write_encoded(pf.read_row_group(i))
+            else:
+                with open(part, newline='') as fh:
+                    if writer.n_chunks:
+                        fh.readline()
+                    writer.write_file(fh)
+            os.remove(part)
+
+def _tsv_source(path, threads):
+    """pd.read_csv 的输入：压缩的 tsv 在后台线程中解压，未压缩的直接交给 pandas。"""
+    if is_gzip(path) or is_zstd(path):
+        return open_binary(path, threads)
+    return path
+
+def table_columns(path, fmt='auto'):
+    """表中的列名（parquet 读 schema；tsv 只读表头行）。"""
+    if table_format(path, fmt) == 'parquet':
+        _, pq = _pyarrow()
+        return list(pq.read_schema(path).names)
+    with open_binary(path, threads=1) as f:
+        return f.readline().decode().rstrip('\r\n').split('\t')
+
+def _keys_as_str(df):
+    for c in KEY_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype(str).astype(object)
+    return df
+
+_KEY_DTYPES = {'CHR':str,'POS':str,'REF':str,'ALT':str}
+
+def read_allele_table(path, columns=None, fmt='auto', threads=4):
+    """
+    读入等位元素表（只取 columns 中的列，保持文件中的列顺序；None 表示全部列）。
+    键列 CHR/POS/REF/ALT 一律作为字符串返回，与旧版 dtype=str 读入的 tsv 一致。
+    """
+    if table_format(path, fmt) == 'parquet':
+        _, pq = _pyarrow()
+        return _keys_as_str(pq.read_table(path, columns=columns).to_pandas())
+    src = _tsv_source(path, threads)
+    try:
+        return pd.read_csv(src, sep='\t', usecols=columns, dtype=_KEY_DTYPES)
+    finally:
+        if src is not path:
+            src.close()
+
+def iter_allele_table(path, columns=None, chunksize=200000, fmt='auto', threads=4):
+    """逐块读入等位元素表（列与键列类型同 read_allele_table）；内存只与 chunksize 有关，与位点数无关。"""
+    if table_format(path, fmt) == 'parquet':
+        _, pq = _pyarrow()
+        with pq.ParquetFile(path) as pf:
+            for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+                yield _keys_as_str(batch.to_pandas())
+        return
+    src = _tsv_source(path, threads)
+    try:
+        yield from pd.read_csv(src, sep='\t', usecols=columns, dtype=_KEY_DTYPES, chunksize=chunksize)
+    finally:
+        if src is not path:
+            src.close()
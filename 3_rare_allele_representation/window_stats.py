@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+window_stats.py
+
+04_window_stats.py 的窗口统计：由等位元素表的 AC_{g} / AN_{g} 逐块累加
+  π（各群体）、dxy 与 Hudson Fst（各群体对），输出与 pixy 相同的三张表。
+
+逐位点量（k = AC，n = AN；与 pixy 的计数口径一致）：
+  π   ：差异数 k(n-k)，比较数 n(n-1)/2
+  dxy ：差异数 k1(n2-k2) + k2(n1-k1)，比较数 n1·n2
+  Fst ：Hudson（scikit-allel / pixy）：between = dxy 差异数 / (n1·n2)，
+        within = [k1(n1-k1)/C(n1,2) + k2(n2-k2)/C(n2,2)] / 2，num = between - within，den = between；
+        窗口 Fst = Σnum / Σden（只计两群体合并后有多态、且两群体各至少 2 个拷贝的位点，即 no_snps）
+窗口值 = 窗口内差异数之和 / 比较数之和；缺失比较数 count_missing = 窗口行数 × 满比较数 - 比较数，
+满比较数由各群体在整个扫描中观察到的最大 AN 给出（等位元素表不记录群体大小）。
+
+窗口：固定长度（--window-size，1-based 的 [1, size]、[size+1, 2·size] ……，输出到各染色体最后一个有位点的窗口）
+或 BED 给出的任意窗口（可不等长、可重叠）。每个chunk内按染色体做逐列累积和，窗口之和 = cs[hi] - cs[lo]
+（hi / lo 由 searchsorted 得到），与chunk如何切分无关。
+
+不变位点：等位元素表中含 AC=0（或 AC=AN）的行时（01 / 02 处理 all-sites 基因型表），它们只增加比较数，
+π / dxy 与 pixy 在 all-sites VCF 上的结果一致；表中只有变异位点时，分母只含变异位点。
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from perf_metrics import timed
+
+PI_COLUMNS = ['pop', 'chromosome', 'window_pos_1', 'window_pos_2', 'avg_pi', 'no_sites',
+              'count_diffs', 'count_comparisons', 'count_missing']
+DXY_COLUMNS = ['pop1', 'pop2', 'chromosome', 'window_pos_1', 'window_pos_2', 'avg_dxy', 'no_sites',
+               'count_diffs', 'count_comparisons', 'count_missing']
+FST_COLUMNS = ['pop1', 'pop2', 'chromosome', 'window_pos_1', 'window_pos_2', 'avg_hudson_fst', 'no_snps']
+
+# 每个群体 / 群体对的逐位点量（列顺序）
+_POP_STATS = ('diffs', 'comps', 'sites')
+_PAIR_STATS = ('diffs', 'comps', 'sites', 'fst_num', 'fst_den', 'snps')
+
+def read_bed_windows(path):
+    """BED（chrom, start, end；0-based 半开）-> {chrom: (1-based 起点数组, 终点数组)}，保持文件中的顺序。"""
+    bed = pd.read_csv(path, sep='\t', header=None, usecols=[0, 1, 2], comment='#',
+                      dtype={0: str, 1: np.int64, 2: np.int64})
+    bed = bed[~bed[0].str.startswith(('track', 'browser'))]
+    if (bed[2] <= bed[1]).any():
+        raise SystemExit(f"[ERROR] BED windows must have end > start: {path}")
+    out = {}
+    for chrom, sub in bed.groupby(0, sort=False):
+        out[chrom] = (sub[1].to_numpy() + 1, sub[2].to_numpy())
+    return out
+
+class WindowAccumulator:
+    """
+    按窗口累加 π / dxy / Fst 的计数。
+    pops 为群体标签（等位元素表中有 AC_{g} / AN_{g}）；window_size 与 bed（read_bed_windows 的结果）二选一。
+    """
+
+    def __init__(self, pops, window_size=None, bed=None):
+        if (window_size is None) == (bed is None):
+            raise ValueError("give exactly one of window_size / bed")
+        self.pops = list(pops)
+        self.pairs = list(itertools.combinations(self.pops, 2))
+        self.window_size = window_size
+        self.bed = bed
+        self.n_stats = 1 + len(_POP_STATS) * len(self.pops) + len(_PAIR_STATS) * len(self.pairs)
+        self.sums = {}                                        # chrom -> (窗口数, n_stats)
+        self.max_an = np.zeros(len(self.pops))
+
+    def columns(self):
+        """读入等位元素表时需要的列。"""
+        return ['CHR', 'POS'] + [f"{k}_{g}" for g in self.pops for k in ('AC', 'AN')]
+
+    def _site_stats(self, df):
+        """逐位点量矩阵 (n_sites, n_stats)：第 0 列为行数，其后依次为各群体、各群体对。"""
+        ac = np.column_stack([df[f"AC_{g}"].to_numpy(np.float64) for g in self.pops])
+        an = np.column_stack([df[f"AN_{g}"].to_numpy(np.float64) for g in self.pops])
+        ac, an = np.nan_to_num(ac), np.nan_to_num(an)
+        self.max_an = np.maximum(self.max_an, an.max(axis=0, initial=0))
+        ref = an - ac
+        comps = an * (an - 1) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mpd = np.where(an >= 2, ac * ref / comps, np.nan)
+
+        cols = [np.ones(len(df))]
+        for j in range(len(self.pops)):
+            cols += [ac[:, j] * ref[:, j], comps[:, j], (an[:, j] >= 2).astype(np.float64)]
+        for a, b in itertools.combinations(range(len(self.pops)), 2):
+            diffs = ac[:, a] * ref[:, b] + ac[:, b] * ref[:, a]
+            n12 = an[:, a] * an[:, b]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                between = diffs / n12
+            tot, alt = an[:, a] + an[:, b], ac[:, a] + ac[:, b]
+            snp = (an[:, a] >= 2) & (an[:, b] >= 2) & (alt > 0) & (alt < tot)
+            num = np.where(snp, between - (mpd[:, a] + mpd[:, b]) / 2, 0.0)
+            den = np.where(snp, between, 0.0)
+            cols += [diffs, n12, (n12 > 0).astype(np.float64), num, den, snp.astype(np.float64)]
+        return np.column_stack(cols)
+
+    def _bounds(self, chrom, pos):
+        """与 pos（已排序）范围相交的窗口：(窗口编号, 起点, 终点)。"""
+        if self.bed is not None:
+            if chrom not in self.bed:
+                return None
+            starts, ends = self.bed[chrom]
+            idx = np.flatnonzero((ends >= pos[0]) & (starts <= pos[-1]))
+            return idx, starts[idx], ends[idx]
+        size = self.window_size
+        idx = np.arange((pos[0] - 1) // size, (pos[-1] - 1) // size + 1)
+        return idx, idx * size + 1, (idx + 1) * size
+
+    def _grow(self, chrom, n):
+        cur = self.sums.get(chrom)
+        if cur is None:
+            n_win = len(self.bed[chrom][0]) if self.bed is not None else n
+            cur = self.sums[chrom] = np.zeros((n_win, self.n_stats))
+        elif len(cur) < n:
+            cur = self.sums[chrom] = np.vstack([cur, np.zeros((n - len(cur), self.n_stats))])
+        return cur
+
+    def add(self, df):
+        """并入一个chunk（等位元素表的行）。"""
+        if not len(df):
+            return
+        with timed('window_sites'):
+            S = self._site_stats(df)
+            chrom = df['CHR'].to_numpy()
+            pos = pd.to_numeric(df['POS']).to_numpy(np.int64)
+            # 同一染色体的连续行段（等位元素表按基因型表的顺序，染色体连续、位置递增）
+            brk = np.flatnonzero(chrom[1:] != chrom[:-1]) + 1
+        with timed('window_sums'):
+            for s, e in zip(np.r_[0, brk], np.r_[brk, len(df)]):
+                p, seg = pos[s:e], S[s:e]
+                if np.any(p[1:] < p[:-1]):
+                    order = np.argsort(p, kind='stable')
+                    p, seg = p[order], seg[order]
+                b = self._bounds(chrom[s], p)
+                if b is None or not len(b[0]):
+                    continue
+                idx, starts, ends = b
+                cs = np.vstack([np.zeros((1, self.n_stats)), np.cumsum(seg, axis=0)])
+                lo = np.searchsorted(p, starts, side='left')
+                hi = np.searchsorted(p, ends, side='right')
+                acc = self._grow(chrom[s], idx[-1] + 1)
+                acc[idx] += cs[hi] - cs[lo]
+
+    def merge(self, other):
+        self.max_an = np.maximum(self.max_an, other.max_an)
+        for chrom, arr in other.sums.items():
+            acc = self._grow(chrom, len(arr))
+            acc[:len(arr)] += arr
+
+    # ----------------- 结果 -----------------
+    def _windows(self):
+        """(染色体, window_pos_1, window_pos_2, 累加和) 的拼接数组。"""
+        chroms, p1, p2, sums = [], [], [], []
+        # BED 窗口全部输出（没有位点的染色体也输出 NA 行）；固定窗口只输出有位点的染色体
+        for chrom in (self.bed if self.bed is not None else self.sums):
+            arr = self.sums.get(chrom)
+            if self.bed is not None:
+                s, e = self.bed[chrom]
+                if arr is None:
+                    arr = np.zeros((len(s), self.n_stats))
+            else:
+                s = np.arange(len(arr)) * self.window_size + 1
+                e = s + self.window_size - 1
+            chroms.append(np.full(len(arr), chrom, dtype=object))
+            p1.append(s)
+            p2.append(e)
+            sums.append(arr)
+        if not sums:
+            return np.zeros(0, dtype=object), np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros((0, self.n_stats))
+        return np.concatenate(chroms), np.concatenate(p1), np.concatenate(p2), np.vstack(sums)
+
+    def tables(self):
+        """pixy 布局的 (pi, dxy, fst) 三张 DataFrame（无数据的窗口为 NA）。"""
+        chrom, p1, p2, W = self._windows()
+        rows = W[:, 0]
+        pi, dxy, fst = [], [], []
+        col = 1
+        full = self.max_an * (self.max_an - 1) / 2
+        for j, g in enumerate(self.pops):
+            d, c, n = W[:, col], W[:, col + 1], W[:, col + 2]
+            col += len(_POP_STATS)
+            pi.append(pd.DataFrame({
+                'pop': g, 'chromosome': chrom, 'window_pos_1': p1, 'window_pos_2': p2,
+                'avg_pi': _ratio(d, c), 'no_sites': n.astype(np.int64), 'count_diffs': _count(d),
+                'count_comparisons': _count(c), 'count_missing': _count(rows * full[j] - c)}))
+        for a, b in itertools.combinations(range(len(self.pops)), 2):
+            d, c, n, num, den, snps = (W[:, col + i] for i in range(len(_PAIR_STATS)))
+            col += len(_PAIR_STATS)
+            ga, gb = self.pops[a], self.pops[b]
+            dxy.append(pd.DataFrame({
+                'pop1': ga, 'pop2': gb, 'chromosome': chrom, 'window_pos_1': p1, 'window_pos_2': p2,
+                'avg_dxy': _ratio(d, c), 'no_sites': n.astype(np.int64), 'count_diffs': _count(d),
+                'count_comparisons': _count(c),
+                'count_missing': _count(rows * self.max_an[a] * self.max_an[b] - c)}))
+            fst.append(pd.DataFrame({
+                'pop1': ga, 'pop2': gb, 'chromosome': chrom, 'window_pos_1': p1, 'window_pos_2': p2,
+                'avg_hudson_fst': _ratio(num, den), 'no_snps': snps.astype(np.int64)}))
+
+        def cat(parts, columns):
+            return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+        return cat(pi, PI_COLUMNS), cat(dxy, DXY_COLUMNS), cat(fst, FST_COLUMNS)
+
+def _ratio(num, den):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / den, np.nan)
+
+def _count(x):
+    """计数列：整数计数保持整数（AN 为整数时总是如此），否则保留小数。"""
+    r = np.rint(x)
+    return r.astype(np.int64) if np.allclose(r, x) else x
+
+def write_pixy_tables(prefix, acc, stats=('pi', 'dxy', 'fst')):
+    """写出 {prefix}_pi.txt / _dxy.txt / _fst.txt（制表符分隔，缺失为 NA，与 pixy 相同），返回写出的路径。"""
+    pi, dxy, fst = acc.tables()
+    paths = []
+    for name, df in (('pi', pi), ('dxy', dxy), ('fst', fst)):
+        if name not in stats or (name != 'pi' and not acc.pairs):
+            continue
+        path = f"{prefix}_{name}.txt"
+        df.to_csv(path, sep='\t', index=False, na_rep='NA')
+        paths.append(path)
+    return paths